@@ -24,38 +24,152 @@ All these capacities depends on the grid investments.
 import numpy as np
 
 """
-The function below calculates the value of the control variable (u(t)) based on the measured 
-value and setpoint value. The function also accepts parameters of the controller.
+The bank below holds N independent PID controllers (e.g. per loop, per scenario, per technology), each with its own gains,
+setpoint and state (integral, previous error and time), advanced together in one vectorized step.
+For each controller, the control variable u(t) (grid investments) is computed from the measured value and the setpoint.
+The step size is the model time step (1/32 year in MEDEAS, but coarser steps are allowed): the integral term is integrated
+with the current error (backward Euler), and the derivative term is low-pass filtered with the time constant Tf [year],
+discretized exactly for a constant derivative of the error over the step, so that it stays bounded and consistent whatever
+the step (Tf=0: raw backward difference).
 """
 
-def PID(Kp, Ki, Kd, time, time_prev, setpoint, measurement):
-    global I, e_prev
-    if time == 1995:
-        I = 0
-        e_prev = 0
-
-    # Value of offset - when the error is equal zero. Set to 1%.
-    # It means that the controller try to converge the targets to 1%.
-
-    # offset = 0.01
-    
-    # Error e(t)
-    e = abs(setpoint - measurement) # Ouput u(t) should be > 0, thus using abs().
-    
-    # P-I-D
-    P = Kp*e
-    I = I + Ki*e*(time - time_prev)
-    D = Kd*(e - e_prev)/(time - time_prev)
-
-    e_prev = e
-    # calculate control variable - u(t): grid investments
-    # u = offset + P + I + D
-    u = P + I + D
-
-    # Since this problem is asymmetric (investments can not be negative), 
-    # positive constraints is implemented. 
-    if u <= 0:
-        #print("PID control is negative, investments set to 0.")
-        return 0
-    else:
-        return u
\ No newline at end of file
+# Time constant [year] of the derivative filter recommended at coarse time steps, of the order of the coarsest supported one
+# (1 year). The feedback mechanism defaults to Tf=0, the raw backward difference of the thesis at 1/32 year steps.
+DERIVATIVE_TIME_CONSTANT = 1.0
+# Delay [year] of the measured targets of the feedback mechanism (investments.py & closed_loop.py), one time step of MEDEAS.
+MEASUREMENT_DELAY = 1/32
+
+def delayed_measurement(current, delayed, time_step, delay=MEASUREMENT_DELAY, initial=False):
+    """
+    Target measured with a fixed delay [year], from its current value and its value delayed of one time step, linearly
+    interpolated in between. At time_step=delay, it is the delayed value, as in the thesis (1/32 year steps); at coarser
+    steps, the measurement keeps the same lag instead of one of a full time step.
+    At the initial time (initial=True), the measurement is the initial value of the delayed target, whatever the step.
+    """
+    lag = 1 if initial else min(delay / time_step, 1)
+    return lag*delayed + (1 - lag)*current
+
+class PIDBank:
+    """
+    N independent PID controllers, named by names (or numbered if names is an int). Gains, setpoints and derivative filter
+    time constants Tf are scalars or one per controller.
+    The controllers are selected by name, by index or by a list of them (all by default).
+    """
+
+    __slots__ = ("names", "index", "Kp", "Ki", "Kd", "Tf", "setpoint", "integral", "derivative", "e_prev", "time_prev", "output")
+
+    def __init__(self, names, Kp=0.0, Ki=0.0, Kd=0.0, setpoint=0.0, Tf=0.0):
+        self.names = tuple(range(names)) if isinstance(names, int) else tuple(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        n = len(self.names)
+        self.Kp = np.zeros(n)
+        self.Ki = np.zeros(n)
+        self.Kd = np.zeros(n)
+        self.Tf = np.zeros(n)
+        self.setpoint = np.full(n, setpoint, dtype=np.float64)
+        self.set_gains(Kp, Ki, Kd, Tf)
+        self.integral = np.zeros(n)
+        self.derivative = np.zeros(n)
+        self.e_prev = np.zeros(n)
+        self.time_prev = np.full(n, np.nan)
+        self.output = np.zeros(n)
+
+    def __len__(self):
+        return len(self.names)
+
+    def select(self, controllers=None):
+        """
+        Indices of the selected controllers: None (all), a name, an index, or a list of names / indices.
+        """
+        if controllers is None:
+            return slice(None)
+        if isinstance(controllers, (list, tuple, np.ndarray)) and not (isinstance(controllers, tuple) and controllers in self.index):
+            return np.array([self.index.get(c, c) for c in controllers], dtype=np.intp)
+        return self.index.get(controllers, controllers)
+
+    def set_gains(self, Kp=None, Ki=None, Kd=None, Tf=None, controllers=None):
+        i = self.select(controllers)
+        if Kp is not None:
+            self.Kp[i] = Kp
+        if Ki is not None:
+            self.Ki[i] = Ki
+        if Kd is not None:
+            self.Kd[i] = Kd
+        if Tf is not None:
+            self.Tf[i] = Tf
+
+    def reset(self, controllers=None):
+        """
+        Reset the state of the selected controllers (e.g. at the initial time of a run).
+        """
+        i = self.select(controllers)
+        self.integral[i] = 0
+        self.derivative[i] = 0
+        self.e_prev[i] = 0
+        self.time_prev[i] = np.nan
+        self.output[i] = 0
+
+    def step(self, time, measurement, controllers=None, time_step=None):
+        """
+        Advance the selected controllers to time with their measurements, returns their control variables u(t) >= 0.
+        The step size is time_step (e.g. time_step() of the model), or the time elapsed since the previous step if None.
+        The first step after a reset has no integral nor derivative term (the former PID() integrated its first step over
+        dt = time - 0, from year 0). Controllers already advanced to this time keep their state and return the same output.
+        """
+        i = self.select(controllers)
+        e = np.abs(self.setpoint[i] - measurement) # Ouput u(t) should be > 0, thus using abs().
+        elapsed = time - self.time_prev[i]
+        first = np.isnan(elapsed)
+        new = first | (elapsed != 0)
+        dt = np.where(new & ~first, elapsed if time_step is None else time_step, 1.0)
+
+        # P-I-D
+        P = self.Kp[i]*e
+        I = np.where(first, self.integral[i], self.integral[i] + self.Ki[i]*e*dt)
+        # Filtered derivative, Tf*dD/dt + D = Kd*de/dt, exact over the step for a constant de/dt.
+        decay = np.exp(-dt / np.maximum(self.Tf[i], 1e-300))
+        D = np.where(first, 0, decay*self.derivative[i] + (1 - decay)*self.Kd[i]*(e - self.e_prev[i])/dt)
+        # Since this problem is asymmetric (investments can not be negative), positive constraints is implemented.
+        u = np.maximum(P + I + D, 0)
+
+        self.integral[i] = np.where(new, I, self.integral[i])
+        self.derivative[i] = np.where(new, D, self.derivative[i])
+        self.e_prev[i] = np.where(new, e, self.e_prev[i])
+        self.time_prev[i] = time
+        self.output[i] = np.where(new, u, self.output[i])
+        output = self.output[i]
+        return float(output) if np.ndim(output) == 0 else output
+
+
+if __name__ == "__main__":
+    # Check: one controller of the bank against the former scalar PID() (module globals), and timing of a vectorized step.
+    import time as _time
+
+    def scalar_pid(Kp, Ki, Kd, time, time_prev, setpoint, measurement, state):
+        e = abs(setpoint - measurement)
+        state["I"] = state["I"] + Ki*e*(time - time_prev)
+        u = Kp*e + state["I"] + Kd*(e - state["e_prev"])/(time - time_prev)
+        state["e_prev"] = e
+        return max(u, 0)
+
+    rng = np.random.default_rng(0)
+    times = 1995 + np.arange(1, 1761)/32
+    measurements = rng.uniform(0, 0.05, size=(times.shape[0], 2))
+    bank = PIDBank(("load_shedding", "curtailment"), Kp=(0.5, 1.0), Ki=(0.1, 0.2), Kd=(0.01, 0.0))
+    bank.step(1995.0, (0, 0)) # first step of a run, null measurements (delayed targets initialized at 0)
+    states = [{"I": 0, "e_prev": 0}, {"I": 0, "e_prev": 0}]
+    max_error = 0.0
+    for t, measurement in zip(times, measurements):
+        outputs = bank.step(t, measurement)
+        assert bank.step(t, measurement[0], "load_shedding") == outputs[0] # repeated call, same output and state
+        expected = [scalar_pid(bank.Kp[k], bank.Ki[k], bank.Kd[k], t, t - 1/32, 0, measurement[k], states[k]) for k in range(2)]
+        max_error = max(max_error, np.max(np.abs(outputs - expected)))
+    print(f"Max abs difference with the scalar PID over {times.shape[0]} steps = {max_error:.1e}")
+
+    n = 100000
+    bank = PIDBank(n, Kp=rng.uniform(0, 1, n), Ki=rng.uniform(0, 1, n), Kd=rng.uniform(0, 1, n))
+    bank.step(1995.0, np.zeros(n))
+    start = _time.perf_counter()
+    for t in times[:100]:
+        bank.step(t, rng.uniform(0, 0.05, n))
+    print(f"{n} controllers: {1e3*(_time.perf_counter() - start)/100:.2f} ms per step")
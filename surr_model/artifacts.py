@@ -0,0 +1,230 @@
+"""
+Surrogate model artifacts implementation within MEDEAS.
+
+This file defines the lazy registry of the surrogate models. A model is only loaded the first time it is used.
+The pickled sklearn models (and their scalers) are converted once into flat artifacts: one directory per model, with
+a meta.json file and one .npy file per array. These are memory-mapped when loaded, so that many MEDEAS processes
+started in parallel share the same pages instead of each unpickling its own copy of the models.
+"""
+
+import json
+import os
+import numpy as np
+
+from .inference import FusedMLP, FlatForest, sklearn_predict, mlp_directory, precision_error, training_features, FLOAT32_MAX_ERROR
+from .tabulated import SurrogateTable, error_report, TABLE_MAX_ERROR, MAX_TABLE_POINTS
+from .ood_index import TrainingDomainIndex
+
+flat_directory = os.path.join(mlp_directory, "flat")
+
+ARTIFACT_KINDS = {"mlp": FusedMLP, "rf": FlatForest, "table": SurrogateTable, "index": TrainingDomainIndex}
+
+# Surrogate models of targets.py: name -> (kind, model, scaler_X, scaler_y), files of surr_model/mlp.
+SURROGATE_MODELS = {
+    "mlp_curtailment": ("mlp", "mlp_curtailment.pkl", "mlp_scaler_X_curt.pkl", "mlp_scaler_y_curt.pkl"),
+    "mlp_loadshedding": ("mlp", "mlp_loadshedding_oversamp.pkl", "mlp_scaler_X_ls.pkl", "mlp_scaler_y_ls.pkl"),
+    "rf_curtailment": ("rf", "rf_curtailment.pkl", "mlp_scaler_X_curt.pkl", "mlp_scaler_y_curt.pkl"),
+    "rf_loadshedding": ("rf", "rf_loadshedding.pkl", "mlp_scaler_X_ls.pkl", "mlp_scaler_y_ls.pkl"),
+}
+
+
+def save_artifact(evaluator, directory):
+    """
+    Save a NumPy evaluator (FusedMLP, FlatForest or SurrogateTable) as a flat artifact.
+    The directory is written next to its final location and then renamed, so that concurrent processes never read a partial artifact.
+    """
+    kind = next(kind for kind, cls in ARTIFACT_KINDS.items() if isinstance(evaluator, cls))
+    params, arrays = evaluator.to_arrays()
+
+    tmp_directory = f"{directory}.tmp-{os.getpid()}"
+    os.makedirs(tmp_directory, exist_ok=True)
+    for key, array in arrays.items():
+        np.save(os.path.join(tmp_directory, f"{key}.npy"), np.ascontiguousarray(array))
+    with open(os.path.join(tmp_directory, "meta.json"), "w") as f:
+        json.dump({"kind": kind, "params": params, "arrays": sorted(arrays)}, f, indent=4)
+
+    try:
+        os.replace(tmp_directory, directory)
+    except OSError: # Already written by another process.
+        for file in os.listdir(tmp_directory):
+            os.remove(os.path.join(tmp_directory, file))
+        os.rmdir(tmp_directory)
+
+def load_artifact(directory, mmap_mode="r"):
+    """
+    Load a flat artifact. The arrays are memory-mapped (read-only) unless mmap_mode is None.
+    """
+    with open(os.path.join(directory, "meta.json")) as f:
+        meta = json.load(f)
+    arrays = {key: np.load(os.path.join(directory, f"{key}.npy"), mmap_mode=mmap_mode) for key in meta["arrays"]}
+    return ARTIFACT_KINDS[meta["kind"]].from_arrays(meta["params"], arrays)
+
+def convert_pickles(kind, model_path, scaler_X_path, scaler_y_path, output_directory):
+    """
+    Convert a pickled sklearn model (MLPRegressor or RandomForestRegressor) and its scalers into a flat artifact.
+    """
+    import joblib
+
+    evaluator = ARTIFACT_KINDS[kind].from_sklearn(joblib.load(model_path), joblib.load(scaler_X_path), joblib.load(scaler_y_path))
+    save_artifact(evaluator, output_directory)
+    return evaluator
+
+
+class ModelRegistry:
+    """
+    Registry of the surrogate models, loaded lazily.
+        - get(name): the NumPy evaluator, memory-mapped from its flat artifact (converted from the pickles if missing).
+        - sklearn(name): the original (model, scaler_X, scaler_y), unpickled with joblib.
+        - table(name): the tabulated response of the model (see tabulated.py), None if it was not built (build_table(name)).
+        - tabulated(name): table(name), if it passes the accuracy gate against get(name).
+        - reduced_precision(name): the float32 copy of get(name), if it passes the accuracy gate against float64.
+        - training_index(): the out of distribution index of the training features (see ood_index.py), built if missing.
+    """
+
+    def __init__(self, pickle_directory=mlp_directory, artifact_directory=flat_directory):
+        self.pickle_directory = pickle_directory
+        self.artifact_directory = artifact_directory
+        self.specs = {}
+        self._evaluators = {}
+        self._sklearn = {}
+        self._tables = {}
+        self._tabulated = {}
+        self._reduced = {}
+        self._training_index = None
+        self.gate_errors = {}
+
+    def add(self, name, kind, model_file, scaler_X_file, scaler_y_file):
+        if kind not in ARTIFACT_KINDS:
+            raise ValueError(f"Unknown kind of surrogate model: {kind}.")
+        self.specs[name] = (kind, model_file, scaler_X_file, scaler_y_file)
+
+    def available(self, name):
+        """
+        Whether the model can be loaded: its flat artifact or its pickled model exists (e.g. rf_curtailment.pkl is not shipped).
+        """
+        model_file = self.specs[name][1]
+        return (os.path.exists(os.path.join(self.artifact_directory, name, "meta.json"))
+                or os.path.exists(os.path.join(self.pickle_directory, model_file)))
+
+    def loaded(self):
+        return sorted(set(self._evaluators) | set(self._sklearn) | {f"{name}_table" for name in self._tables})
+
+    def get(self, name):
+        if name not in self._evaluators:
+            kind, model_file, scaler_X_file, scaler_y_file = self.specs[name]
+            directory = os.path.join(self.artifact_directory, name)
+            if not os.path.exists(os.path.join(directory, "meta.json")):
+                os.makedirs(self.artifact_directory, exist_ok=True)
+                convert_pickles(kind, *(os.path.join(self.pickle_directory, file) for file in (model_file, scaler_X_file, scaler_y_file)), directory)
+            self._evaluators[name] = load_artifact(directory)
+        return self._evaluators[name]
+
+    def sklearn(self, name):
+        if name not in self._sklearn:
+            import joblib
+
+            _, *files = self.specs[name]
+            self._sklearn[name] = tuple(joblib.load(os.path.join(self.pickle_directory, file)) for file in files)
+        return self._sklearn[name]
+
+    def table(self, name):
+        if name not in self._tables:
+            directory = os.path.join(self.artifact_directory, f"{name}_table")
+            self._tables[name] = load_artifact(directory) if os.path.exists(os.path.join(directory, "meta.json")) else None
+        return self._tables[name]
+
+    def build_table(self, name, max_error=TABLE_MAX_ERROR, max_points=MAX_TABLE_POINTS):
+        """
+        Tabulate the model on an adaptive grid (see SurrogateTable.build_adaptive), assess its errors and save it. Offline step only.
+        """
+        live_model = self.get(name)
+        table = SurrogateTable.build_adaptive(live_model.predict, max_error, max_points)
+        error_report(table, live_model.predict)
+        directory = os.path.join(self.artifact_directory, f"{name}_table")
+        if os.path.exists(directory):
+            for file in os.listdir(directory):
+                os.remove(os.path.join(directory, file))
+            os.rmdir(directory)
+        save_artifact(table, directory)
+        self._tables.pop(name, None)
+        self._tabulated.pop(name, None)
+        return self.table(name)
+
+    def tabulated(self, name, max_error=TABLE_MAX_ERROR):
+        """
+        Accuracy gate of the tabulated mode: the max abs error [%] of the table against the live model (stored by build_table()).
+        If the table is missing or its error exceeds max_error, the tabulated mode is refused and the live model get(name) is returned.
+        """
+        if name not in self._tabulated:
+            candidate = self.table(name)
+            if candidate is None:
+                print(f"\nTabulated mode refused for {name}: no table (python -m surr_model.tabulated). The live model is kept.")
+                candidate = self.get(name)
+            elif candidate.max_error is None or candidate.max_error > max_error:
+                error = float("inf") if candidate.max_error is None else candidate.max_error
+                print(f"\nTabulated mode refused for {name}: max abs error {error:.2e} % > {max_error:.2e} %. The live model is kept.")
+                candidate = self.get(name)
+            self._tabulated[name] = candidate
+        return self._tabulated[name]
+
+    def training_index(self, rebuild=False):
+        if rebuild or self._training_index is None:
+            directory = os.path.join(self.artifact_directory, "training_index")
+            if rebuild or not os.path.exists(os.path.join(directory, "meta.json")):
+                os.makedirs(self.artifact_directory, exist_ok=True)
+                if os.path.exists(directory):
+                    for file in os.listdir(directory):
+                        os.remove(os.path.join(directory, file))
+                    os.rmdir(directory)
+                save_artifact(TrainingDomainIndex.from_features(training_features()), directory)
+            self._training_index = load_artifact(directory)
+        return self._training_index
+
+    def reduced_precision(self, name, max_error=FLOAT32_MAX_ERROR):
+        """
+        Accuracy gate of the float32 mode: the float32 evaluator is compared to float64 over the training dataset (mlp/dataset.csv).
+        If the maximum absolute error [%] exceeds max_error, the float32 mode is refused and the float64 evaluator is returned.
+        """
+        if name not in self._reduced:
+            reference = self.get(name)
+            candidate = reference.astype(np.float32)
+            self.gate_errors[name] = precision_error(reference, candidate)
+            if self.gate_errors[name] > max_error:
+                print(f"\nFloat32 inference refused for {name}: max abs error {self.gate_errors[name]:.2e} % > {max_error:.2e} %. Float64 is kept.")
+                candidate = reference
+            self._reduced[name] = candidate
+        return self._reduced[name]
+
+    def predictor(self, name, flat=True, tabulated=False, float32=False):
+        """
+        Predict function of a model (raw features -> target in %), which only loads the model at its first call.
+        float32 only applies to the NumPy evaluators: with flat=False, the sklearn predictor is kept in float64.
+        """
+        if float32 and flat and not tabulated:
+            return lambda X: self.reduced_precision(name).predict(X)
+        if tabulated:
+            return lambda X: self.tabulated(name).predict(X)
+        if flat:
+            return lambda X: self.get(name).predict(X)
+        return lambda X: sklearn_predict(*self.sklearn(name), X)
+
+    def build_all(self):
+        """
+        Convert all registered models into flat artifacts (e.g. before starting parallel runs). Models whose pickle is missing are skipped.
+        """
+        for name in self.specs:
+            if not self.available(name):
+                print(f"{name}: {self.specs[name][1]} not found, skipped.")
+                continue
+            self.get(name)
+        self.training_index()
+
+
+def default_registry():
+    """
+    Registry holding the surrogate models of targets.py (SURROGATE_MODELS).
+    """
+    registry = ModelRegistry()
+    for name, spec in SURROGATE_MODELS.items():
+        registry.add(name, *spec)
+    return registry
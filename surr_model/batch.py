@@ -0,0 +1,61 @@
+"""
+Batched surrogate model inference implementation within MEDEAS.
+
+This file defines the batch API of the surrogate models, used for ensembles of MEDEAS scenarios (FFF, BAU, OT, PID gains variants...).
+Instead of one call per scenario and per time step, the features of all scenarios and time steps (N x T x 6) are evaluated
+in one vectorized call, with the same processing as the targets components (see targets.py):
+scaling -> model -> inverse scaling -> %->Dmnl -> negative outputs set at 0.
+"""
+
+import numpy as np
+
+from .artifacts import default_registry
+from .evaluator import FEATURE_NAMES, clip_features, to_dmnl_array
+
+# Targets of targets.py and the registered model behind each of them (see artifacts.SURROGATE_MODELS).
+TARGET_MODELS = {
+    "curtailment": "mlp_curtailment",
+    "load_shedding": "mlp_loadshedding",
+    "RF_curtailment": "rf_curtailment",
+    "RF_load_shedding": "rf_loadshedding",
+}
+
+_registry = None
+
+def get_registry():
+    """
+    Registry shared by all batch calls of the process, the models are loaded at their first use.
+    """
+    global _registry
+    if _registry is None:
+        _registry = default_registry()
+    return _registry
+
+
+def predict_batch(features, targets=("curtailment", "load_shedding"), clip=False, flat=True, tabulated=False,
+                  float32=False, registry=None, batch_size=65536, models=None):
+    """
+    Evaluate the surrogate targets for an array of features of shape (..., 6), typically (N scenarios, T steps, 6).
+    The features are expected as computed by features.py (i.e. already clipped), unless clip=True.
+    With float32=True, the models run in float32 if they pass the accuracy gate (see artifacts.ModelRegistry.reduced_precision()).
+    models maps the targets to registered models (TARGET_MODELS by default), e.g. to evaluate a new surrogate added to the registry.
+    Returns a dict target -> array of shape (...), in Dmnl [-].
+    """
+    features = np.asarray(features, dtype=np.float64)
+    if features.shape[-1] != len(FEATURE_NAMES):
+        raise ValueError(f"Last dimension of the features should be {len(FEATURE_NAMES)} ({', '.join(FEATURE_NAMES)}), got {features.shape[-1]}.")
+    if clip:
+        features = clip_features(features)
+
+    registry = get_registry() if registry is None else registry
+    models = TARGET_MODELS if models is None else models
+    X = features.reshape(-1, len(FEATURE_NAMES))
+    outputs = {}
+    for target in targets:
+        predict = registry.predictor(models[target], flat=flat, tabulated=tabulated, float32=float32)
+        # Chunks bound the size of the hidden layers activations for long ensembles.
+        output = np.empty(X.shape[0])
+        for start in range(0, X.shape[0], batch_size):
+            output[start:start + batch_size] = predict(X[start:start + batch_size])
+        outputs[target] = to_dmnl_array(output).reshape(features.shape[:-1])
+    return outputs
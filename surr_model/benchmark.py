@@ -0,0 +1,191 @@
+"""
+Surrogate model benchmark implementation within MEDEAS.
+
+This file measures the cost of the surrogate models shipped in surr_model/mlp (MLP & RF, curtailment & load shedding):
+    - start-up: unpickling the sklearn model and its scalers (joblib) vs. loading the memory-mapped flat artifact,
+    - single-row latency, i.e. the cost of one call of curtailment(), load_shedding(), RF_curtailment() or RF_load_shedding(),
+    - batched throughput at several batch sizes (see batch.py),
+for each inference backend: sklearn pipeline, NumPy evaluator (float64 & float32) and tabulated mode.
+The results are written in a JSON report, which can be compared to a stored baseline to catch regressions.
+
+Usage: python -m surr_model.benchmark --output report.json [--baseline baseline.json] [--tolerance 0.25]
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import numpy as np
+
+from .artifacts import SURROGATE_MODELS, ModelRegistry
+from .evaluator import FEATURE_BOUNDS
+from .inference import mlp_directory, sklearn_predict
+
+# Models of surr_model/mlp benchmarked, on top of the ones used in targets.py.
+BENCHMARK_MODELS = dict(SURROGATE_MODELS, mlp_loadshedding_no_oversamp=("mlp", "mlp_loadshedding.pkl", "mlp_scaler_X_ls.pkl", "mlp_scaler_y_ls.pkl"))
+BATCH_SIZES = (1, 32, 1024, 32768)
+# Size of the tables built for the tabulated mode: its cost per prediction does not depend on the size of the (non-uniform) grid.
+TABLE_POINTS = 100_000
+
+
+def time_per_call(func, repeat=5, min_time=0.1):
+    """
+    Median time [s] of one call of func(), over repeat measurements of at least min_time each.
+    """
+    n_calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(n_calls):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        n_calls *= 2
+
+    timings = [elapsed / n_calls]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(n_calls):
+            func()
+        timings.append((time.perf_counter() - start) / n_calls)
+    return statistics.median(timings)
+
+def random_features(n, seed=0):
+    rng = np.random.default_rng(seed)
+    lower, upper = np.array(FEATURE_BOUNDS, dtype=np.float64).T
+    return lower + (upper - lower) * rng.random((n, len(FEATURE_BOUNDS)))
+
+
+def metric(value, unit, better):
+    return {"value": value, "unit": unit, "better": better}
+
+def benchmark_model(name, registry, repeat=5, batch_sizes=BATCH_SIZES, tabulated=True):
+    """
+    Start-up, latency and throughput metrics of one registered model, for all backends.
+    """
+    import joblib
+
+    results = {}
+    _, *files = registry.specs[name]
+    paths = [os.path.join(registry.pickle_directory, file) for file in files]
+
+    # Start-up costs, best of repeat cold loads (the flat artifact is built beforehand, only its loading is measured).
+    registry.get(name)
+    pickle_timings, flat_timings = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in paths:
+            joblib.load(path)
+        pickle_timings.append(time.perf_counter() - start)
+
+        cold_registry = ModelRegistry(registry.pickle_directory, registry.artifact_directory)
+        cold_registry.specs = registry.specs
+        start = time.perf_counter()
+        cold_registry.get(name)
+        flat_timings.append(time.perf_counter() - start)
+    results["startup.pickle_ms"] = metric(1e3 * min(pickle_timings), "ms", "lower")
+    results["startup.flat_ms"] = metric(1e3 * min(flat_timings), "ms", "lower")
+
+    backends = {
+        "sklearn": lambda X: sklearn_predict(*registry.sklearn(name), X),
+        "numpy64": registry.get(name).predict,
+        "numpy32": registry.reduced_precision(name).predict,
+    }
+    if tabulated:
+        backends["tabulated"] = registry.build_table(name, max_points=TABLE_POINTS).predict
+
+    row = random_features(1)
+    for backend, predict in backends.items():
+        predict(row) # Warm-up (lazy loading).
+        results[f"{backend}.latency_us"] = metric(1e6 * time_per_call(lambda: predict(row), repeat), "us", "lower")
+        for batch_size in batch_sizes:
+            X = random_features(batch_size)
+            seconds = time_per_call(lambda: predict(X), repeat)
+            results[f"{backend}.throughput_{batch_size}"] = metric(batch_size / seconds, "rows/s", "higher")
+    return results
+
+def run_benchmarks(models=None, repeat=5, batch_sizes=BATCH_SIZES, tabulated=True, artifact_directory=None):
+    """
+    Benchmark all models of surr_model/mlp (BENCHMARK_MODELS) whose pickle is available, returns the report as a dict.
+    """
+    import sklearn
+
+    if artifact_directory is None:
+        # Artifacts built from scratch in a temporary directory, removed at the end.
+        with tempfile.TemporaryDirectory(prefix="surr_model_bench_") as tmp_directory:
+            return run_benchmarks(models, repeat, batch_sizes, tabulated, tmp_directory)
+
+    registry = ModelRegistry(mlp_directory, artifact_directory)
+    for name, spec in BENCHMARK_MODELS.items():
+        registry.add(name, *spec)
+
+    report = {
+        "meta": {
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "sklearn": sklearn.__version__,
+            "repeat": repeat,
+        },
+        "results": {},
+    }
+    for name in (BENCHMARK_MODELS if models is None else models):
+        if not os.path.exists(os.path.join(mlp_directory, registry.specs[name][1])):
+            print(f"{name}: {registry.specs[name][1]} not found, skipped.")
+            continue
+        print(f"Benchmarking {name}...")
+        report["results"][name] = benchmark_model(name, registry, repeat, batch_sizes, tabulated)
+    return report
+
+def compare(report, baseline, tolerance=0.25):
+    """
+    Compare a report to a baseline report. A metric regresses when it is worse than the baseline by more than tolerance (relative).
+    Returns the list of regressions as (model, metric, baseline value, new value).
+    """
+    regressions = []
+    for name, metrics in report["results"].items():
+        for key, new in metrics.items():
+            old = baseline.get("results", {}).get(name, {}).get(key)
+            if old is None or old["value"] == 0:
+                continue
+            ratio = new["value"] / old["value"]
+            if (new["better"] == "lower" and ratio > 1 + tolerance) or (new["better"] == "higher" and ratio < 1 / (1 + tolerance)):
+                regressions.append((name, key, old["value"], new["value"]))
+    return regressions
+
+def print_report(report):
+    for name, metrics in report["results"].items():
+        print(f"\n{name}")
+        for key, result in metrics.items():
+            print(f"    {key:<28} {result['value']:>14.3f} {result['unit']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the surrogate models inference.")
+    parser.add_argument("--output", default="surr_model_benchmark.json", help="Path of the JSON report.")
+    parser.add_argument("--baseline", default=None, help="JSON report to compare with.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Relative slowdown accepted before reporting a regression.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--models", nargs="*", default=None, choices=sorted(BENCHMARK_MODELS))
+    parser.add_argument("--no-tabulated", action="store_true", help="Skip the tabulated mode (its build takes a few seconds per model).")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.models, args.repeat, tabulated=not args.no_tabulated)
+    print_report(report)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"\nReport saved at {args.output}.")
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for name, key, old, new in regressions:
+            print(f"Regression: {name} {key}: {old:.3f} -> {new:.3f}")
+        if regressions:
+            sys.exit(1)
+        print("No regression against the baseline.")
@@ -0,0 +1,245 @@
+"""
+Closed loop replay implementation within MEDEAS.
+
+This file defines a fast replay of the feedback loop of the surrogate model components (features.py, targets.py & investments.py):
+features -> surrogate targets (curtailment & load shedding) -> PID controllers -> grid investments -> capacities added by the
+feedback mechanism (RES, storage, rNTC) -> features, for a batch of candidates (e.g. PID gains) stepped together as NumPy arrays.
+The upstream MEDEAS variables follow a baseline (open loop) trajectory, e.g. the scripted scenario of standalone.py, to which
+the added capacities are fed back, and the RES capacity factors are reduced by the delayed curtailment, as in MEDEAS (see
+modifications.txt). The time-only inputs (PyPSA-EUR shares, prices, rNTC) are the precomputed ones of exogenous.py.
+Each time step follows the Euler scheme of pysd: all components are evaluated at t, then the stateful ones are updated.
+As in investments.py, the controllers measure the targets delayed of PID.MEASUREMENT_DELAY (delayed_measurements, default),
+or the ones of the current time step.
+"""
+
+import os
+import numpy as np
+
+from .batch import get_registry, predict_batch
+from .evaluator import clip_features
+from .exogenous import ExogenousInputs
+from .feature_engine import RES_COLUMNS, compute_features, peak_load
+from .PID import DERIVATIVE_TIME_CONSTANT, MEASUREMENT_DELAY, PIDBank, delayed_measurement
+from .year_tables import YearTable
+
+pypsa_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pypsa")
+
+# Controlled targets, in the order of the last axis of the gains (Kp, Ki, Kd) and of the controllers outputs.
+LOOPS = ("load_shedding", "curtailment")
+# Upstream MEDEAS variables of the baseline: (T,) or (T, n) arrays, subscripts ordered as in feature_engine.py,
+# or with a scenario axis after the time axis, (T, S) or (T, S, n), for one baseline per scenario.
+BASELINE_VARIABLES = ("installed_capacity_res_elec", "cpini_res_elec", "fe_elec_generation_from_fossil_fuels",
+                      "fe_nuclear_elec_generation_twh", "cp_nuclear", "total_fe_elec_demand_twh", "total_capacity_elec_storage_tw")
+# Number of subscript dimensions of the baseline variables.
+SUBSCRIPTED = {"installed_capacity_res_elec": 1, "cpini_res_elec": 1, "fe_elec_generation_from_fossil_fuels": 1}
+# RES capacities added by the load shedding investments, and their PyPSA-EUR capacity (see investments.sm_new_capacity_res_elec).
+RES_CAPACITIES = {"hydro": "ROR", "wind_onshore": "Wind (Onshore)", "wind_offshore": "Wind (Offshore)", "solar_PV": "Solar"}
+STORAGE_CAPACITIES = ("PHS", "Hydro", "Battery")
+GRID_CAPACITIES = ("AC Lines", "DC Lines", "Distrib Grid")
+OUTPUTS = ("features", "curtailment", "load_shedding", "new_investments_grid", "cumulated_new_investments_grid",
+           "cumulated_capacity_res_elec", "cumulated_storage_feedback", "cumulated_add_rNTC_feedback")
+
+_WIND_ONSHORE = RES_COLUMNS.index("wind_onshore")
+_WIND_OFFSHORE = RES_COLUMNS.index("wind_offshore")
+
+
+def pypsa_tables(prices_path=None):
+    """
+    Yearly tables of the exogenous inputs (see exogenous.py). The prices file is not part of this repository:
+    it is stood in by the PyPSA-EUR ratios in $/W (see standalone.standin_prices()) unless its path is given.
+    """
+    tables = {
+        "rNTC": YearTable.from_csv(os.path.join(pypsa_directory, "rNTC", "interp_rNTC.csv")),
+        "ratio_rNTC_TW": YearTable.from_csv(os.path.join(pypsa_directory, "rNTC", "ratio_rNTC_TW.csv")),
+        "tech_shares_ls": YearTable.from_csv(os.path.join(pypsa_directory, "capa and invest", "interp_tech_shares_ls.csv")),
+        "tech_shares_curt": YearTable.from_csv(os.path.join(pypsa_directory, "capa and invest", "interp_tech_shares_curt.csv")),
+    }
+    if prices_path is None:
+        from .standalone import standin_prices
+        prices = standin_prices()
+        tables["prices_1995USD_W"] = YearTable(prices.columns, prices.to_numpy(), prices.index[0])
+    else:
+        tables["prices_1995USD_W"] = YearTable.from_csv(prices_path)
+    return tables
+
+def scenario_baseline(scenario, times):
+    """
+    Baseline of the upstream variables at times from a scripted scenario (see standalone.UpstreamScenario).
+    """
+    return {name: scenario.trajectory(name, times) for name in BASELINE_VARIABLES}
+
+
+class ClosedLoop:
+    """
+    Closed loop of the feedback mechanism over the time steps of exogenous (ExogenousInputs), on a baseline {variable: (T, ...)},
+    shared by all candidates, or with one baseline per scenario {variable: (T, S, ...)}, the candidates being the S scenarios.
+    """
+
+    def __init__(self, baseline, exogenous, activation_year=2020, cp_feedback=True, delayed_measurements=True, measurement_delay=MEASUREMENT_DELAY,
+                 registry=None, models=None):
+        self.exogenous = exogenous
+        self.times = exogenous.data["time"]
+        self.baseline = {name: np.asarray(baseline[name], dtype=np.float64) for name in BASELINE_VARIABLES}
+        for name, values in self.baseline.items():
+            if values.shape[0] != self.times.shape[0]:
+                raise ValueError(f"Baseline {name}: {values.shape[0]} time steps, expected {self.times.shape[0]}.")
+        scenarios = {values.shape[1] for name, values in self.baseline.items() if values.ndim == 2 + SUBSCRIPTED.get(name, 0)}
+        if len(scenarios) > 1:
+            raise ValueError(f"Baseline variables with different numbers of scenarios: {sorted(scenarios)}.")
+        self.n_scenarios = scenarios.pop() if scenarios else None
+        self.peak_load = peak_load(self.baseline["total_fe_elec_demand_twh"])
+        self.activation_year = activation_year
+        self.cp_feedback = cp_feedback
+        self.delayed_measurements = delayed_measurements
+        self.measurement_delay = measurement_delay
+        self.registry = get_registry() if registry is None else registry
+        self.models = models
+
+        # Capacities [TW] added per T$ invested by each controller at each time step: investment shares / prices.
+        data, tables = exogenous.data, exogenous.tables
+        prices = tables["prices_1995USD_W"].index
+
+        def per_tera_dollar(field, table, columns):
+            index = tables[table].index
+            return np.sum([data[field][:, index[c]] / data["prices"][:, prices[c]] for c in columns], axis=0)
+
+        self.res_ls = np.zeros((self.times.shape[0], len(RES_COLUMNS)))
+        for res, capacity in RES_CAPACITIES.items():
+            self.res_ls[:, RES_COLUMNS.index(res)] = per_tera_dollar("shares_ls", "tech_shares_ls", (capacity,))
+        self.storage = np.column_stack([per_tera_dollar("shares_ls", "tech_shares_ls", STORAGE_CAPACITIES),
+                                        per_tera_dollar("shares_curt", "tech_shares_curt", STORAGE_CAPACITIES)])
+        self.ntc = np.column_stack([per_tera_dollar("shares_ls", "tech_shares_ls", GRID_CAPACITIES),
+                                    per_tera_dollar("shares_curt", "tech_shares_curt", GRID_CAPACITIES)])
+
+    def run(self, Kp=0.0, Ki=0.0, Kd=0.0, setpoint=0.0, activation_year=None, Tf=0.0, outputs=OUTPUTS):
+        """
+        Run the closed loop for a batch of candidates. Kp, Ki, Kd, setpoint and Tf (derivative filter, see PID.py) broadcast to (n, 2),
+        the last axis ordered as LOOPS,
+        activation_year to (n,) (self.activation_year by default). With one baseline per scenario, n is the number of scenarios.
+        Returns a dict output -> (T, n, ...) array, and "time" -> (T,):
+            features (clipped, 6), curtailment & load_shedding [Dmnl], new_investments_grid [T$/year] & cumulated_new_investments_grid [T$] (2, as LOOPS),
+            cumulated_capacity_res_elec [TW] (8, as RES_COLUMNS), cumulated_storage_feedback [TW], cumulated_add_rNTC_feedback [Dmnl].
+        """
+        activation_year = np.atleast_1d(np.asarray(self.activation_year if activation_year is None else activation_year, dtype=np.float64))
+        parameters = [np.atleast_2d(np.asarray(p, dtype=np.float64)) for p in (Kp, Ki, Kd, setpoint, Tf)]
+        n = max([p.shape[0] for p in parameters] + [activation_year.shape[0], self.n_scenarios or 1])
+        if self.n_scenarios is not None and n != self.n_scenarios:
+            raise ValueError(f"{n} candidates for a baseline of {self.n_scenarios} scenarios.")
+        Kp, Ki, Kd, setpoint, Tf = (np.broadcast_to(p, (n, len(LOOPS))) for p in parameters)
+        activation_year = np.broadcast_to(activation_year, (n,))
+        controllers = PIDBank(n * len(LOOPS), Kp.ravel(), Ki.ravel(), Kd.ravel(), Tf=Tf.ravel())
+        controllers.setpoint[:] = setpoint.ravel()
+
+        T = self.times.shape[0]
+        dt = self.exogenous.time_step
+        data = self.exogenous.data
+        base = self.baseline
+        shapes = {"features": (6,), "new_investments_grid": (2,), "cumulated_new_investments_grid": (2,), "cumulated_capacity_res_elec": (len(RES_COLUMNS),)}
+        results = {name: np.empty((T, n) + shapes.get(name, ())) for name in outputs}
+        results["time"] = self.times
+
+        cumulated_res = np.zeros((n, len(RES_COLUMNS))) # TW
+        cumulated_storage = np.zeros(n) # TW
+        cumulated_rNTC = np.zeros(n) # Dmnl
+        cumulated_investments = np.zeros((n, len(LOOPS))) # T$
+        delayed = np.zeros((n, len(LOOPS))) # targets delayed of one time step, initialized at 0
+
+        for k, t in enumerate(self.times):
+            # As in investments.cumulated_capacity_res_elec(), the offshore wind capacity added is the onshore one.
+            added_res = cumulated_res.copy()
+            added_res[:, _WIND_OFFSHORE] = cumulated_res[:, _WIND_ONSHORE]
+            cp = base["cpini_res_elec"][k] / (1 + delayed[:, 1:]) if self.cp_feedback else base["cpini_res_elec"][k]
+            features = clip_features(compute_features(
+                t, base["installed_capacity_res_elec"][k] + added_res, cp, base["fe_elec_generation_from_fossil_fuels"][k],
+                base["fe_nuclear_elec_generation_twh"][k], base["cp_nuclear"][k], base["total_capacity_elec_storage_tw"][k] + cumulated_storage,
+                self.peak_load[k], data["pypsa_rNTC"][k], cumulated_rNTC, data["share_flex"][k]))
+            targets = predict_batch(features, LOOPS, registry=self.registry, models=self.models)
+            current = np.column_stack([targets[loop] for loop in LOOPS])
+            measurements = delayed_measurement(current, delayed, dt, self.measurement_delay, k == 0) if self.delayed_measurements else current
+            investments = controllers.step(t, measurements.ravel(), time_step=dt).reshape(n, len(LOOPS)) # T$/year
+
+            # Capacities added by the feedback mechanism (see investments.py), RES & storage from the activation year.
+            active = t >= activation_year
+            res_rate = np.where(active[:, None], investments[:, :1] * self.res_ls[k], 0) # TW/year
+            storage_rate = np.where(active, investments @ self.storage[k], 0) # TW/year
+            rNTC_rate = investments @ self.ntc[k] * data["ratio_rNTC_TW"][k] # 1/year
+
+            values = {"features": features, "curtailment": targets["curtailment"], "load_shedding": targets["load_shedding"],
+                      "new_investments_grid": investments, "cumulated_new_investments_grid": cumulated_investments,
+                      "cumulated_capacity_res_elec": added_res, "cumulated_storage_feedback": cumulated_storage,
+                      "cumulated_add_rNTC_feedback": cumulated_rNTC}
+            for name in outputs:
+                results[name][k] = values[name]
+
+            # Euler update of the stateful variables.
+            cumulated_res = cumulated_res + res_rate * dt
+            cumulated_storage = cumulated_storage + storage_rate * dt
+            cumulated_rNTC = cumulated_rNTC + rNTC_rate * dt
+            cumulated_investments = cumulated_investments + investments * dt
+            delayed = current
+        return results
+
+
+def default_loop(initial_time=1995, final_time=2050, time_step=1/32, scenario=None, prices_path=None, **options):
+    """
+    Closed loop on the scripted scenario of standalone.py (default one if None), options passed to ClosedLoop.
+    """
+    from .standalone import UpstreamScenario
+    exogenous = ExogenousInputs(pypsa_tables(prices_path), initial_time, final_time, time_step)
+    scenario = UpstreamScenario() if scenario is None else scenario
+    return ClosedLoop(scenario_baseline(scenario, exogenous.data["time"]), exogenous, **options)
+
+# Tolerances of time_step_drift() (Kp, Ki & Kd candidates) at the coarse time steps supported by the feedback mechanism.
+DRIFT_TOLERANCES = {1/4: (0.01, 0.01, 0.03), 1: (0.05, 0.05, 0.1)}
+
+def time_step_drift(time_steps=(1/4, 1), reference_step=1/32, Kp=10, Ki=10, Kd=0.5, Tf=DERIVATIVE_TIME_CONSTANT, settling=2, **options):
+    """
+    Max relative difference of the yearly cumulated investments (both loops) at each of time_steps, with reference_step,
+    for a P, an I and a D candidate (derivative filter Tf), from initial_time + settling [year]: the start-up of the delayed targets
+    (initialized at 0) is only seen by a 1 year step at its second step. options are passed to default_loop().
+    Returns a dict time_step -> (3,) array (Kp, Ki, Kd).
+    """
+    gains = {"Kp": [[Kp, Kp], [0, 0], [0, 0]], "Ki": [[0, 0], [Ki, Ki], [0, 0]], "Kd": [[0, 0], [0, 0], [Kd, Kd]], "Tf": Tf}
+    yearly = {}
+    for time_step in (reference_step,) + tuple(time_steps):
+        results = default_loop(time_step=time_step, **options).run(**gains)
+        years = np.arange(np.ceil(results["time"][0]) + settling, np.floor(results["time"][-1]) + 1)
+        yearly[time_step] = results["cumulated_new_investments_grid"][np.searchsorted(results["time"], years)].sum(axis=-1)
+    reference = yearly.pop(reference_step)
+    return {time_step: np.max(np.abs(values - reference), axis=0) / np.max(reference, axis=0) for time_step, values in yearly.items()}
+
+
+if __name__ == "__main__":
+    # Check: closed loop against the components executed by the standalone runtime (same scenario and gains), test of the
+    # consistency of the loop over the time steps (1/4 & 1 year against 1/32), and timings.
+    import time
+    from .standalone import StandaloneModel
+
+    Kp, Ki, Kd, Tf = (0.5, 0.5), (0.1, 0.1), (0.05, 0.05), (0.25, 0.25)
+    model = StandaloneModel(final_time=2040, time_step=0.25)
+    model["grid_controllers"].set_gains(Kp=Kp, Ki=Ki, Kd=Kd, Tf=Tf)
+    reference = model.run(("curtailment", "load_shedding", "cumulated_storage_feedback", "cumulated_add_rNTC_feedback",
+                           "cumulated_new_investments_grid_ls", "cumulated_new_investments_grid_curt"), saveper=0.25)
+    model.close()
+    results = default_loop(final_time=2040, time_step=0.25).run(Kp, Ki, Kd, Tf=Tf)
+    for name, column in (("curtailment", "curtailment"), ("load_shedding", "load_shedding"),
+                         ("cumulated_storage_feedback", "cumulated_storage_feedback"), ("cumulated_add_rNTC_feedback", "cumulated_add_rNTC_feedback"),
+                         ("cumulated_new_investments_grid", "cumulated_new_investments_grid_ls")):
+        values = results[name][:, 0, 0] if name == "cumulated_new_investments_grid" else results[name][:, 0]
+        print(f"{column}: max abs difference with the standalone runtime = {np.max(np.abs(values - reference[column].to_numpy())):.1e} "
+              f"(max value {np.max(np.abs(values)):.3e})")
+
+    # Test of the consistency over the time steps, with the derivative filter recommended at coarse steps and the default measurements.
+    for delayed_measurements in (True, False):
+        drifts = time_step_drift(delayed_measurements=delayed_measurements)
+        for time_step, drift in drifts.items():
+            print(f"Delayed measurements: {delayed_measurements}, time step {time_step}: max relative difference of the yearly cumulated "
+                  f"investments with the 1/32 year step (Kp, Ki, Kd) = {np.round(drift, 3)}")
+            assert np.all(drift <= DRIFT_TOLERANCES[time_step]), f"drift {drift} above {DRIFT_TOLERANCES[time_step]} at time step {time_step}"
+
+    loop = default_loop()
+    for n in (1, 256):
+        start = time.perf_counter()
+        loop.run(Kp=np.random.default_rng(0).uniform(0, 1, (n, 2)))
+        elapsed = time.perf_counter() - start
+        print(f"{n} candidates, {loop.times.shape[0]} time steps: {elapsed:.2f} s ({1e3*elapsed/n:.1f} ms per candidate)")
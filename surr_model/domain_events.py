@@ -0,0 +1,105 @@
+"""
+Out of domain events implementation within MEDEAS.
+
+This file defines the recorder of the out of domain events of the surrogate model features: the time steps at which a
+raw feature (before clipping, see features.py) is out of the training domain of the surrogate models (FEATURE_BOUNDS).
+Instead of one message per feature and per time step, each feature keeps counters (below / above its bounds), the first
+and last time of the events and the min/max of its raw value, and a single summary is printed at the end of the run.
+Optionally, a compact per time step flag array (-1: below, 0: within, +1: above the bounds) is kept in a preallocated
+buffer and saved in a .npz file.
+"""
+
+import numpy as np
+
+from .evaluator import FEATURE_BOUNDS, FEATURE_NAMES
+
+# Initial size of the per time step buffer, 1995-2050 with a time step of 1/32 year. It is doubled when full.
+DEFAULT_CAPACITY = 2048
+
+
+class DomainEventRecorder:
+    """
+    Out of domain events of the features, recorded once per time step with record(time, raw_features).
+    """
+
+    def __init__(self, names=FEATURE_NAMES, bounds=FEATURE_BOUNDS, record_steps=False, capacity=DEFAULT_CAPACITY):
+        self.names = tuple(names)
+        self.lower, self.upper = np.array(bounds, dtype=np.float64).T
+        self.record_steps = record_steps
+        self.capacity = capacity
+        self.reset()
+
+    def reset(self):
+        n = len(self.names)
+        self.n_steps = 0
+        self.below = np.zeros(n, dtype=np.int64) # Number of time steps below the lower bound.
+        self.above = np.zeros(n, dtype=np.int64) # Number of time steps above the upper bound.
+        self.first_time = np.full(n, np.nan)
+        self.last_time = np.full(n, np.nan)
+        self.raw_min = np.full(n, np.inf)
+        self.raw_max = np.full(n, -np.inf)
+        if self.record_steps:
+            self._times = np.empty(self.capacity)
+            self._flags = np.zeros((self.capacity, n), dtype=np.int8)
+
+    def record(self, time, raw):
+        """
+        Record the raw (unclipped) features of one time step.
+        """
+        below = raw < self.lower
+        above = raw > self.upper
+        if self.record_steps:
+            if self.n_steps == self._times.shape[0]:
+                self._times = np.concatenate([self._times, np.empty_like(self._times)])
+                self._flags = np.concatenate([self._flags, np.zeros_like(self._flags)])
+            self._times[self.n_steps] = time
+            self._flags[self.n_steps] = above.view(np.int8) - below.view(np.int8)
+        self.n_steps += 1
+        np.minimum(self.raw_min, raw, out=self.raw_min)
+        np.maximum(self.raw_max, raw, out=self.raw_max)
+
+        out = below | above
+        if not out.any():
+            return
+        self.below += below
+        self.above += above
+        self.first_time[out & np.isnan(self.first_time)] = time
+        self.last_time[out] = time
+
+    def flags(self):
+        """
+        Times (n_steps,) and per time step flags (n_steps, n_features): -1 below, 0 within, +1 above the bounds.
+        """
+        if not self.record_steps:
+            raise ValueError("Per time step flags are not recorded (record_steps=False).")
+        return self._times[:self.n_steps], self._flags[:self.n_steps]
+
+    def save(self, path):
+        times, flags = self.flags()
+        np.savez_compressed(path, time=times, flags=flags, names=np.array(self.names), bounds=np.column_stack([self.lower, self.upper]))
+
+    def summary(self):
+        lines = [f"Surrogate features out of domain events ({self.n_steps} time steps)",
+                 f"{'feature':<12} {'bounds':>13} {'below':>7} {'above':>7} {'first':>9} {'last':>9} {'raw min':>10} {'raw max':>10}"]
+        for i, name in enumerate(self.names):
+            bounds = f"[{self.lower[i]:g}, {self.upper[i]:g}]"
+            lines.append(f"{name:<12} {bounds:>13} {self.below[i]:>7} {self.above[i]:>7} {self.first_time[i]:>9.3f} {self.last_time[i]:>9.3f} "
+                         f"{self.raw_min[i]:>10.4f} {self.raw_max[i]:>10.4f}")
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # Check: counters and flags of a synthetic trajectory against a direct count.
+    rng = np.random.default_rng(0)
+    lower, upper = np.array(FEATURE_BOUNDS).T
+    times = 1995 + np.arange(3000) / 32
+    raw = lower - 0.2 * (upper - lower) + 1.4 * (upper - lower) * rng.random((times.size, len(FEATURE_NAMES)))
+
+    recorder = DomainEventRecorder(record_steps=True)
+    for time, features in zip(times, raw):
+        recorder.record(time, features)
+    _, flags = recorder.flags()
+    assert np.array_equal(recorder.below, (raw < lower).sum(axis=0)) and np.array_equal(recorder.above, (raw > upper).sum(axis=0))
+    assert np.array_equal(flags, (raw > upper).astype(np.int8) - (raw < lower))
+    assert np.array_equal(recorder.raw_min, raw.min(axis=0)) and np.array_equal(recorder.raw_max, raw.max(axis=0))
+    print(recorder.summary())
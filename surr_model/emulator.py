@@ -0,0 +1,184 @@
+"""
+Closed loop emulator implementation within MEDEAS.
+
+This file defines a reduced-order emulator of the feedback mechanism for scenario screening, without running MEDEAS again:
+the closed loop of closed_loop.py (features -> surrogate targets -> PID -> investments -> RES, storage & rNTC capacities),
+stepped for many scenarios at once, each on its own baseline read from a MEDEAS results netCDF file (demand, capacities,
+capacity factors, fossil & nuclear generation). The saved trajectories already include the feedback of their own run: the
+open loop baseline is recovered by removing the capacities added by the feedback mechanism (cumulated_capacity_res_elec,
+cumulated_storage_feedback) and by restoring the capacity factors reduced by the curtailment (cpini = cp*(1+curtailment_delayed)),
+when these variables are saved in the file. The yearly results are linearly interpolated at the time steps of the emulator.
+For what-if studies, each combination of a results file, an activation year of the feedback (activation_year_feedback in
+investments.py) and a set of gains is one scenario of the batch.
+
+Usage: python -m surr_model.emulator [results_1.nc ...] [--activation-years 2020 2025] [--kp 0 0.1] [--ki 0] [--time-step 0.25] [--output what_if.csv]
+Without results files, the scripted scenario of standalone.py is used as baseline. --check verifies the recovery of the baseline
+from the yearly results of a closed loop run, and its emulation again.
+"""
+
+import argparse
+import itertools
+import time
+import numpy as np
+import pandas as pd
+
+from .closed_loop import BASELINE_VARIABLES, LOOPS, ClosedLoop, pypsa_tables, scenario_baseline
+from .exogenous import ExogenousInputs
+from .feature_engine import FOSSIL_COLUMNS, RES_COLUMNS
+
+# Subscripts of the subscripted variables read in the results files, reordered as in feature_engine.py.
+COLUMNS = {"installed_capacity_res_elec": RES_COLUMNS, "cp_res_elec": RES_COLUMNS, "cpini_res_elec": RES_COLUMNS,
+           "cumulated_capacity_res_elec": RES_COLUMNS, "fe_elec_generation_from_fossil_fuels": FOSSIL_COLUMNS}
+# Variables of the feedback of the run itself, removed from the saved trajectories.
+FEEDBACK_VARIABLES = ("cumulated_capacity_res_elec", "cumulated_storage_feedback", "curtailment_delayed", "cp_res_elec")
+
+
+def read_variables(path, names):
+    """
+    Times (T,) and the variables of a MEDEAS results netCDF file among names: {name: (T,) or (T, n)}, subscripts reordered as COLUMNS.
+    """
+    import netCDF4 as nc
+
+    variables = {}
+    with nc.Dataset(path) as dataset:
+        for name in names:
+            if name not in dataset.variables:
+                continue
+            variable = dataset.variables[name]
+            values = np.ma.filled(variable[:], np.nan).astype(np.float64)
+            if name in COLUMNS and len(variable.dimensions) > 1 and variable.dimensions[-1] in dataset.variables:
+                labels = [str(label) for label in dataset.variables[variable.dimensions[-1]][:]]
+                values = values[..., [labels.index(column) for column in COLUMNS[name]]]
+            variables[name] = values
+        if "time" in dataset.variables:
+            times = np.asarray(dataset.variables["time"][:], dtype=np.float64)
+        else:
+            times = np.arange(1995, 1995 + next(iter(variables.values())).shape[0], dtype=np.float64) # Yearly results, as in plots.py.
+    return times, variables
+
+def open_loop_baseline(variables):
+    """
+    Baseline of the upstream variables (see closed_loop.BASELINE_VARIABLES) from the saved ones, without the feedback of the run.
+    """
+    baseline = {name: variables[name] for name in BASELINE_VARIABLES if name in variables}
+    if "installed_capacity_res_elec" in variables and "cumulated_capacity_res_elec" in variables:
+        baseline["installed_capacity_res_elec"] = variables["installed_capacity_res_elec"] - variables["cumulated_capacity_res_elec"]
+    if "total_capacity_elec_storage_tw" in variables and "cumulated_storage_feedback" in variables:
+        baseline["total_capacity_elec_storage_tw"] = variables["total_capacity_elec_storage_tw"] - variables["cumulated_storage_feedback"]
+    if "cpini_res_elec" not in baseline and "cp_res_elec" in variables:
+        curtailment = variables.get("curtailment_delayed", 0)
+        baseline["cpini_res_elec"] = variables["cp_res_elec"] * (1 + np.asarray(curtailment)[..., None])
+    missing = [name for name in BASELINE_VARIABLES if name not in baseline]
+    if missing:
+        raise KeyError(f"Variables missing from the results to build the baseline: {', '.join(missing)}.")
+    return baseline
+
+def interpolate(times, values, new_times):
+    """
+    Linear interpolation of values (T, ...) given at times, at new_times, constant outside.
+    """
+    flat = values.reshape(values.shape[0], -1)
+    return np.column_stack([np.interp(new_times, times, column) for column in flat.T]).reshape((len(new_times),) + values.shape[1:])
+
+def read_baseline(path, new_times):
+    """
+    Open loop baseline of a results file at new_times.
+    """
+    times, variables = read_variables(path, BASELINE_VARIABLES + FEEDBACK_VARIABLES)
+    return {name: interpolate(times, values, new_times) for name, values in open_loop_baseline(variables).items()}
+
+def stack_baselines(baselines):
+    """
+    One baseline per scenario {variable: (T, S, ...)} from a list of baselines {variable: (T, ...)}.
+    """
+    return {name: np.stack([np.asarray(baseline[name], dtype=np.float64) for baseline in baselines], axis=1) for name in BASELINE_VARIABLES}
+
+
+def what_if(baselines, exogenous, activation_years=(2020,), gains=({"Kp": 0.0, "Ki": 0.0, "Kd": 0.0},), labels=None, **options):
+    """
+    Emulate every combination of a baseline, an activation year and a set of gains (dict of Kp, Ki, Kd, Tf: scalars or one per loop)
+    in one batch. options are passed to ClosedLoop. Returns the summary DataFrame (one row per combination) and the results of ClosedLoop.run().
+    """
+    labels = [str(i) for i in range(len(baselines))] if labels is None else labels
+    combinations = list(itertools.product(range(len(baselines)), activation_years, range(len(gains))))
+    scenario, activation_year, variant = (np.array(values) for values in zip(*combinations))
+    baseline = {name: values[:, scenario] for name, values in stack_baselines(baselines).items()}
+    defaults = {"Kp": 0.0, "Ki": 0.0, "Kd": 0.0, "Tf": 0.0}
+    parameters = {name: np.array([np.broadcast_to(gains[g].get(name, default), (len(LOOPS),)) for g in variant], dtype=np.float64)
+                  for name, default in defaults.items()}
+    results = ClosedLoop(baseline, exogenous, **options).run(activation_year=activation_year, **parameters)
+
+    after = results["time"][:, None] >= activation_year
+    summary = pd.DataFrame({"scenario": [labels[s] for s in scenario], "activation_year": activation_year})
+    for name, values in parameters.items():
+        for i, loop in enumerate(LOOPS):
+            summary[f"{name}_{loop}"] = values[:, i]
+    for loop in LOOPS:
+        summary[f"{loop}_mean_after_activation"] = np.sum(results[loop] * after, axis=0) / np.maximum(after.sum(axis=0), 1)
+        summary[f"{loop}_final"] = results[loop][-1]
+    summary["investments"] = results["cumulated_new_investments_grid"][-1].sum(axis=-1) # T$
+    summary["res_added"] = results["cumulated_capacity_res_elec"][-1].sum(axis=-1) # TW
+    summary["storage_added"] = results["cumulated_storage_feedback"][-1] # TW
+    summary["rNTC_added"] = results["cumulated_add_rNTC_feedback"][-1] # Dmnl
+    return summary, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="What-if emulation of the feedback mechanism on MEDEAS results files.")
+    parser.add_argument("paths", nargs="*", help="MEDEAS results netCDF files (scripted scenario of standalone.py if none).")
+    parser.add_argument("--activation-years", type=float, nargs="+", default=[2020])
+    parser.add_argument("--kp", type=float, nargs="+", default=[0.0], help="Kp values, same for both loops.")
+    parser.add_argument("--ki", type=float, nargs="+", default=[0.0], help="Ki values, same for both loops.")
+    parser.add_argument("--kd", type=float, nargs="+", default=[0.0], help="Kd values, same for both loops.")
+    parser.add_argument("--tf", type=float, default=0.0, help="Time constant of the derivative filter [year], 1 recommended at 1 year steps (see PID.py).")
+    parser.add_argument("--initial-time", type=float, default=1995)
+    parser.add_argument("--final-time", type=float, default=2050)
+    parser.add_argument("--time-step", type=float, default=1/32)
+    parser.add_argument("--prices", default=None, help="Path of interp_prices_1995USD_W.csv, stood in by the PyPSA-EUR ratios otherwise.")
+    parser.add_argument("--output", default=None, help="Path of the csv file of the summary.")
+    parser.add_argument("--check", action="store_true", help="Check the recovery of the baseline from yearly results of a closed loop run.")
+    args = parser.parse_args()
+
+    exogenous = ExogenousInputs(pypsa_tables(args.prices), args.initial_time, args.final_time, args.time_step)
+    if args.paths:
+        baselines = [read_baseline(path, exogenous.data["time"]) for path in args.paths]
+        labels = args.paths
+    else:
+        from .standalone import UpstreamScenario
+        baselines = [scenario_baseline(UpstreamScenario(), exogenous.data["time"])]
+        labels = ["standalone"]
+    if args.check:
+        # Yearly "results" of a closed loop run on the first baseline, as saved by MEDEAS, then emulated again from the recovered baseline.
+        run_gains = {"Kp": (0.5, 0.5), "Ki": (0.1, 0.1), "Kd": (0.05, 0.05), "Tf": (0.25, 0.25)}
+        loop = ClosedLoop(baselines[0], exogenous)
+        run = loop.run(**run_gains)
+        times = exogenous.data["time"]
+        yearly = np.isclose(times, np.round(times))
+        delayed = np.concatenate([np.zeros(1), run["curtailment"][:-1, 0]])
+        saved = {name: values[yearly] for name, values in baselines[0].items() if name != "cpini_res_elec"}
+        saved.update({
+            "installed_capacity_res_elec": (baselines[0]["installed_capacity_res_elec"] + run["cumulated_capacity_res_elec"][:, 0])[yearly],
+            "total_capacity_elec_storage_tw": (baselines[0]["total_capacity_elec_storage_tw"] + run["cumulated_storage_feedback"][:, 0])[yearly],
+            "cp_res_elec": (baselines[0]["cpini_res_elec"] / (1 + delayed[:, None]))[yearly],
+            "cumulated_capacity_res_elec": run["cumulated_capacity_res_elec"][yearly, 0],
+            "cumulated_storage_feedback": run["cumulated_storage_feedback"][yearly, 0],
+            "curtailment_delayed": delayed[yearly]})
+        recovered = {name: interpolate(times[yearly], values, times) for name, values in open_loop_baseline(saved).items()}
+        error = max(np.max(np.abs(recovered[name] - baselines[0][name])) for name in BASELINE_VARIABLES)
+        print(f"Max abs difference of the recovered baseline = {error:.1e}")
+        emulated = ClosedLoop(recovered, exogenous).run(**run_gains)
+        error = max(np.max(np.abs(emulated[name] - run[name])) for name in LOOPS + ("cumulated_new_investments_grid",))
+        print(f"Max abs difference of the emulated run (targets, investments) = {error:.1e}\n")
+
+    gains = [{"Kp": kp, "Ki": ki, "Kd": kd, "Tf": args.tf} for kp, ki, kd in itertools.product(args.kp, args.ki, args.kd)]
+
+    start = time.perf_counter()
+    summary, _ = what_if(baselines, exogenous, args.activation_years, gains, labels)
+    elapsed = time.perf_counter() - start
+    with pd.option_context("display.max_rows", 100, "display.max_columns", None, "display.width", 250, "display.precision", 4):
+        print(summary)
+    print(f"\n{len(summary)} scenarios x {exogenous.data.shape[0]} time steps emulated in {elapsed:.2f} s "
+          f"({1e6*elapsed/len(summary)/exogenous.data.shape[0]:.2f} us per scenario and time step).")
+    if args.output is not None:
+        summary.to_csv(args.output, index=False)
+        print(f"Summary saved at {args.output}.")
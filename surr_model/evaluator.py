@@ -0,0 +1,207 @@
+"""
+Surrogate model evaluation implementation within MEDEAS.
+
+This file defines the per time step evaluator of the surrogate models: the 6 features are gathered once per time step,
+and all registered models (MLP & RF, curtailment & load shedding) are scored on this single feature vector.
+The targets components (see targets.py) then read their value from the result of the current time step.
+Optionally, the outputs are cached with the features quantized to a given resolution as key (PredictionCache).
+Optionally, the models are only re-evaluated when the features moved beyond a tolerance since the last evaluation (ChangeTolerance).
+"""
+
+from collections import OrderedDict
+import numpy as np
+
+# Order of the features expected by all surrogate models (see mlp/mlp_curtailment_def.py).
+FEATURE_NAMES = ("cap_ratio", "share_flex", "share_sto", "share_wind", "share_pv", "rNTC")
+# Bounds of the features (training domain of the surrogate models), the features are clipped to them in features.py.
+FEATURE_BOUNDS = ((0.4, 1.3), (0.25, 0.9), (0, 3), (0, 0.55), (0, 0.35), (0, 0.75))
+
+
+def to_dmnl(output):
+    """
+    Conversion of a surrogate output from % to Dmnl [-]. Negative outputs are set at 0.
+    """
+    output = output/100 # %->Dmnl [-]
+    if output < 0:
+        return 0
+    else:
+        return float(output)
+
+def to_dmnl_array(outputs):
+    """
+    Vectorized to_dmnl(): conversion from % to Dmnl [-] of an array of surrogate outputs, negative outputs set at 0.
+    """
+    return np.maximum(np.asarray(outputs, dtype=np.float64)/100, 0) # %->Dmnl [-]
+
+def clip_features(features):
+    """
+    Clip an array of features (..., 6) to FEATURE_BOUNDS, as done in features.py.
+    """
+    lower, upper = np.array(FEATURE_BOUNDS, dtype=np.float64).T
+    return np.clip(features, lower, upper)
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of the surrogate outputs, keyed on the features quantized to a resolution (scalar or one per feature).
+    Two feature vectors falling in the same quantization cell share the same outputs.
+    """
+
+    def __init__(self, resolution=1e-4, max_size=4096):
+        self.resolution = np.asarray(resolution, dtype=np.float64)
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, features):
+        return tuple(np.floor(features / self.resolution + 0.5).astype(np.int64).tolist())
+
+    def get(self, key):
+        outputs = self.entries.get(key)
+        if outputs is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return outputs
+
+    def put(self, key, outputs):
+        self.entries[key] = outputs
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        n_calls = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self.entries),
+                "hit_rate": self.hits / n_calls if n_calls else 0.0}
+
+    def report(self):
+        stats = self.stats()
+        return (f"Surrogate prediction cache: {stats['hits']} hits, {stats['misses']} misses ({100*stats['hit_rate']:.1f}% hit rate), "
+                f"{stats['evictions']} evictions, {stats['size']}/{self.max_size} entries.")
+
+
+class ChangeTolerance:
+    """
+    Event-driven re-evaluation policy: the models are only re-evaluated when a feature moved by more than atol + rtol*|reference|
+    since the last evaluation (reference features), or when max_steps time steps were skipped in a row.
+    atol and rtol are scalars or one value per feature. Otherwise, the outputs of the last evaluation are reused.
+    """
+
+    def __init__(self, atol=0.0, rtol=0.0, max_steps=None):
+        self.atol = np.asarray(atol, dtype=np.float64)
+        self.rtol = np.asarray(rtol, dtype=np.float64)
+        self.max_steps = max_steps
+        self.evaluated = 0
+        self.skipped = 0
+        self.reset()
+
+    def reset(self):
+        self.reference = None
+        self.steps_skipped = 0
+
+    def needs_evaluation(self, features):
+        if (self.reference is None or (self.max_steps is not None and self.steps_skipped >= self.max_steps)
+                or np.any(np.abs(features - self.reference) > self.atol + self.rtol * np.abs(self.reference))):
+            self.reference = features.copy()
+            self.steps_skipped = 0
+            self.evaluated += 1
+            return True
+        self.steps_skipped += 1
+        self.skipped += 1
+        return False
+
+    def report(self):
+        n_steps = self.evaluated + self.skipped
+        return (f"Surrogate re-evaluation: {self.evaluated} evaluated, {self.skipped} skipped time steps "
+                f"({100*self.skipped/n_steps if n_steps else 0:.1f}% skipped, atol={self.atol}, rtol={self.rtol}, max_steps={self.max_steps}).")
+
+
+class SurrogateEvaluator:
+    """
+    Evaluates the surrogate models on the same feature vector, at most once per time step.
+    A model is registered with a predict function taking the raw features (n_samples, 6) and returning the target in %.
+    A registered model becomes active the first time its output is requested, so that models that are never used are never loaded.
+    All active models are then scored together at each new time step, unless the features did not move enough since the
+    last evaluation (ChangeTolerance policy, if given), or a PredictionCache is given and already holds the outputs for these
+    (quantized) features.
+    """
+
+    def __init__(self, cache=None, policy=None):
+        self.models = {}
+        self.active = []
+        self.cache = cache
+        self.policy = policy
+        self.n_evaluations = 0
+        self.started = False
+        self.reset()
+
+    def register(self, name, predict):
+        self.models[name] = predict
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the last evaluated time step (e.g. at the beginning of a new run).
+        """
+        self.time = None
+        self.features = None
+        self.outputs = {}
+        self.started = False
+        if self.policy is not None:
+            self.policy.reset()
+
+    def evaluate(self, time, get_features, initial_time=None):
+        """
+        Returns the outputs (Dmnl) of all active models for the given time step.
+        get_features() is only called when the time step changed since the last evaluation, or at the first call at
+        initial_time (if given), where the evaluator is reset for the new run.
+        """
+        if initial_time is not None:
+            if time != initial_time:
+                self.started = False
+            elif not self.started: # New run.
+                self.reset()
+                self.started = True
+        if time != self.time:
+            features = np.asarray(get_features(), dtype=np.float64).reshape(1, -1)
+            self.time = time
+            if self.policy is not None and not self.policy.needs_evaluation(features[0]):
+                # Features within the tolerance: outputs (and features) of the last evaluation kept.
+                return self.outputs
+            self.features = features[0]
+
+            outputs = None
+            if self.cache is not None:
+                key = self.cache.key(self.features)
+                outputs = self.cache.get(key)
+            if outputs is None:
+                outputs = {name: to_dmnl(self.models[name](features)[0]) for name in self.active}
+                self.n_evaluations += 1
+                if self.cache is not None:
+                    self.cache.put(key, outputs)
+            self.outputs = outputs
+        return self.outputs
+
+    def output(self, name, time, get_features, initial_time=None):
+        """
+        Output (Dmnl) of a single model for the given time step. The model is activated if needed.
+        """
+        if name not in self.models:
+            raise KeyError(f"Surrogate model {name} is not registered.")
+        outputs = self.evaluate(time, get_features, initial_time)
+        if name not in outputs:
+            # Model activated at this time step, or cached outputs computed before its activation.
+            # It only becomes active once its prediction succeeded (e.g. its artifact could be loaded).
+            output = to_dmnl(self.models[name](self.features.reshape(1, -1))[0])
+            if name not in self.active:
+                self.active.append(name)
+            outputs[name] = output
+        return outputs[name]
@@ -0,0 +1,129 @@
+"""
+Exogenous inputs implementation within MEDEAS.
+
+This file defines the precomputation of the time-only inputs of the surrogate model components: share_flex (closed-form
+function of time), and the yearly PyPSA-EUR data (rNTC and its investments, rNTC/TW ratio, investment shares, prices).
+At the initialization of a run, they are materialized once over the whole simulation horizon (1995-2050), at the native
+time step of the simulation, into one NumPy structured array. Each component then only indexes the row of the time step.
+As with df.loc[round(time())], the yearly data are constant over each rounded year, unless they are listed in interpolated,
+in which case they are linearly interpolated between the years at the sub-annual time steps.
+"""
+
+import os
+from functools import lru_cache
+import numpy as np
+
+from .feature_engine import share_flex
+from .year_tables import YearTable
+
+# Tolerance [year] on the time of a step to be found in the precomputed array.
+TIME_TOLERANCE = 1e-9
+
+
+@lru_cache(maxsize=None)
+def load_tables(file_directory):
+    """
+    Yearly tables of the exogenous inputs, read once per model directory (file_directory of features.py & investments.py)
+    by whichever file asks first: rNTC & ratio_rNTC_TW (features.py), tech_shares_ls, tech_shares_curt & prices_1995USD_W
+    (investments.py, the prices file being in pymedeas2_models/).
+    """
+    pypsa_directory = os.path.join(file_directory, "modules_pymedeas_eu", "surr_model", "pypsa")
+    return {
+        "rNTC": YearTable.from_csv(os.path.join(pypsa_directory, "rNTC", "interp_rNTC.csv")),
+        "ratio_rNTC_TW": YearTable.from_csv(os.path.join(pypsa_directory, "rNTC", "ratio_rNTC_TW.csv")),
+        "tech_shares_ls": YearTable.from_csv(os.path.join(pypsa_directory, "capa and invest", "interp_tech_shares_ls.csv")),
+        "tech_shares_curt": YearTable.from_csv(os.path.join(pypsa_directory, "capa and invest", "interp_tech_shares_curt.csv")),
+        "prices_1995USD_W": YearTable.from_csv(os.path.join(file_directory, "..", "..", "interp_prices_1995USD_W.csv")),
+    }
+
+
+class ExogenousInputs:
+    """
+    Time-only inputs at each time step of [initial_time, final_time], in the structured array data with fields:
+        time, share_flex [Dmnl], pypsa_rNTC [Dmnl], rNTC_investments [T$], ratio_rNTC_TW [1/TW],
+        shares_ls (columns of tech_shares_ls), shares_curt (columns of tech_shares_curt), prices (columns of prices_1995USD_W) [$/W].
+    The named column indices of the subarrays are the ones of the tables (e.g. tables["prices_1995USD_W"].index).
+    """
+
+    def __init__(self, tables, initial_time=1995, final_time=2050, time_step=1/32, interpolated=()):
+        self.tables = tables
+        self.initial_time = float(initial_time)
+        self.final_time = float(final_time)
+        self.time_step = float(time_step)
+        self.interpolated = tuple(interpolated)
+        self.dtype = np.dtype([
+            ("time", np.float64),
+            ("share_flex", np.float64),
+            ("pypsa_rNTC", np.float64),
+            ("rNTC_investments", np.float64),
+            ("ratio_rNTC_TW", np.float64),
+            ("shares_ls", np.float64, (len(tables["tech_shares_ls"].columns),)),
+            ("shares_curt", np.float64, (len(tables["tech_shares_curt"].columns),)),
+            ("prices", np.float64, (len(tables["prices_1995USD_W"].columns),)),
+        ])
+        n_steps = int(round((self.final_time - self.initial_time) / self.time_step)) + 1
+        self.data = self.compute(self.initial_time + self.time_step * np.arange(n_steps))
+
+    def yearly(self, name, times):
+        """
+        Rows of a yearly table at the given times, constant over each rounded year or linearly interpolated.
+        """
+        table = self.tables[name]
+        years = np.arange(table.first_year, table.first_year + table.values.shape[0])
+        if name in self.interpolated:
+            return np.column_stack([np.interp(times, years, column) for column in table.values.T])
+        return table.values[[table.offset(time) for time in times]]
+
+    def compute(self, times):
+        times = np.asarray(times, dtype=np.float64)
+        data = np.empty(times.shape[0], dtype=self.dtype)
+        data["time"] = times
+        data["share_flex"] = share_flex(times)
+        rNTC = self.yearly("rNTC", times)
+        data["pypsa_rNTC"] = rNTC[:, self.tables["rNTC"].index["rNTC"]]
+        data["rNTC_investments"] = rNTC[:, self.tables["rNTC"].index["Investments [1995-USD]"]]/1e12 # T$
+        data["ratio_rNTC_TW"] = self.yearly("ratio_rNTC_TW", times)[:, self.tables["ratio_rNTC_TW"].index["Ratio"]]
+        data["shares_ls"] = self.yearly("tech_shares_ls", times)
+        data["shares_curt"] = self.yearly("tech_shares_curt", times)
+        data["prices"] = self.yearly("prices_1995USD_W", times)
+        return data
+
+    def matches(self, initial_time, final_time, time_step):
+        return (self.initial_time, self.final_time, self.time_step) == (float(initial_time), float(final_time), float(time_step))
+
+    def row(self, time):
+        """
+        Record of the time step. Times between the precomputed steps (e.g. delayed evaluations) are computed on the fly.
+        """
+        index = int(round((time - self.initial_time) / self.time_step))
+        if 0 <= index < self.data.shape[0] and abs(self.data["time"][index] - time) <= TIME_TOLERANCE:
+            return self.data[index]
+        return self.compute([time])[0]
+
+
+if __name__ == "__main__":
+    # Check: precomputed rows against the per step lookups, over 1995-2050 at the native time step and off the grid.
+    # The prices file is not part of this repository, the rNTC table stands for it in this check.
+    pypsa_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pypsa")
+    tables = {
+        "rNTC": YearTable.from_csv(os.path.join(pypsa_directory, "rNTC", "interp_rNTC.csv")),
+        "ratio_rNTC_TW": YearTable.from_csv(os.path.join(pypsa_directory, "rNTC", "ratio_rNTC_TW.csv")),
+        "tech_shares_ls": YearTable.from_csv(os.path.join(pypsa_directory, "capa and invest", "interp_tech_shares_ls.csv")),
+        "tech_shares_curt": YearTable.from_csv(os.path.join(pypsa_directory, "capa and invest", "interp_tech_shares_curt.csv")),
+    }
+    tables["prices_1995USD_W"] = tables["rNTC"]
+    exogenous = ExogenousInputs(tables, 1995, 2050, 1/32)
+    print(f"Exogenous inputs: {exogenous.data.shape[0]} time steps, {exogenous.data.nbytes/1e3:.1f} kB")
+
+    max_error = 0.0
+    for time in list(exogenous.data["time"]) + [1995.0325, 2020.51, 2049.9]:
+        row = exogenous.row(time)
+        expected = [share_flex(time), tables["rNTC"].get(time, "rNTC"), tables["rNTC"].get(time, "Investments [1995-USD]")/1e12,
+                    tables["ratio_rNTC_TW"].get(time, "Ratio")]
+        max_error = max(max_error, np.max(np.abs(np.array([row["share_flex"], row["pypsa_rNTC"], row["rNTC_investments"], row["ratio_rNTC_TW"]]) - expected)),
+                        np.max(np.abs(row["shares_ls"] - tables["tech_shares_ls"].row(time))),
+                        np.max(np.abs(row["shares_curt"] - tables["tech_shares_curt"].row(time))))
+    print(f"Max abs difference with the per step lookups = {max_error:.1e}")
+
+    interpolated = ExogenousInputs(tables, 1995, 2050, 1/4, interpolated=("rNTC",))
+    print(f"Interpolated pypsa_rNTC over 2020 (1/4 year step): {interpolated.data['pypsa_rNTC'][100:105]}")
@@ -0,0 +1,130 @@
+"""
+Feature engine implementation within MEDEAS.
+
+This file defines the computation of the 6 features of the surrogate models (cap_ratio, share_flex, share_sto, share_wind,
+share_pv, rNTC) from the MEDEAS arrays, as one NumPy expression instead of one component per feature.
+All inputs are broadcast together, so that the same function computes the features of a single time step (scalars and
+1D subscripted arrays) or of a stacked batch of time steps and scenarios (arrays of shape (..., n) with the subscripts last).
+See features.py for the definition of each feature.
+"""
+
+import numpy as np
+
+from .evaluator import FEATURE_NAMES, clip_features
+
+# Order of the subscripts expected in the last dimension of the subscripted inputs (as in the MEDEAS netCDF results).
+RES_COLUMNS = ("hydro", "geot_elec", "solid_bioE_elec", "oceanic", "wind_onshore", "wind_offshore", "solar_PV", "CSP")
+FOSSIL_COLUMNS = ("liquids", "gases", "solids")
+
+# RES technologies counted in the capacity ratio (flexible and slow units, i.e. not wind & PV).
+CAP_RATIO_RES = ("geot_elec", "solid_bioE_elec", "hydro", "oceanic", "CSP")
+# Capacity factors of the fossil power plants (liquids, gases, solids), see https://www.eia.gov/todayinenergy/detail.php?id=22832.
+FOSSIL_CAPACITY_FACTORS = (0.19, 0.39, 0.51)
+HOURS_PER_YEAR = 365*24
+# Ratio between the mean and the peak load, from Eq. (4.3) in Romain Cloux's thesis.
+LOAD_FACTOR = 0.736
+# Linear share_flex: 0.251 in 1995 and 0.41 in 2019 (Romain Cloux's thesis, Table 3.1).
+SHARE_FLEX_SLOPE = (0.41-0.251)/(2019-1995)
+SHARE_FLEX_ORIGIN = 0.41 - SHARE_FLEX_SLOPE * (2019 - 1995)
+
+_CAP_RATIO_RES = [RES_COLUMNS.index(name) for name in CAP_RATIO_RES]
+_WIND = [RES_COLUMNS.index("wind_onshore"), RES_COLUMNS.index("wind_offshore")]
+_PV = RES_COLUMNS.index("solar_PV")
+
+
+def peak_load(total_fe_elec_demand_twh):
+    """
+    Peak load [TW] from the total FE Elec demand [TWh].
+    """
+    return np.asarray(total_fe_elec_demand_twh, dtype=np.float64)/HOURS_PER_YEAR/LOAD_FACTOR
+
+def share_flex(time):
+    """
+    Share flex (time-only feature): linear between 0.251 in 1995 and 0.41 in 2019.
+    """
+    return SHARE_FLEX_SLOPE * (np.asarray(time, dtype=np.float64) - 1995) + SHARE_FLEX_ORIGIN
+
+def compute_features(time, res_capacity, res_cp, fossil_generation, nuclear_generation, cp_nuclear, storage_capacity,
+                     peak_load, pypsa_rNTC, add_rNTC, share_flex_value=None):
+    """
+    Raw (unclipped) features, array of shape (..., 6) ordered as FEATURE_NAMES.
+        time: year,
+        res_capacity: installed_capacity_res_elec [TW], shape (..., 8) ordered as RES_COLUMNS,
+        res_cp: cp_res_elec [Dmnl], shape (..., 8) ordered as RES_COLUMNS,
+        fossil_generation: fe_elec_generation_from_fossil_fuels [TWh], shape (..., 3) ordered as FOSSIL_COLUMNS,
+        nuclear_generation: fe_nuclear_elec_generation_twh [TWh], cp_nuclear [Dmnl],
+        storage_capacity: total_capacity_elec_storage_tw [TW], peak_load [TW],
+        pypsa_rNTC: rNTC from PyPSA-EUR for the year, add_rNTC: cumulated_add_rNTC_feedback [Dmnl],
+        share_flex_value: share flex if already known (e.g. precomputed, see exogenous.py), computed from time otherwise.
+    """
+    res_capacity = np.asarray(res_capacity, dtype=np.float64)
+    res_cp = np.asarray(res_cp, dtype=np.float64)
+    fossil_generation = np.asarray(fossil_generation, dtype=np.float64)
+    peak_load = np.asarray(peak_load, dtype=np.float64)
+
+    cap_installed = (fossil_generation / (np.array(FOSSIL_CAPACITY_FACTORS) * HOURS_PER_YEAR)).sum(axis=-1) # TW
+    cap_installed = cap_installed + np.asarray(nuclear_generation) / (np.asarray(cp_nuclear) * HOURS_PER_YEAR) # TW
+    cap_installed = cap_installed + res_capacity[..., _CAP_RATIO_RES].sum(axis=-1) # TW
+    generation = res_capacity * res_cp # TW
+
+    features = np.broadcast_arrays(
+        cap_installed / peak_load,
+        share_flex(time) if share_flex_value is None else np.asarray(share_flex_value, dtype=np.float64),
+        np.asarray(storage_capacity) / peak_load,
+        generation[..., _WIND].sum(axis=-1) / peak_load / LOAD_FACTOR,
+        generation[..., _PV] / peak_load / LOAD_FACTOR,
+        np.asarray(pypsa_rNTC) + np.asarray(add_rNTC),
+    )
+    return np.stack(features, axis=-1)
+
+def feature_engine(*args, **kwargs):
+    """
+    Raw and clipped features (see compute_features() for the arguments), both of shape (..., 6).
+    """
+    raw = compute_features(*args, **kwargs)
+    return raw, clip_features(raw)
+
+
+if __name__ == "__main__":
+    # Check: a batch of (scenarios, time steps) gives the same features as the scalar formulas of features.py, step by step.
+    rng = np.random.default_rng(0)
+    n_scenarios, n_steps = 4, 50
+    shape = (n_scenarios, n_steps)
+    time = np.broadcast_to(1995 + np.arange(n_steps) / 32, shape)
+    inputs = dict(
+        time=time,
+        res_capacity=rng.random(shape + (len(RES_COLUMNS),)) * 0.2,
+        res_cp=rng.random(shape + (len(RES_COLUMNS),)) * 0.5,
+        fossil_generation=rng.random(shape + (len(FOSSIL_COLUMNS),)) * 1000,
+        nuclear_generation=rng.random(shape) * 800,
+        cp_nuclear=0.8 + rng.random(shape) * 0.1,
+        storage_capacity=rng.random(shape) * 0.5,
+        peak_load=peak_load(2500 + rng.random(shape) * 1000),
+        pypsa_rNTC=rng.random(shape) * 0.5,
+        add_rNTC=rng.random(shape) * 0.2,
+    )
+    raw, clipped = feature_engine(**inputs)
+
+    max_error = 0.0
+    for i, j in np.ndindex(*shape):
+        step = {name: value[i, j] for name, value in inputs.items()}
+        capacity = dict(zip(RES_COLUMNS, step["res_capacity"]))
+        cp = dict(zip(RES_COLUMNS, step["res_cp"]))
+        fossil = dict(zip(FOSSIL_COLUMNS, step["fossil_generation"]))
+        cap_installed_tot = (fossil["liquids"]/(0.19 * 365*24) + fossil["gases"]/(0.39 * 365*24) + fossil["solids"]/(0.51 * 365*24)
+                             + step["nuclear_generation"]/(step["cp_nuclear"] * 365*24) + capacity["geot_elec"] + capacity["solid_bioE_elec"]
+                             + capacity["hydro"] + capacity["oceanic"] + capacity["CSP"])
+        slope = (0.41-0.251)/(2019-1995)
+        expected = (
+            cap_installed_tot/step["peak_load"],
+            slope * (step["time"] - 1995) + 0.41 - slope * (2019 - 1995),
+            step["storage_capacity"]/step["peak_load"],
+            (capacity["wind_onshore"]*cp["wind_onshore"])/step["peak_load"]/0.736 + (capacity["wind_offshore"]*cp["wind_offshore"])/step["peak_load"]/0.736,
+            capacity["solar_PV"]*cp["solar_PV"]/step["peak_load"]/0.736,
+            step["pypsa_rNTC"] + step["add_rNTC"],
+        )
+        max_error = max(max_error, np.max(np.abs(raw[i, j] - np.array(expected))))
+        single_raw, _ = feature_engine(**step)
+        max_error = max(max_error, np.max(np.abs(single_raw - raw[i, j])))
+    print(f"Feature engine: batch {raw.shape}, max abs difference with the scalar formulas = {max_error:.2e}")
+    print(f"Clipped features: {100*np.mean(raw != clipped):.1f}% of the values out of bounds ({', '.join(FEATURE_NAMES)}).")
@@ -0,0 +1,334 @@
+"""
+Surrogate model inference implementation within MEDEAS.
+
+This file defines pure NumPy evaluators of the surrogate models (curtailment & load shedding):
+    - FusedMLP: forward pass of the MLP models. The MinMax scaling of the features (scaler_X) is folded into the
+    first layer and the inverse scaling of the target (scaler_y) into the last layer, so that a prediction only
+    consists of a few matrix products.
+    - FlatForest: the trees of the RF models flattened into contiguous node arrays, traversed for all trees
+    (and all rows) at once.
+Both avoid the sklearn input validation that runs at each call of scaler.transform() and predict().
+Both can also run in float32 (astype()), for a lower memory bandwidth in batched evaluations. Since the targets are
+percentages, divided by 100 and clamped at 0, the float32 mode is only enabled after an accuracy gate against float64
+over the training dataset (see artifacts.ModelRegistry.reduced_precision()).
+"""
+
+import os
+import numpy as np
+
+file_directory = os.path.dirname(os.path.abspath(__file__))
+mlp_directory = os.path.join(file_directory, "mlp")
+
+# Maximum absolute error [%] of the float32 mode against float64 accepted by the accuracy gate.
+FLOAT32_MAX_ERROR = 1e-3
+
+
+def _relu(z):
+    return np.maximum(z, 0, out=z)
+
+def _logistic(z):
+    return 1/(1 + np.exp(-z))
+
+# Same hidden activations as sklearn.neural_network._base.ACTIVATIONS.
+ACTIVATIONS = {
+    "identity": lambda z: z,
+    "relu": _relu,
+    "tanh": np.tanh,
+    "logistic": _logistic,
+}
+# Derivatives of the activations, as functions of the activated values a (see sklearn.neural_network._base.DERIVATIVES).
+DERIVATIVES = {
+    "identity": lambda a: np.ones_like(a),
+    "relu": lambda a: (a > 0).astype(a.dtype),
+    "tanh": lambda a: 1 - a**2,
+    "logistic": lambda a: a * (1 - a),
+}
+
+
+class FusedMLP:
+    """
+    Multi Layer Perceptron built from the weights (coefs_, intercepts_) of a fitted sklearn MLPRegressor.
+    When the scalers are given to from_sklearn(), predict() takes the raw features and directly returns the target
+    in its physical unit (% for both curtailment and load shedding).
+    """
+
+    def __init__(self, coefs, intercepts, activation="relu", dtype=np.float64):
+        if activation not in ACTIVATIONS:
+            raise ValueError(f"Unsupported activation function: {activation}.")
+        self.dtype = np.dtype(dtype)
+        self.coefs = [np.ascontiguousarray(W, dtype=self.dtype) for W in coefs]
+        self.intercepts = [np.ascontiguousarray(b, dtype=self.dtype) for b in intercepts]
+        self.activation = activation
+        self._activation = ACTIVATIONS[activation]
+
+    @classmethod
+    def from_sklearn(cls, model, scaler_X=None, scaler_y=None):
+        """
+        Read the layers of a fitted MLPRegressor and fold the MinMax scalers into them.
+        """
+        if model.out_activation_ != "identity":
+            raise ValueError(f"Only regressors can be fused (output activation is {model.out_activation_}).")
+
+        coefs = [np.array(W, dtype=np.float64) for W in model.coefs_]
+        intercepts = [np.array(b, dtype=np.float64) for b in model.intercepts_]
+
+        if scaler_X is not None:
+            if getattr(scaler_X, "clip", False):
+                raise ValueError("A MinMaxScaler with clip=True can not be folded into the first layer.")
+            # x_sc = x*scale + min, thus x_sc @ W + b = x @ (scale*W) + (min @ W + b)
+            intercepts[0] = scaler_X.min_ @ coefs[0] + intercepts[0]
+            coefs[0] = scaler_X.scale_[:, None] * coefs[0]
+
+        if scaler_y is not None:
+            # y = (y_sc - min)/scale
+            coefs[-1] = coefs[-1] / scaler_y.scale_
+            intercepts[-1] = (intercepts[-1] - scaler_y.min_) / scaler_y.scale_
+
+        return cls(coefs, intercepts, model.activation)
+
+    def to_arrays(self):
+        """
+        Flat representation of the network: scalar parameters and named arrays (see artifacts.py).
+        """
+        arrays = {}
+        for i, (W, b) in enumerate(zip(self.coefs, self.intercepts)):
+            arrays[f"coef_{i}"] = W
+            arrays[f"intercept_{i}"] = b
+        return {"activation": self.activation, "n_layers": len(self.coefs)}, arrays
+
+    @classmethod
+    def from_arrays(cls, params, arrays):
+        n_layers = params["n_layers"]
+        return cls([arrays[f"coef_{i}"] for i in range(n_layers)], [arrays[f"intercept_{i}"] for i in range(n_layers)],
+                   params["activation"], arrays["coef_0"].dtype)
+
+    def astype(self, dtype):
+        """
+        Copy of the network with weights (and computations) in the given precision.
+        """
+        return FusedMLP(self.coefs, self.intercepts, self.activation, dtype)
+
+    @property
+    def n_features(self):
+        return self.coefs[0].shape[0]
+
+    def predict(self, X):
+        """
+        Forward pass for a batch of features X (n_samples, n_features). A single row (n_features,) is also accepted.
+        Returns an array of shape (n_samples,), as MLPRegressor.predict() does for a single target.
+        """
+        h = np.asarray(X, dtype=self.dtype)
+        if h.ndim == 1:
+            h = h.reshape(1, -1)
+
+        for W, b in zip(self.coefs[:-1], self.intercepts[:-1]):
+            h = h @ W
+            h += b
+            h = self._activation(h)
+        out = h @ self.coefs[-1]
+        out += self.intercepts[-1]
+
+        if out.shape[1] == 1:
+            return out.ravel()
+        return out
+
+    def predict_one(self, x):
+        """
+        Prediction of a single row of features, returned as a float.
+        """
+        return float(self.predict(x)[0])
+
+    def gradient(self, X):
+        """
+        Exact gradient of the (single) output with respect to the features, by one backward pass through the layers.
+        With the scalers folded (see from_sklearn()), it is in physical units: % per unit of each raw feature.
+        Returns the outputs (n_samples,) and the gradients (n_samples, n_features). A single row (n_features,) is also accepted.
+        """
+        h = np.asarray(X, dtype=self.dtype)
+        if h.ndim == 1:
+            h = h.reshape(1, -1)
+
+        derivatives = []
+        for W, b in zip(self.coefs[:-1], self.intercepts[:-1]):
+            h = h @ W
+            h += b
+            h = self._activation(h)
+            derivatives.append(DERIVATIVES[self.activation](h))
+        out = (h @ self.coefs[-1] + self.intercepts[-1])[:, 0]
+
+        # Backward pass: d(out)/d(h_k) = (d(out)/d(h_k+1) * f'(z_k+1)) @ W_k+1.T
+        grad = np.broadcast_to(self.coefs[-1][:, 0], h.shape)
+        for W, derivative in zip(reversed(self.coefs[:-1]), reversed(derivatives)):
+            grad = (grad * derivative) @ W.T
+        return out, grad
+
+
+class FlatForest:
+    """
+    Random Forest regressor whose trees are flattened into contiguous node arrays (feature, threshold, left, right, value).
+    Leaves point to themselves, so that a row can be moved down all trees at once during max_depth iterations.
+    The inverse scaling of the target is folded into the leaf values, while the MinMax scaling of the features is kept
+    explicit: sklearn compares the scaled features in float32 to the thresholds, which is reproduced here.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, scale=None, offset=None, dtype=np.float64):
+        self.dtype = np.dtype(dtype)
+        self.feature = np.ascontiguousarray(feature, dtype=np.intp)
+        self.threshold = np.ascontiguousarray(threshold, dtype=self.dtype)
+        self.left = np.ascontiguousarray(left, dtype=np.intp)
+        self.right = np.ascontiguousarray(right, dtype=np.intp)
+        self.value = np.ascontiguousarray(value, dtype=self.dtype)
+        self.roots = np.ascontiguousarray(roots, dtype=np.intp)
+        self.max_depth = int(max_depth)
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float64)
+        self.offset = None if offset is None else np.asarray(offset, dtype=np.float64)
+
+    @classmethod
+    def from_sklearn(cls, model, scaler_X=None, scaler_y=None):
+        """
+        Flatten the trees of a fitted RandomForestRegressor (single target) and fold scaler_y into the leaf values.
+        """
+        if model.n_outputs_ != 1:
+            raise ValueError(f"Only single target forests can be flattened ({model.n_outputs_} targets).")
+
+        feature, threshold, left, right, value, roots = [], [], [], [], [], []
+        n_nodes = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            nodes = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(np.where(is_leaf, 0, tree.threshold))
+            left.append(np.where(is_leaf, nodes, tree.children_left) + n_nodes)
+            right.append(np.where(is_leaf, nodes, tree.children_right) + n_nodes)
+            value.append(tree.value[:, 0, 0])
+            roots.append(n_nodes)
+            n_nodes += tree.node_count
+
+        value = np.concatenate(value)
+        if scaler_y is not None:
+            value = (value - scaler_y.min_[0]) / scaler_y.scale_[0]
+
+        max_depth = max(estimator.tree_.max_depth for estimator in model.estimators_)
+        scale, offset = (None, None) if scaler_X is None else (scaler_X.scale_, scaler_X.min_)
+        return cls(np.concatenate(feature), np.concatenate(threshold), np.concatenate(left), np.concatenate(right),
+                   value, roots, max_depth, scale, offset)
+
+    def to_arrays(self):
+        """
+        Flat representation of the forest: scalar parameters and named arrays (see artifacts.py).
+        """
+        arrays = {"feature": self.feature, "threshold": self.threshold, "left": self.left, "right": self.right,
+                  "value": self.value, "roots": self.roots}
+        if self.scale is not None:
+            arrays["scale"] = self.scale
+            arrays["offset"] = self.offset
+        return {"max_depth": self.max_depth}, arrays
+
+    @classmethod
+    def from_arrays(cls, params, arrays):
+        return cls(arrays["feature"], arrays["threshold"], arrays["left"], arrays["right"], arrays["value"],
+                   arrays["roots"], params["max_depth"], arrays.get("scale"), arrays.get("offset"), arrays["value"].dtype)
+
+    def astype(self, dtype):
+        """
+        Copy of the forest with thresholds and leaf values in the given precision.
+        In float32, the thresholds are rounded, which can flip a comparison for features lying right at a split.
+        """
+        return FlatForest(self.feature, self.threshold, self.left, self.right, self.value, self.roots, self.max_depth,
+                          self.scale, self.offset, dtype)
+
+    @property
+    def n_trees(self):
+        return self.roots.shape[0]
+
+    @property
+    def n_nodes(self):
+        return self.feature.shape[0]
+
+    def predict(self, X):
+        """
+        Prediction for a batch of features X (n_samples, n_features). A single row (n_features,) is also accepted.
+        Returns an array of shape (n_samples,), as RandomForestRegressor.predict() does for a single target.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if self.scale is not None:
+            X = X * self.scale + self.offset
+        X = X.astype(np.float32) # sklearn trees work on float32 features.
+
+        rows = np.arange(X.shape[0])[:, None]
+        nodes = np.tile(self.roots, (X.shape[0], 1))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        return self.value[nodes].mean(axis=1)
+
+    def predict_one(self, x):
+        """
+        Prediction of a single row of features, returned as a float.
+        """
+        return float(self.predict(x)[0])
+
+
+def training_features():
+    """
+    Features of the training dataset (mlp/dataset.csv, GAMS_error filtered as in mlp_curtailment_def.py).
+    """
+    import pandas as pd
+
+    df = pd.read_csv(os.path.join(mlp_directory, "dataset.csv"))
+    df_filtered = df[df['GAMS_error'] != 2]
+    return df_filtered[['CapacityRatio', 'ShareFlex', 'ShareStorage', 'ShareWind', 'SharePV', 'rNTC']].values
+
+def precision_error(reference, candidate, X=None):
+    """
+    Maximum absolute difference [%] between two evaluators of the same model (e.g. float64 and float32) over X (training features by default).
+    """
+    X = training_features() if X is None else X
+    return float(np.max(np.abs(candidate.predict(X).astype(np.float64) - reference.predict(X))))
+
+
+def sklearn_predict(model, scaler_X, scaler_y, X):
+    """
+    Reference prediction, as computed in targets.py: scaler_X.transform -> model.predict -> scaler_y.inverse_transform.
+    """
+    output_scaled = model.predict(scaler_X.transform(X))
+    return scaler_y.inverse_transform(output_scaled.reshape(-1, 1)).flatten()
+
+def compare_to_sklearn(evaluator, model, scaler_X, scaler_y, X):
+    """
+    Maximum absolute difference between a NumPy evaluator (FusedMLP or FlatForest) and the sklearn pipeline over the features X.
+    """
+    return float(np.max(np.abs(evaluator.predict(X) - sklearn_predict(model, scaler_X, scaler_y, X))))
+
+
+if __name__ == "__main__":
+    # Check the NumPy evaluators against the shipped sklearn models, over the training dataset.
+    import joblib
+
+    X = training_features()
+
+    for model_name, suffix in (("mlp_curtailment.pkl", "curt"), ("mlp_loadshedding_oversamp.pkl", "ls")):
+        model = joblib.load(os.path.join(mlp_directory, model_name))
+        scaler_X = joblib.load(os.path.join(mlp_directory, f"mlp_scaler_X_{suffix}.pkl"))
+        scaler_y = joblib.load(os.path.join(mlp_directory, f"mlp_scaler_y_{suffix}.pkl"))
+        fused = FusedMLP.from_sklearn(model, scaler_X, scaler_y)
+        print(f"{model_name}: max abs error = {compare_to_sklearn(fused, model, scaler_X, scaler_y, X):.3e} %")
+
+    for model_name, suffix in (("rf_curtailment.pkl", "curt"), ("rf_loadshedding.pkl", "ls")):
+        model_path = os.path.join(mlp_directory, model_name)
+        if not os.path.exists(model_path):
+            print(f"{model_name}: not found, skipped.")
+            continue
+        model = joblib.load(model_path)
+        scaler_X = joblib.load(os.path.join(mlp_directory, f"mlp_scaler_X_{suffix}.pkl"))
+        scaler_y = joblib.load(os.path.join(mlp_directory, f"mlp_scaler_y_{suffix}.pkl"))
+        forest = FlatForest.from_sklearn(model, scaler_X, scaler_y)
+        # Equivalence with RandomForestRegressor.predict, row by row and in batch.
+        error_batch = compare_to_sklearn(forest, model, scaler_X, scaler_y, X)
+        error_rows = max(abs(forest.predict_one(x) - sklearn_predict(model, scaler_X, scaler_y, x.reshape(1, -1))[0]) for x in X[:200])
+        print(f"{model_name}: {forest.n_trees} trees, {forest.n_nodes} nodes, max abs error = {max(error_batch, error_rows):.3e} %")
@@ -7,41 +7,80 @@ November 2024
 This file defines all variables linked to the new grid invstments definition and the PID control of both surrogate model targets (curtailment & load shedding).  
 """
 
-import pandas as pd 
 import os
-from models.europe.modules_pymedeas_eu.surr_model.PID import PID
+from models.europe.modules_pymedeas_eu.surr_model.PID import MEASUREMENT_DELAY, PIDBank, delayed_measurement
+from models.europe.modules_pymedeas_eu.surr_model.profiler import component_profiler
+from models.europe.modules_pymedeas_eu.surr_model.exogenous import load_tables
 file_directory = os.path.dirname(os.path.abspath(__file__))
 
-# Import the dataframes
-df_tech_shares_ls = pd.read_csv(file_directory+r"\modules_pymedeas_eu\surr_model\pypsa\capa and invest\interp_tech_shares_ls.csv", index_col='Year') 
-df_tech_shares_curt = pd.read_csv(file_directory+r"\modules_pymedeas_eu\surr_model\pypsa\capa and invest\interp_tech_shares_curt.csv", index_col='Year') 
+# Import the yearly data (NumPy arrays indexed by year offset from 1995, see year_tables.py), shared with features.py.
+table_tech_shares_ls = load_tables(file_directory)["tech_shares_ls"]
+table_tech_shares_curt = load_tables(file_directory)["tech_shares_curt"]
 
-df_prices_1995USD_W = pd.read_csv(r"C:\Users\noedi\OneDrive - Universite de Liege\Ordi - Bureau\Ordi - ULG\TFE\master-thesis_DIFFELS\pymedeas2_models\interp_prices_1995USD_W.csv", index_col="Year") 
-df_ratios_rNTC_TW = pd.read_csv(file_directory+r"\modules_pymedeas_eu\surr_model\pypsa\rNTC\ratio_rNTC_TW.csv", index_col='Year') 
-df_rNTC = pd.read_csv(file_directory+r"\modules_pymedeas_eu\surr_model\pypsa\rNTC\interp_rNTC.csv", index_col="Year")
+# Year,Solar,ROR,Wind (Onshore),Wind (Offshore),AC Lines,DC Lines,Distrib Grid,PHS,Hydro,Battery, in pymedeas2_models/
+table_prices_1995USD_W = load_tables(file_directory)["prices_1995USD_W"]
 # df_exchange_rates =  pd.read_csv(file_directory+r"\modules_pymedeas_eu\surr_model\pypsa\capa and invest\usd_conversion\output\exchange_rates.csv", index_col="Year")
 
-@component.add(
+# Named column indices of the tables, e.g. upstream_cache(exogenous_step)["prices"][PRICES["ROR"]]
+SHARES_LS = table_tech_shares_ls.index
+SHARES_CURT = table_tech_shares_curt.index
+PRICES = table_prices_1995USD_W.index
+GRID_PRICES = table_prices_1995USD_W.indices(["AC Lines", "DC Lines", "Distrib Grid"])
+STORAGE_PRICES = table_prices_1995USD_W.indices(["PHS", "Hydro", "Battery"])
+
+# PID controllers of the load shedding & curtailment loops, with independent states, reset at the initial time of a run (see PID.py).
+# Gains: previously Kp=1e-16 for load shedding, and Kp=1 (former res) or 0.01 (new res, no outbounds) for curtailment.
+# Curtailment, BAU: il faut mettre 0.35 je pense, à verif
+# Tf: time constant [year] of the derivative filter. Tf=0 gives the raw backward difference of the thesis; at coarser time steps,
+# Tf=DERIVATIVE_TIME_CONSTANT (see PID.py) keeps the derivative term bounded and consistent up to 1 year steps.
+grid_controllers = PIDBank(("load_shedding", "curtailment"), Kp=(0, 0), Ki=(0, 0), Kd=(0, 0), setpoint=0, Tf=(0, 0))
+# As in the thesis, the controllers measure the targets delayed of controllers_measurement_delay [year], i.e. load_shedding_delayed &
+# curtailment_delayed at 1/32 year steps, interpolated with the current targets at coarser steps so that the lag does not grow
+# with the step. Set to False to measure the targets of the current time step instead.
+controllers_measure_delayed_targets = True
+controllers_measurement_delay = MEASUREMENT_DELAY
+
+# Opt-in profiling of the components of this file, enabled by the environment variable SURR_MODEL_PROFILE (see profiler.py).
+surr_component = component_profiler.wrap_component(component, clock=lambda: time())
+
+def step_grid_controllers():
+    """
+    Outputs u(t) [T$/year] of both controllers, advanced together to the current time step (reset at the initial time).
+    Called through upstream_cache, i.e. once per time step, and read by the 2 investments components below, which are
+    themselves read by the new capacities components and the integrators. Both list all the upstream components read here.
+    """
+    initial = time() == initial_time()
+    if initial:
+        grid_controllers.reset()
+    measurements = [float(load_shedding()), float(curtailment())]
+    if controllers_measure_delayed_targets:
+        delayed = [float(load_shedding_delayed()), float(curtailment_delayed())]
+        measurements = [delayed_measurement(current, previous, time_step(), controllers_measurement_delay, initial)
+                        for current, previous in zip(measurements, delayed)]
+    outputs = grid_controllers.step(float(time()), measurements, time_step=time_step())
+    return dict(zip(grid_controllers.names, outputs.tolist()))
+
+@surr_component.add(
     name="Grid Investments - Load Shedding control",
     units="T$",
     comp_type="Auxiliary",
     comp_subtype="Normal",
-    depends_on={"time": 1, 
-                "load_shedding_delayed": 1},
+    depends_on={"time": 1,
+                "initial_time": 1,
+                "time_step": 1,
+                "load_shedding": 1,
+                "curtailment": 1,
+                "load_shedding_delayed": 1,
+                "curtailment_delayed": 1},
 )
 def new_investments_grid_ls():
     """
     New investments required by control feedback, for load shedding.
     """
-
-    if time() == 1995:
-        time_prev = 0
-    else:
-        time_prev = time()-0.03125
-    return PID(0, 0, 0, time(), time_prev, 0, load_shedding_delayed()) # previously (P=1e-16)
+    return upstream_cache(step_grid_controllers)["load_shedding"]
 
 
-@component.add(
+@surr_component.add(
     name="Cumulated Grid Investments - Load shedding control",
     units="T$",
     comp_type="Stateful",
@@ -66,28 +105,26 @@ _integ_cumulated_new_investments_grid_ls = Integ(
 )
 
 
-@component.add(
+@surr_component.add(
     name="Grid Investments - Curtailment control",
     units="T$",
     comp_type="Auxiliary",
     comp_subtype="Normal",
-    depends_on={"time": 1, 
+    depends_on={"time": 1,
+                "initial_time": 1,
+                "time_step": 1,
+                "load_shedding": 1,
+                "curtailment": 1,
+                "load_shedding_delayed": 1,
                 "curtailment_delayed": 1},
 )
 def new_investments_grid_curt():
     """
     New investments required by control feedback, for curtailment.
     """
-        
-    if time() == 1995:
-        time_prev = 0
-    else:
-        time_prev = time()-0.03125
+    return upstream_cache(step_grid_controllers)["curtailment"]
 
-    return PID(0, 0, 0, time(), time_prev, 0, curtailment_delayed()) # Previously 1 (former res) or 0.01 (new res, no outbounds)
-    # BAU il faut mettre 0.35 je pense, à verif
-
-@component.add(
+@surr_component.add(
     name="Cumulated Grid Investments - Curtailment control",
     units="T$",
     comp_type="Stateful",
@@ -112,7 +149,69 @@ _integ_cumulated_new_investments_grid_curt = Integ(
 )
 
 
-@component.add(
+# RES capacities added by the load shedding investments, and their PyPSA-EUR capacity.
+RES_FEEDBACK = {"hydro": "ROR", "wind_onshore": "Wind (Onshore)", "wind_offshore": "Wind (Offshore)", "solar_PV": "Solar"}
+# Subscripted values of investments_shares_ls/curt & sm_new_capacity_res_elec, built at the first call of investments_layout(),
+# once _subscript_dict is defined whatever the order in which the files are loaded: at each time step, a shallow copy with the
+# new values is made (the returned arrays are not modified afterwards, e.g. when pysd stores them).
+investments_subscripts = None
+
+def investments_layout():
+    """
+    Templates of the subscripted values and columns of the tables in the order of the subscripts, built at the first call:
+        capacities, res_elec: templates over the Capacities & RES_elec subscripts,
+        shares_ls: columns of tech_shares_ls in the order of Capacities,
+        shares_curt_positions, shares_curt: Capacities with curtailment shares (none for the RES capacities) and their columns,
+        res_feedback_positions, res_feedback_shares, res_feedback_prices: RES_FEEDBACK in RES_elec, tech_shares_ls & prices.
+    """
+    global investments_subscripts
+    if investments_subscripts is None:
+        capacities = list(_subscript_dict["Capacities"])
+        res_elec = list(_subscript_dict["RES_elec"])
+        shares_curt_positions = np.array([i for i, capacity in enumerate(capacities) if capacity in SHARES_CURT], dtype=np.intp)
+        investments_subscripts = {
+            "capacities": xr.DataArray(np.nan, {"Capacities": capacities}, ["Capacities"]),
+            "res_elec": xr.DataArray(np.nan, {"RES_elec": res_elec}, ["RES_elec"]),
+            "shares_ls": table_tech_shares_ls.indices(capacities),
+            "shares_curt_positions": shares_curt_positions,
+            "shares_curt": table_tech_shares_curt.indices([capacities[i] for i in shares_curt_positions]),
+            "res_feedback_positions": np.array([res_elec.index(res) for res in RES_FEEDBACK], dtype=np.intp),
+            "res_feedback_shares": table_tech_shares_ls.indices(RES_FEEDBACK.values()),
+            "res_feedback_prices": table_prices_1995USD_W.indices(RES_FEEDBACK.values()),
+        }
+    return investments_subscripts
+
+def step_investments_shares_ls():
+    """
+    Value of investments_shares_ls() at the current time step. Called through upstream_cache, i.e. once per time step.
+    """
+    layout = investments_layout()
+    values = upstream_cache(exogenous_step)["shares_ls"][layout["shares_ls"]]
+    return layout["capacities"].copy(deep=False, data=values)
+
+def step_investments_shares_curt():
+    """
+    Value of investments_shares_curt() at the current time step. Called through upstream_cache, i.e. once per time step.
+    """
+    layout = investments_layout()
+    values = np.zeros(layout["capacities"].shape[0])
+    values[layout["shares_curt_positions"]] = upstream_cache(exogenous_step)["shares_curt"][layout["shares_curt"]]
+    return layout["capacities"].copy(deep=False, data=values)
+
+def step_new_capacity_res_elec():
+    """
+    Value of sm_new_capacity_res_elec() at the current time step. Called through upstream_cache, i.e. once per time step,
+    and read by the 4 integrators of the RES capacities added below.
+    """
+    layout = investments_layout()
+    values = np.zeros(layout["res_elec"].shape[0])
+    if float(time()) >= activation_year_feedback():
+        row = upstream_cache(exogenous_step)
+        values[layout["res_feedback_positions"]] = (float(new_investments_grid_ls()) * row["shares_ls"][layout["res_feedback_shares"]]
+                                                    / row["prices"][layout["res_feedback_prices"]])
+    return layout["res_elec"].copy(deep=False, data=values)
+
+@surr_component.add(
     name="Investment share of new capacities",
     units="Dmnl",
     subscripts=["Capacities"],
@@ -126,23 +225,9 @@ def investments_shares_ls():
     If 1000$ are invested, how would they be splitted into these capacities?
     Data derived from PyPSA-EUR model and time-dependent.
     """
-    value = xr.DataArray(
-           np.nan, {"Capacities": _subscript_dict["Capacities"]}, ["Capacities"]
-        )
-    values = df_tech_shares_ls.loc[round(time())]
-    value.loc[["Solar"]] = values["Solar"]
-    value.loc[["ROR"]] = values["ROR"]
-    value.loc[["Wind (Onshore)"]] = values["Wind (Onshore)"]
-    value.loc[["Wind (Offshore)"]] = values["Wind (Offshore)"]
-    value.loc[["AC Lines"]] = values["AC Lines"]
-    value.loc[["DC Lines"]] = values["DC Lines"]
-    value.loc[["Distrib Grid"]] = values["Distrib Grid"]
-    value.loc[["PHS"]] = values["PHS"]
-    value.loc[["Hydro"]] = values["Hydro"]
-    value.loc[["Battery"]] = values["Battery"]
-    return value
+    return upstream_cache(step_investments_shares_ls)
 
-@component.add(
+@surr_component.add(
     name="Investment share of new capacities",
     units="Dmnl",
     subscripts=["Capacities"],
@@ -156,66 +241,29 @@ def investments_shares_curt():
     If 1000$ are invested, how would they be splitted into these capacities?
     Data derived from PyPSA-EUR model and time-dependent.
     """
-    value = xr.DataArray(
-           np.nan, {"Capacities": _subscript_dict["Capacities"]}, ["Capacities"]
-        )
-    values = df_tech_shares_curt.loc[round(time())]
-    value.loc[["Solar"]] = 0
-    value.loc[["ROR"]] = 0
-    value.loc[["Wind (Onshore)"]] = 0
-    value.loc[["Wind (Offshore)"]] = 0
-    value.loc[["AC Lines"]] = values["AC Lines"]
-    value.loc[["DC Lines"]] = values["DC Lines"]
-    value.loc[["Distrib Grid"]] = values["Distrib Grid"]
-    value.loc[["PHS"]] = values["PHS"]
-    value.loc[["Hydro"]] = values["Hydro"]
-    value.loc[["Battery"]] = values["Battery"]
-    return value
+    return upstream_cache(step_investments_shares_curt)
 
 
-@component.add(
+@surr_component.add(
                 
     name="Additionnal RES installation from Surrogate model feedback control",
     units="TW",
     subscripts=["RES_elec"],
     comp_type="Auxiliary",
     comp_subtype="Normal",
-    depends_on={"cumulated_new_investments_grid_ls": 1, 
-                "investments_shares_ls": 1,
-                },        
+    depends_on={"time": 1,
+                "activation_year_feedback": 1,
+                "new_investments_grid_ls": 1,
+                },
 )
 def sm_new_capacity_res_elec():
     """
- 
+    RES capacities added by the load shedding investments from the activation year (hydro, wind onshore & offshore, solar PV),
+    considering ratios [$/TW] and investment shares.
     """
-    value = xr.DataArray(np.nan, {"RES_elec": _subscript_dict["RES_elec"]}, ["RES_elec"])
-
-    if float(time()) < activation_year_feedback():
-        value.loc[["hydro"]] = 0  
-        value.loc[["geot_elec"]] = 0
-        value.loc[["solid_bioE_elec"]] = 0
-        value.loc[["oceanic"]] = 0
-        value.loc[["wind_onshore"]] = 0
-        value.loc[["wind_offshore"]] = 0
-        value.loc[["solar_PV"]] = 0
-        value.loc[["CSP"]] = 0
-
-    else:
-        ratio_USD_W = df_prices_1995USD_W.loc[round(time())]
-        ratio_USD_W = ratio_USD_W.loc[["Solar","ROR","Wind (Onshore)","Wind (Offshore)"]]
-
-        value.loc[["hydro"]] = float(new_investments_grid_ls()) * float(investments_shares_ls().loc["ROR"]) / ratio_USD_W["ROR"]  
-        value.loc[["geot_elec"]] = 0
-        value.loc[["solid_bioE_elec"]] = 0
-        value.loc[["oceanic"]] = 0
-        value.loc[["wind_onshore"]] = float(new_investments_grid_ls()) * float(investments_shares_ls().loc["Wind (Onshore)"]) / ratio_USD_W["Wind (Onshore)"]
-        value.loc[["wind_offshore"]] = float(new_investments_grid_ls()) * float(investments_shares_ls().loc["Wind (Offshore)"]) / ratio_USD_W["Wind (Offshore)"]
-        value.loc[["solar_PV"]] = float(new_investments_grid_ls()) * float(investments_shares_ls().loc["Solar"]) / ratio_USD_W["Solar"]
-        value.loc[["CSP"]] = 0
-        
-    return value
+    return upstream_cache(step_new_capacity_res_elec)
 
-@component.add(
+@surr_component.add(
     name="cumulated_solar_PV_feedback",
     units="TW",
     comp_type="Stateful",
@@ -239,7 +287,7 @@ _integ_cumulated_solar_PV_feedback = Integ(
     "_integ_cumulated_solar_PV_feedback",
 )
 
-@component.add(
+@surr_component.add(
     name="cumulated_wind_offshore_feedback",
     units="TW",
     comp_type="Stateful",
@@ -263,7 +311,7 @@ _integ_cumulated_wind_offshore_feedback = Integ(
     "_integ_cumulated_wind_offshore_feedback",
 )
 
-@component.add(
+@surr_component.add(
     name="cumulated_wind_onshore_feedback",
     units="TW",
     comp_type="Stateful",
@@ -287,7 +335,7 @@ _integ_cumulated_wind_onshore_feedback = Integ(
     "_integ_cumulated_wind_onshore_feedback",
 )
 
-@component.add(
+@surr_component.add(
     name="cumulated_hydro_feedback",
     units="TW",
     comp_type="Stateful",
@@ -311,7 +359,7 @@ _integ_cumulated_hydro_feedback = Integ(
     "_integ_cumulated_hydro_feedback",
 )
 
-@component.add(                
+@surr_component.add(                
     name="Cumulated RES capacity feedback",
     units="TW",
     subscripts=["RES_elec"],
@@ -337,7 +385,7 @@ def cumulated_capacity_res_elec():
     return value
 
 
-@component.add(
+@surr_component.add(
     name="Additional Storage capacity installation from Surrogate model feedback control",
     units="TW",
     comp_type="Auxiliary",
@@ -356,12 +404,11 @@ def sm_new_capacity_storage():
         return 0
     
     else:
-        ratio_USD_W = df_prices_1995USD_W.loc[round(time())]
-        ratio_USD_W = ratio_USD_W.loc[["PHS","Hydro","Battery"]]
+        ratio_USD_W = upstream_cache(exogenous_step)["prices"]
         
-        return float(new_investments_grid_ls())*(float(investments_shares_ls().loc["PHS"])/ratio_USD_W["PHS"]+float(investments_shares_ls().loc["Hydro"])/ratio_USD_W["Hydro"]+float(investments_shares_ls().loc["Battery"])/ratio_USD_W["Battery"]) + float(new_investments_grid_curt())*(float(investments_shares_curt().loc["PHS"])/ratio_USD_W["PHS"]+float(investments_shares_curt().loc["Hydro"])/ratio_USD_W["Hydro"]+float(investments_shares_curt().loc["Battery"])/ratio_USD_W["Battery"])
+        return float(new_investments_grid_ls())*(float(investments_shares_ls().loc["PHS"])/ratio_USD_W[PRICES["PHS"]]+float(investments_shares_ls().loc["Hydro"])/ratio_USD_W[PRICES["Hydro"]]+float(investments_shares_ls().loc["Battery"])/ratio_USD_W[PRICES["Battery"]]) + float(new_investments_grid_curt())*(float(investments_shares_curt().loc["PHS"])/ratio_USD_W[PRICES["PHS"]]+float(investments_shares_curt().loc["Hydro"])/ratio_USD_W[PRICES["Hydro"]]+float(investments_shares_curt().loc["Battery"])/ratio_USD_W[PRICES["Battery"]])
 
-@component.add(
+@surr_component.add(
     name="cumulated_storage_feedback",
     units="TW",
     comp_type="Stateful",
@@ -386,7 +433,7 @@ _integ_cumulated_storage_feedback = Integ(
 )
 
 
-@component.add(
+@surr_component.add(
     name="Additional NTC Capacity from Surrogate model feedback control",
     units="TW",
     comp_type="Auxiliary",
@@ -403,15 +450,13 @@ def sm_new_capacity_ntc():
     """
     if float(time()) < activation_year_feedback():
         # return 0
-        ratio_USD_W = df_prices_1995USD_W.loc[round(time())]
-        ratio_USD_W = ratio_USD_W.loc[["AC Lines","DC Lines","Distrib Grid"]]
+        ratio_USD_W = upstream_cache(exogenous_step)["prices"]
     else:
-        ratio_USD_W = df_prices_1995USD_W.loc[round(time())]
-        ratio_USD_W = ratio_USD_W.loc[["AC Lines","DC Lines","Distrib Grid"]]
+        ratio_USD_W = upstream_cache(exogenous_step)["prices"]
 
-    return float(new_investments_grid_ls())*(float(investments_shares_ls().loc["AC Lines"])/ratio_USD_W["AC Lines"]+float(investments_shares_ls().loc["DC Lines"])/ratio_USD_W["DC Lines"]+float(investments_shares_ls().loc["Distrib Grid"])/ratio_USD_W["Distrib Grid"])  + float(new_investments_grid_curt())*(float(investments_shares_curt().loc["AC Lines"])/ratio_USD_W["AC Lines"]+float(investments_shares_curt().loc["DC Lines"])/ratio_USD_W["DC Lines"]+float(investments_shares_curt().loc["Distrib Grid"])/ratio_USD_W["Distrib Grid"])
+    return float(new_investments_grid_ls())*(float(investments_shares_ls().loc["AC Lines"])/ratio_USD_W[PRICES["AC Lines"]]+float(investments_shares_ls().loc["DC Lines"])/ratio_USD_W[PRICES["DC Lines"]]+float(investments_shares_ls().loc["Distrib Grid"])/ratio_USD_W[PRICES["Distrib Grid"]])  + float(new_investments_grid_curt())*(float(investments_shares_curt().loc["AC Lines"])/ratio_USD_W[PRICES["AC Lines"]]+float(investments_shares_curt().loc["DC Lines"])/ratio_USD_W[PRICES["DC Lines"]]+float(investments_shares_curt().loc["Distrib Grid"])/ratio_USD_W[PRICES["Distrib Grid"]])
 
-@component.add(
+@surr_component.add(
     name="cumulated_ntc_feedback",
     units="TW",
     comp_type="Stateful",
@@ -437,7 +482,7 @@ _integ_cumulated_ntc_feedback = Integ(
 
 
 # feedback-related investments
-@component.add(
+@surr_component.add(
     name="Total of the investements grid controlled by PID",
     units="T$",
     comp_type="Auxiliary",
@@ -449,7 +494,7 @@ def tot_investments_grid_feedback():
     return cumulated_new_investments_grid_curt() + cumulated_new_investments_grid_ls()
 
 # RES-related investments
-@component.add(
+@surr_component.add(
     name="Total of the investments in new RES capacity, by type.",
     units="T$",
     comp_type="Auxiliary",
@@ -463,27 +508,26 @@ def annualized_investments_res_by_type():
     value = xr.DataArray(np.nan, {"RES_elec": _subscript_dict["RES_elec"]}, ["RES_elec"])
 
             
-    value.loc[["geot_elec"]] = float(res_elec_capacity_under_construction_tw().loc["geot_elec"]) * float(invest_cost_res_elec().loc["geot_elec"])/30
-    value.loc[["solid_bioE_elec"]] = float(res_elec_capacity_under_construction_tw().loc["solid_bioE_elec"]) * float(invest_cost_res_elec().loc["solid_bioE_elec"])/30
-    value.loc[["oceanic"]] = float(res_elec_capacity_under_construction_tw().loc["oceanic"]) * float(invest_cost_res_elec().loc["oceanic"])/30
-    value.loc[["CSP"]] = float(res_elec_capacity_under_construction_tw().loc["CSP"]) * float(invest_cost_res_elec().loc["CSP"])/25
+    value.loc[["geot_elec"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["geot_elec"]) * float(upstream_cache(invest_cost_res_elec).loc["geot_elec"])/30
+    value.loc[["solid_bioE_elec"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["solid_bioE_elec"]) * float(upstream_cache(invest_cost_res_elec).loc["solid_bioE_elec"])/30
+    value.loc[["oceanic"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["oceanic"]) * float(upstream_cache(invest_cost_res_elec).loc["oceanic"])/30
+    value.loc[["CSP"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["CSP"]) * float(upstream_cache(invest_cost_res_elec).loc["CSP"])/25
 
     # MEDEAS Annualized prices
     if float(time()) < activation_year_feedback():
-        value.loc[["hydro"]] = float(res_elec_capacity_under_construction_tw().loc["hydro"]) * float(invest_cost_res_elec().loc["hydro"])/80
-        value.loc[["wind_onshore"]] = float(res_elec_capacity_under_construction_tw().loc["wind_onshore"]) * float(invest_cost_res_elec().loc["wind_onshore"])/20
-        value.loc[["wind_offshore"]] = float(res_elec_capacity_under_construction_tw().loc["wind_offshore"]) * float(invest_cost_res_elec().loc["wind_offshore"])/20
-        value.loc[["solar_PV"]] = float(res_elec_capacity_under_construction_tw().loc["solar_PV"]) * float(invest_cost_res_elec().loc["solar_PV"])/25
+        value.loc[["hydro"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["hydro"]) * float(upstream_cache(invest_cost_res_elec).loc["hydro"])/80
+        value.loc[["wind_onshore"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["wind_onshore"]) * float(upstream_cache(invest_cost_res_elec).loc["wind_onshore"])/20
+        value.loc[["wind_offshore"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["wind_offshore"]) * float(upstream_cache(invest_cost_res_elec).loc["wind_offshore"])/20
+        value.loc[["solar_PV"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["solar_PV"]) * float(upstream_cache(invest_cost_res_elec).loc["solar_PV"])/25
 
     # PyPSA-EUR Annualized prices
     else: 
-        ratio_USD_W = df_prices_1995USD_W.loc[round(time())]
-        ratio_USD_W = ratio_USD_W.loc[["Solar","ROR","Wind (Onshore)","Wind (Offshore)"]]
+        ratio_USD_W = upstream_cache(exogenous_step)["prices"]
 
-        value.loc[["hydro"]] = float(res_elec_capacity_under_construction_tw().loc["hydro"]) * ratio_USD_W["ROR"]
-        value.loc[["wind_onshore"]] = float(res_elec_capacity_under_construction_tw().loc["wind_onshore"]) * ratio_USD_W["Wind (Onshore)"]
-        value.loc[["wind_offshore"]] = float(res_elec_capacity_under_construction_tw().loc["wind_offshore"]) * ratio_USD_W["Wind (Offshore)"]
-        value.loc[["solar_PV"]] = float(res_elec_capacity_under_construction_tw().loc["solar_PV"]) * ratio_USD_W["Solar"]
+        value.loc[["hydro"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["hydro"]) * ratio_USD_W[PRICES["ROR"]]
+        value.loc[["wind_onshore"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["wind_onshore"]) * ratio_USD_W[PRICES["Wind (Onshore)"]]
+        value.loc[["wind_offshore"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["wind_offshore"]) * ratio_USD_W[PRICES["Wind (Offshore)"]]
+        value.loc[["solar_PV"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["solar_PV"]) * ratio_USD_W[PRICES["Solar"]]
 
     # To avoid negative investments while RES decreasing (FFF scenarios), set at 0:
     value = value.clip(min=0)
@@ -517,7 +561,7 @@ def annualized_investments_res_by_type():
 
 
 # RES-related investments
-@component.add(
+@surr_component.add(
     name="Total of the investments in new RES capacity, by type.",
     units="T$",
     comp_type="Auxiliary",
@@ -531,34 +575,33 @@ def investments_res_by_type():
     value = xr.DataArray(np.nan, {"RES_elec": _subscript_dict["RES_elec"]}, ["RES_elec"])
 
             
-    value.loc[["geot_elec"]] = float(res_elec_capacity_under_construction_tw().loc["geot_elec"]) * float(invest_cost_res_elec().loc["geot_elec"])
-    value.loc[["solid_bioE_elec"]] = float(res_elec_capacity_under_construction_tw().loc["solid_bioE_elec"]) * float(invest_cost_res_elec().loc["solid_bioE_elec"])
-    value.loc[["oceanic"]] = float(res_elec_capacity_under_construction_tw().loc["oceanic"]) * float(invest_cost_res_elec().loc["oceanic"])
-    value.loc[["CSP"]] = float(res_elec_capacity_under_construction_tw().loc["CSP"]) * float(invest_cost_res_elec().loc["CSP"])
+    value.loc[["geot_elec"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["geot_elec"]) * float(upstream_cache(invest_cost_res_elec).loc["geot_elec"])
+    value.loc[["solid_bioE_elec"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["solid_bioE_elec"]) * float(upstream_cache(invest_cost_res_elec).loc["solid_bioE_elec"])
+    value.loc[["oceanic"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["oceanic"]) * float(upstream_cache(invest_cost_res_elec).loc["oceanic"])
+    value.loc[["CSP"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["CSP"]) * float(upstream_cache(invest_cost_res_elec).loc["CSP"])
 
     # MEDEAS prices
     if float(time()) < activation_year_feedback():
-        value.loc[["hydro"]] = float(res_elec_capacity_under_construction_tw().loc["hydro"]) * float(invest_cost_res_elec().loc["hydro"])
-        value.loc[["wind_onshore"]] = float(res_elec_capacity_under_construction_tw().loc["wind_onshore"]) * float(invest_cost_res_elec().loc["wind_onshore"])
-        value.loc[["wind_offshore"]] = float(res_elec_capacity_under_construction_tw().loc["wind_offshore"]) * float(invest_cost_res_elec().loc["wind_offshore"])
-        value.loc[["solar_PV"]] = float(res_elec_capacity_under_construction_tw().loc["solar_PV"]) * float(invest_cost_res_elec().loc["solar_PV"])
+        value.loc[["hydro"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["hydro"]) * float(upstream_cache(invest_cost_res_elec).loc["hydro"])
+        value.loc[["wind_onshore"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["wind_onshore"]) * float(upstream_cache(invest_cost_res_elec).loc["wind_onshore"])
+        value.loc[["wind_offshore"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["wind_offshore"]) * float(upstream_cache(invest_cost_res_elec).loc["wind_offshore"])
+        value.loc[["solar_PV"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["solar_PV"]) * float(upstream_cache(invest_cost_res_elec).loc["solar_PV"])
 
     # PyPSA-EUR prices
     else: 
-        ratio_USD_W = df_prices_1995USD_W.loc[round(time())]
-        ratio_USD_W = ratio_USD_W.loc[["Solar","ROR","Wind (Onshore)","Wind (Offshore)"]]
+        ratio_USD_W = upstream_cache(exogenous_step)["prices"]
 
-        value.loc[["hydro"]] = float(res_elec_capacity_under_construction_tw().loc["hydro"]) * ratio_USD_W["ROR"] * 80
-        value.loc[["wind_onshore"]] = float(res_elec_capacity_under_construction_tw().loc["wind_onshore"]) * ratio_USD_W["Wind (Onshore)"] * 27
-        value.loc[["wind_offshore"]] = float(res_elec_capacity_under_construction_tw().loc["wind_offshore"]) * ratio_USD_W["Wind (Offshore)"] * 27
-        value.loc[["solar_PV"]] = float(res_elec_capacity_under_construction_tw().loc["solar_PV"]) * ratio_USD_W["Solar"] * 35
+        value.loc[["hydro"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["hydro"]) * ratio_USD_W[PRICES["ROR"]] * 80
+        value.loc[["wind_onshore"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["wind_onshore"]) * ratio_USD_W[PRICES["Wind (Onshore)"]] * 27
+        value.loc[["wind_offshore"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["wind_offshore"]) * ratio_USD_W[PRICES["Wind (Offshore)"]] * 27
+        value.loc[["solar_PV"]] = float(upstream_cache(res_elec_capacity_under_construction_tw).loc["solar_PV"]) * ratio_USD_W[PRICES["Solar"]] * 35
 
     # To avoid negative investments while RES decreasing (FFF scenarios), set at 0:
     value = value.clip(min=0)
 
     return value
 
-@component.add(
+@surr_component.add(
     name="Total of the investements in new RES capacity",
     units="T$",
     comp_type="Auxiliary",
@@ -569,7 +612,7 @@ def tot_investments_res():
     return sum(investments_res_by_type().rename({"RES_elec": "RES_elec!"}), dim=["RES_elec!"])
 
 
-@component.add(
+@surr_component.add(
     name="Total of the annualized investements in new RES capacity",
     units="T$",
     comp_type="Auxiliary",
@@ -581,7 +624,7 @@ def annualized_investments_res():
 
 
 # Storage-related investments
-@component.add(
+@surr_component.add(
     name="Total of the investements in new Storage capacity",
     units="T$",
     comp_type="Auxiliary",
@@ -593,18 +636,15 @@ def tot_investments_storage():
     if float(time()) < activation_year_feedback():
         return 0
     else:
-        ratio_USD_W = df_prices_1995USD_W.loc[round(time())] # Year,Solar,ROR,Wind (Onshore),Wind (Offshore),AC Lines,DC Lines,Distrib Grid,PHS,Hydro,Battery
-        ratio_USD_W = ratio_USD_W.loc[["PHS","Hydro","Battery"]]
-        ratio_USD_W["PHS"] = ratio_USD_W["PHS"]*80
-        ratio_USD_W["Hydro"] = ratio_USD_W["Hydro"]*80
-        ratio_USD_W["Battery"] = ratio_USD_W["Battery"]*15
+        ratio_USD_W = upstream_cache(exogenous_step)["prices"][STORAGE_PRICES] # PHS, Hydro, Battery
+        ratio_USD_W = ratio_USD_W * (80, 80, 15)
         tot_invest = (float(new_storage_installed_capacity())) * ratio_USD_W.mean()
         if tot_invest < 0:
             return 0
         else:
             return tot_invest
 
-@component.add(
+@surr_component.add(
     name="new_storage_installed_capacity",
     units="TW/year",
     comp_type="Auxiliary",
@@ -627,7 +667,7 @@ def new_storage_installed_capacity():
         / time_step()
     )
 
-@component.add(
+@surr_component.add(
     name="Installed_capacity_storage_elec_delayed",
     units="TW",
     comp_type="Stateful",
@@ -652,7 +692,7 @@ _delayfixed_installed_capacity_storage_elec_delayed = DelayFixed(
 
 
 # Grid-related investments
-@component.add(
+@surr_component.add(
     name="Total of the investements in new Grid (NTC) capacity",
     units="T$",
     comp_type="Auxiliary",
@@ -662,16 +702,13 @@ _delayfixed_installed_capacity_storage_elec_delayed = DelayFixed(
                 "exchange_rates_USD_EUR": 1},        
 )
 def tot_investments_ntc():
-    df = df_rNTC["Investments [1995-USD]"]/1e12
-    base_load_TUSD = df.loc[round(time())]
+    base_load_TUSD = upstream_cache(exogenous_step)["rNTC_investments"] # T$
 
     if float(time()) < activation_year_feedback():
-        ratio_USD_W = df_prices_1995USD_W.loc[round(time())]
-        ratio_USD_W = ratio_USD_W.loc[["AC Lines","DC Lines","Distrib Grid"]] * 40
+        ratio_USD_W = upstream_cache(exogenous_step)["prices"][GRID_PRICES] * 40 # AC Lines, DC Lines, Distrib Grid
         add_feedback_TUSD = float(sm_new_capacity_ntc()) * ratio_USD_W.mean()
     else:
-        ratio_USD_W = df_prices_1995USD_W.loc[round(time())]
-        ratio_USD_W = ratio_USD_W.loc[["AC Lines","DC Lines","Distrib Grid"]] * 40
+        ratio_USD_W = upstream_cache(exogenous_step)["prices"][GRID_PRICES] * 40 # AC Lines, DC Lines, Distrib Grid
         add_feedback_TUSD = float(sm_new_capacity_ntc()) * ratio_USD_W.mean()
 
     tot_investments = base_load_TUSD + add_feedback_TUSD
@@ -679,7 +716,7 @@ def tot_investments_ntc():
 
 
 # Total investments RES - Storage - Grid
-@component.add(
+@surr_component.add(
     name="Total of the investements (RES, Storage, NTC)",
     units="$",
     comp_type="Auxiliary",
@@ -693,7 +730,7 @@ def TOT_investments():
 
 
 # Total investments RES - Storage - Grid
-@component.add(
+@surr_component.add(
     name="Activation year for the society reaction mechanism",
     units="Year",
     comp_type="Constant",
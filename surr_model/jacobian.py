@@ -0,0 +1,75 @@
+"""
+Surrogate model Jacobian implementation within MEDEAS.
+
+This file defines the sensitivities of the MLP targets of targets.py (curtailment & load shedding) to the 6 features:
+d(target)/d(feature), for a single row of features or a batch of shape (..., 6), e.g. along a trajectory.
+The MLPs are ReLU networks with the MinMax scalers folded in their first and last layers (see inference.FusedMLP),
+so that the exact gradient is obtained by one backward pass through the layers, in physical units: Dmnl per unit of
+each feature (same processing as targets.py, i.e. %->Dmnl and 0 where the output is set at 0).
+The Random Forests are piecewise constant, their gradient is 0 almost everywhere and they are not supported.
+"""
+
+import numpy as np
+
+from .batch import TARGET_MODELS, get_registry
+from .evaluator import FEATURE_BOUNDS, FEATURE_NAMES, clip_features
+from .inference import FusedMLP
+
+
+def jacobian(features, targets=("curtailment", "load_shedding"), clip=False, registry=None, models=None):
+    """
+    Gradients of the targets with respect to the features (..., 6). A single row (6,) is also accepted.
+    With clip=True, the features are clipped to their bounds as in features.py, and the gradient is 0 for the clipped ones.
+    Returns a dict target -> (outputs (...) in Dmnl, gradients (..., 6) in Dmnl per feature unit).
+    """
+    features = np.asarray(features, dtype=np.float64)
+    if features.shape[-1] != len(FEATURE_NAMES):
+        raise ValueError(f"Last dimension of the features should be {len(FEATURE_NAMES)} ({', '.join(FEATURE_NAMES)}), got {features.shape[-1]}.")
+    X = features.reshape(-1, len(FEATURE_NAMES))
+    if clip:
+        lower, upper = np.array(FEATURE_BOUNDS, dtype=np.float64).T
+        within = (X >= lower) & (X <= upper)
+        X = clip_features(X)
+
+    registry = get_registry() if registry is None else registry
+    models = TARGET_MODELS if models is None else models
+    results = {}
+    for target in targets:
+        model = registry.get(models[target])
+        if not isinstance(model, FusedMLP):
+            raise ValueError(f"{target}: the Jacobian is only available for the MLP surrogates, not for {type(model).__name__}.")
+        output, grad = model.gradient(X)
+        # %->Dmnl, negative outputs set at 0 (constant, null gradient).
+        grad = np.where((output > 0)[:, None], grad / 100, 0)
+        if clip:
+            grad = np.where(within, grad, 0)
+        results[target] = (np.maximum(output / 100, 0).reshape(features.shape[:-1]), grad.reshape(features.shape))
+    return results
+
+
+if __name__ == "__main__":
+    # Check: analytic gradients against central finite differences, on random features within the bounds.
+    import time
+    from .batch import predict_batch
+    from .benchmark import random_features
+
+    X = random_features(2000, seed=1)
+    step = 1e-6
+    for target, (output, grad) in jacobian(X).items():
+        finite = np.empty_like(grad)
+        for i in range(len(FEATURE_NAMES)):
+            dX = np.zeros(len(FEATURE_NAMES))
+            dX[i] = step
+            finite[:, i] = (predict_batch(X + dX, (target,))[target] - predict_batch(X - dX, (target,))[target]) / (2*step)
+        # Finite differences are wrong where a ReLU switches within the step: compare the median and the bulk of the rows.
+        errors = np.max(np.abs(grad - finite), axis=1)
+        print(f"{target}: median abs error = {np.median(errors):.2e}, rows with error < 1e-6: {100*np.mean(errors < 1e-6):.1f}%, "
+              f"mean |gradient| = {np.abs(grad).mean(axis=0).round(4)}")
+        assert np.allclose(output, predict_batch(X, (target,))[target])
+
+    single = jacobian(X[0])["curtailment"][1]
+    assert single.shape == (6,) and np.allclose(single, jacobian(X)["curtailment"][1][0])
+    start = time.perf_counter()
+    for _ in range(200):
+        jacobian(X[0])
+    print(f"Single row Jacobian (both targets): {1e6*(time.perf_counter() - start)/200:.1f} us")
@@ -0,0 +1,103 @@
+"""
+Out of distribution index implementation within MEDEAS.
+
+This file defines the spatial index of the training features of the surrogate models (mlp/dataset.csv, GAMS_error filtered).
+Clipping the features to their box (see features.py) keeps them within the bounds of the training domain, but a point of
+the box can still be far from any training sample. The index returns, for each surrogate call, the distance from the
+features to their nearest training sample, in the box scaled to the unit cube, and an extrapolation score: this distance
+relative to the median nearest neighbour distance between training samples (~1 or below: within the data, >> 1: extrapolation).
+The scaled training features are saved as a flat artifact next to the models (see artifacts.py). At loading, they are
+indexed by a KD-tree (scipy.spatial.cKDTree) if scipy is available, otherwise the distances are computed by brute force.
+"""
+
+import numpy as np
+
+from .evaluator import FEATURE_BOUNDS
+
+
+class TrainingDomainIndex:
+    """
+    Nearest neighbour index of the training features, scaled to the unit cube with the features box (FEATURE_BOUNDS).
+    """
+
+    def __init__(self, points, lower, upper, reference_distance=None, use_tree=True):
+        self.points = np.asarray(points, dtype=np.float64)
+        self.lower = np.asarray(lower, dtype=np.float64)
+        self.upper = np.asarray(upper, dtype=np.float64)
+        self._scale = 1 / (self.upper - self.lower)
+        self._tree = None
+        if use_tree:
+            try:
+                from scipy.spatial import cKDTree
+                self._tree = cKDTree(self.points)
+            except ImportError:
+                pass
+        self._squared_norms = np.einsum("ij,ij->i", self.points, self.points)
+        if reference_distance is None:
+            # Median distance of the training samples to their nearest other sample.
+            reference_distance = float(np.median(self.distance(self.points, scaled=True, k=2)))
+        self.reference_distance = reference_distance
+
+    @classmethod
+    def from_features(cls, X, bounds=FEATURE_BOUNDS):
+        lower, upper = np.array(bounds, dtype=np.float64).T
+        return cls((np.asarray(X, dtype=np.float64) - lower) / (upper - lower), lower, upper)
+
+    def to_arrays(self):
+        """
+        Flat representation of the index: scalar parameters and named arrays (see artifacts.py).
+        """
+        return {"reference_distance": self.reference_distance}, {"points": self.points, "lower": self.lower, "upper": self.upper}
+
+    @classmethod
+    def from_arrays(cls, params, arrays):
+        return cls(arrays["points"], arrays["lower"], arrays["upper"], params["reference_distance"])
+
+    def distance(self, X, scaled=False, k=1):
+        """
+        Distance from each row of features X (n_samples, 6) to its k-th nearest training sample, in the unit cube.
+        A single row (6,) is also accepted.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if not scaled:
+            X = (X - self.lower) * self._scale
+        if self._tree is not None:
+            distances, _ = self._tree.query(X, k=k)
+            return distances if k == 1 else distances[:, -1]
+        # Brute force: |x - p|^2 = |x|^2 - 2 x.p + |p|^2
+        squared = np.einsum("ij,ij->i", X, X)[:, None] - 2 * X @ self.points.T + self._squared_norms
+        squared = np.partition(squared, k - 1, axis=1)[:, k - 1] if k > 1 else squared.min(axis=1)
+        return np.sqrt(np.maximum(squared, 0))
+
+    def score(self, X):
+        """
+        Extrapolation score of each row of features: nearest training sample distance / reference_distance.
+        """
+        return self.distance(X) / self.reference_distance
+
+    def score_one(self, x):
+        return float(self.score(x)[0])
+
+
+if __name__ == "__main__":
+    # Check: KD-tree and brute force distances, timing of a single call, and scores within / away from the training data.
+    import time
+    from .benchmark import random_features
+    from .inference import training_features
+
+    X = training_features()
+    index = TrainingDomainIndex.from_features(X)
+    brute = TrainingDomainIndex(index.points, index.lower, index.upper, index.reference_distance, use_tree=False)
+
+    Y = random_features(5000)
+    print(f"{X.shape[0]} training samples, reference distance = {index.reference_distance:.4f}, "
+          f"KD-tree / brute force max difference = {np.max(np.abs(index.distance(Y) - brute.distance(Y))):.1e}")
+    for name, evaluator in (("KD-tree", index), ("brute force", brute)):
+        start = time.perf_counter()
+        for x in Y[:2000]:
+            evaluator.score_one(x)
+        print(f"{name}: {1e6*(time.perf_counter() - start)/2000:.1f} us per call")
+    print(f"Score of the training samples (median): {np.median(index.score(X)):.2f}, "
+          f"of random points of the box (median / 95th percentile): {np.median(index.score(Y)):.2f} / {np.percentile(index.score(Y), 95):.2f}")
@@ -0,0 +1,139 @@
+"""
+PID gains tuner implementation within MEDEAS.
+
+This file tunes the gains (Kp, Ki, Kd) of the load shedding and curtailment controllers of investments.py on the closed loop
+replay of closed_loop.py, instead of one full MEDEAS run per set of gains. The candidate gains are taken on a grid or sampled
+at random (log-uniform), and split into chunks evaluated in a process pool, each chunk being stepped as one batch.
+Each candidate is scored on:
+    - the tracking of each target: mean absolute error between the target and its setpoint, from the activation year of the feedback,
+    - the cumulative grid investment of both controllers at the final time [T$],
+and the Pareto set of the candidates (not dominated on these objectives, all minimized) is returned.
+
+Usage: python -m surr_model.pid_tuner [--samples 512 | --grid 0 1e-3 1e-2 0.1] [--workers 4] [--time-step 0.125] [--output tuning.csv]
+"""
+
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from .closed_loop import LOOPS, default_loop
+
+# Gains of the candidates, in the order of their columns: Kp, Ki & Kd of each loop (ordered as closed_loop.LOOPS).
+GAIN_NAMES = tuple(f"{gain}_{loop}" for gain in ("Kp", "Ki", "Kd") for loop in LOOPS)
+OBJECTIVE_NAMES = tuple(f"tracking_{loop}" for loop in LOOPS) + ("investments",)
+# Log-uniform sampling bounds of the random candidates, the gains not listed are set at 0.
+DEFAULT_BOUNDS = {"Kp_load_shedding": (1e-4, 1), "Kp_curtailment": (1e-4, 1), "Ki_load_shedding": (1e-4, 1), "Ki_curtailment": (1e-4, 1)}
+
+
+def grid_candidates(values, gains=GAIN_NAMES):
+    """
+    All combinations of the values of the given gains (same values for all, or a dict gain -> values), other gains at 0.
+    Returns an array (n, 6) ordered as GAIN_NAMES.
+    """
+    values = values if isinstance(values, dict) else {gain: values for gain in gains}
+    combinations = np.array(list(itertools.product(*values.values())), dtype=np.float64)
+    candidates = np.zeros((combinations.shape[0], len(GAIN_NAMES)))
+    for i, gain in enumerate(values):
+        candidates[:, GAIN_NAMES.index(gain)] = combinations[:, i]
+    return candidates
+
+def random_candidates(n, bounds=DEFAULT_BOUNDS, seed=0):
+    """
+    n candidates with the gains sampled log-uniformly within bounds (dict gain -> (low, high)), other gains at 0.
+    """
+    rng = np.random.default_rng(seed)
+    candidates = np.zeros((n, len(GAIN_NAMES)))
+    for gain, (low, high) in bounds.items():
+        candidates[:, GAIN_NAMES.index(gain)] = np.exp(rng.uniform(np.log(low), np.log(high), n))
+    return candidates
+
+def score(results, setpoint=0.0, from_year=2020):
+    """
+    Objectives (n, 3) ordered as OBJECTIVE_NAMES, from the results of ClosedLoop.run().
+    """
+    period = results["time"] >= from_year
+    tracking = [np.mean(np.abs(results[loop][period] - setpoint), axis=0) for loop in LOOPS]
+    investments = results["cumulated_new_investments_grid"][-1].sum(axis=-1)
+    return np.column_stack(tracking + [investments])
+
+def pareto_front(objectives):
+    """
+    Mask of the non dominated rows of objectives (n, m), all minimized.
+    """
+    objectives = np.asarray(objectives, dtype=np.float64)
+    front = np.ones(objectives.shape[0], dtype=bool)
+    for i in range(objectives.shape[0]):
+        if front[i]:
+            dominated = np.all(objectives[i] <= objectives, axis=1) & np.any(objectives[i] < objectives, axis=1)
+            front &= ~dominated
+    return front
+
+
+# Closed loop of a worker process, built once by _init_worker().
+_loop = None
+_setpoint = 0.0
+
+def _init_worker(loop_options, setpoint):
+    global _loop, _setpoint
+    _loop = default_loop(**loop_options)
+    _setpoint = setpoint
+
+def _evaluate(candidates):
+    results = _loop.run(Kp=candidates[:, 0:2], Ki=candidates[:, 2:4], Kd=candidates[:, 4:6], setpoint=_setpoint,
+                        outputs=LOOPS + ("cumulated_new_investments_grid",))
+    return score(results, _setpoint, _loop.activation_year)
+
+def tune(candidates, workers=None, chunk_size=64, setpoint=0.0, **loop_options):
+    """
+    Score the candidate gains (n, 6) on the closed loop (loop_options passed to closed_loop.default_loop()), in a process pool
+    of workers processes (os.cpu_count() by default, 1: in this process). Returns a DataFrame of the gains, the objectives
+    and the Pareto set flag (column "pareto"), sorted by the load shedding tracking.
+    """
+    candidates = np.asarray(candidates, dtype=np.float64)
+    chunks = [candidates[start:start + chunk_size] for start in range(0, candidates.shape[0], chunk_size)]
+    workers = os.cpu_count() if workers is None else workers
+    if workers == 1:
+        _init_worker(loop_options, setpoint)
+        objectives = [_evaluate(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(loop_options, setpoint)) as executor:
+            objectives = list(executor.map(_evaluate, chunks))
+    objectives = np.concatenate(objectives)
+
+    table = pd.DataFrame(np.column_stack([candidates, objectives]), columns=GAIN_NAMES + OBJECTIVE_NAMES)
+    table["pareto"] = pareto_front(objectives)
+    return table.sort_values(OBJECTIVE_NAMES[0]).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune the PID gains of the feedback mechanism on the closed loop replay.")
+    parser.add_argument("--samples", type=int, default=256, help="Number of random candidates (log-uniform, see DEFAULT_BOUNDS).")
+    parser.add_argument("--grid", type=float, nargs="+", default=None, help="Grid of values of the Kp & Ki gains, instead of random candidates.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=64)
+    parser.add_argument("--setpoint", type=float, default=0.0)
+    parser.add_argument("--final-time", type=float, default=2050)
+    parser.add_argument("--time-step", type=float, default=1/32)
+    parser.add_argument("--activation-year", type=float, default=2020)
+    parser.add_argument("--output", default=None, help="Path of the csv file of all scored candidates.")
+    args = parser.parse_args()
+
+    if args.grid is not None:
+        candidates = grid_candidates(args.grid, gains=tuple(DEFAULT_BOUNDS))
+    else:
+        candidates = random_candidates(args.samples, seed=args.seed)
+    start = time.perf_counter()
+    table = tune(candidates, args.workers, args.chunk_size, args.setpoint, final_time=args.final_time, time_step=args.time_step,
+                 activation_year=args.activation_year)
+    elapsed = time.perf_counter() - start
+    print(f"{candidates.shape[0]} candidates scored in {elapsed:.1f} s, {table['pareto'].sum()} in the Pareto set:")
+    with pd.option_context("display.max_rows", 50, "display.max_columns", None, "display.width", 200, "display.precision", 4):
+        print(table[table["pareto"]].drop(columns="pareto"))
+    if args.output is not None:
+        table.to_csv(args.output, index=False)
+        print(f"All candidates saved at {args.output}.")
@@ -0,0 +1,127 @@
+"""
+Components profiler implementation within MEDEAS.
+
+This file defines an opt-in profiling layer for the components of the surrogate model modules (features.py, targets.py & investments.py).
+It is enabled by setting the environment variable SURR_MODEL_PROFILE to the path of the report, e.g.:
+    SURR_MODEL_PROFILE=surr_model_profile.txt python run.py
+Each component then records its number of calls, its cumulative time (including the components it calls), its self time
+(excluding them) and its number of calls per time step. The report, sorted by self time, is written at the end of the run.
+When the variable is not set, the components are left untouched (no overhead).
+"""
+
+import atexit
+import functools
+import os
+import time as _time
+
+
+class ComponentStats:
+    __slots__ = ("calls", "cumulative", "self_time")
+
+    def __init__(self):
+        self.calls = 0
+        self.cumulative = 0.0
+        self.self_time = 0.0
+
+
+class ComponentProfiler:
+    """
+    Records calls and timings of the wrapped components. Nested calls of wrapped components are subtracted from the self time of the caller.
+    The time steps are counted through clock(), the model time.
+    """
+
+    def __init__(self, report_path=None):
+        self.report_path = report_path
+        self.enabled = report_path is not None
+        self.stats = {}
+        self.clock = None
+        self.n_steps = 0
+        self._last_step = None
+        self._children_time = [] # Time spent in wrapped components called by the running ones (stack).
+        if self.enabled:
+            atexit.register(self.write_report)
+
+    def wrap_component(self, component, clock=None):
+        """
+        Proxy of pysd's component object: functions decorated with its add() are profiled.
+        Returns the component itself when profiling is disabled.
+        """
+        if not self.enabled:
+            return component
+        if clock is not None:
+            self.clock = clock
+        return _ProfiledComponent(component, self)
+
+    def wrap(self, function):
+        stats = self.stats.setdefault(function.__name__, ComponentStats())
+
+        @functools.wraps(function)
+        def profiled(*args, **kwargs):
+            self._observe_step()
+            self._children_time.append(0.0)
+            start = _time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = _time.perf_counter() - start
+                children_time = self._children_time.pop()
+                stats.calls += 1
+                stats.cumulative += elapsed
+                stats.self_time += elapsed - children_time
+                if self._children_time:
+                    self._children_time[-1] += elapsed
+
+        return profiled
+
+    def _observe_step(self):
+        if self.clock is None:
+            return
+        step = self.clock()
+        if step != self._last_step:
+            self._last_step = step
+            self.n_steps += 1
+
+    def reset(self):
+        self.stats.clear()
+        self.n_steps = 0
+        self._last_step = None
+
+    def report(self):
+        """
+        Table of the profiled components, sorted by decreasing self time.
+        """
+        lines = [f"Surrogate model components profile ({self.n_steps} time steps)",
+                 f"{'component':<45} {'calls':>9} {'calls/step':>10} {'cumul. [s]':>11} {'self [s]':>10} {'self/call [us]':>15}"]
+        for name, stats in sorted(self.stats.items(), key=lambda item: item[1].self_time, reverse=True):
+            if stats.calls == 0:
+                continue
+            calls_per_step = stats.calls / self.n_steps if self.n_steps else float("nan")
+            lines.append(f"{name:<45} {stats.calls:>9} {calls_per_step:>10.2f} {stats.cumulative:>11.4f} {stats.self_time:>10.4f} "
+                         f"{1e6*stats.self_time/stats.calls:>15.2f}")
+        return "\n".join(lines)
+
+    def write_report(self, path=None):
+        path = self.report_path if path is None else path
+        with open(path, "w") as f:
+            f.write(self.report() + "\n")
+        print(f"\nSurrogate model components profile saved at {path}.")
+
+
+class _ProfiledComponent:
+    """
+    Same interface as pysd's component object, add() additionally wraps the decorated function in the profiler.
+    """
+
+    def __init__(self, component, profiler):
+        self._component = component
+        self._profiler = profiler
+
+    def add(self, *args, **kwargs):
+        decorator = self._component.add(*args, **kwargs)
+        return lambda function: self._profiler.wrap(decorator(function))
+
+    def __getattr__(self, name):
+        return getattr(self._component, name)
+
+
+component_profiler = ComponentProfiler(os.environ.get("SURR_MODEL_PROFILE"))
@@ -0,0 +1,117 @@
+"""
+Offline surrogate model replay implementation within MEDEAS.
+
+This file re-evaluates the surrogate models of targets.py on the feature trajectories saved in MEDEAS results netCDF files
+(the same variables as read in plots.py: cap_ratio, share_flex, share_sto, share_wind, share_pv, rNTC, and the targets
+curtailment, load_shedding, RF_curtailment, RF_load_shedding), without running MEDEAS again.
+All time steps of all files are evaluated in one batched call (see batch.py), with any inference backend or surrogate
+registered in the model registry, and the new target trajectories are compared with the saved ones.
+Note that the features are replayed open loop: the feedback of the new targets on the features (PID, investments) is not simulated.
+
+Usage: python -m surr_model.replay results_1.nc [results_2.nc ...] [--tabulated] [--float32] [--output-dir replay]
+"""
+
+import argparse
+import os
+import numpy as np
+
+from .batch import TARGET_MODELS, predict_batch
+from .evaluator import FEATURE_NAMES
+
+
+def read_results(path):
+    """
+    Times (T,), features (T, 6) and saved targets {name: (T,)} of a MEDEAS results netCDF file.
+    """
+    import netCDF4 as nc
+
+    with nc.Dataset(path) as dataset:
+        features = np.column_stack([np.ma.filled(dataset.variables[name][:], np.nan).astype(np.float64).ravel() for name in FEATURE_NAMES])
+        targets = {name: np.ma.filled(dataset.variables[name][:], np.nan).astype(np.float64).ravel()
+                   for name in TARGET_MODELS if name in dataset.variables}
+        if "time" in dataset.variables:
+            times = np.asarray(dataset.variables["time"][:], dtype=np.float64)
+        else:
+            times = np.arange(1995, 1995 + features.shape[0], dtype=np.float64) # Yearly results, as in plots.py.
+    return times, features, targets
+
+def replay(trajectories, targets=("curtailment", "load_shedding"), **options):
+    """
+    Re-evaluate the targets on a list of feature trajectories (T_i, 6), in a single batch.
+    options are passed to batch.predict_batch() (clip, flat, tabulated, float32, registry, models...).
+    Returns one dict target -> (T_i,) in Dmnl per trajectory.
+    """
+    lengths = [trajectory.shape[0] for trajectory in trajectories]
+    outputs = predict_batch(np.concatenate(trajectories), targets=targets, **options)
+    splits = np.cumsum(lengths)[:-1]
+    return [dict(zip(outputs, values)) for values in zip(*(np.split(output, splits) for output in outputs.values()))]
+
+def differences(new, reference):
+    """
+    Max / mean absolute and root mean square differences between two trajectories (Dmnl), and the index of the max difference.
+    """
+    error = np.abs(new - reference)
+    valid = ~np.isnan(error)
+    if not valid.any():
+        return {"max": np.nan, "mean": np.nan, "rms": np.nan, "argmax": -1}
+    return {"max": float(error[valid].max()), "mean": float(error[valid].mean()), "rms": float(np.sqrt(np.mean(error[valid]**2))),
+            "argmax": int(np.nanargmax(error))}
+
+def replay_files(paths, targets=("curtailment", "load_shedding"), **options):
+    """
+    Replay the results files, returns per file: times, saved targets, new targets and their differences.
+    Targets missing from a file are replayed but not compared.
+    """
+    results = [read_results(path) for path in paths]
+    new_targets = replay([features for _, features, _ in results], targets, **options)
+    report = {}
+    for path, (times, _, saved), new in zip(paths, results, new_targets):
+        report[path] = {
+            "time": times,
+            "saved": saved,
+            "new": new,
+            "differences": {target: differences(new[target], saved[target]) for target in new if target in saved},
+        }
+    return report
+
+def print_report(report):
+    for path, result in report.items():
+        print(f"\n{path}")
+        print(f"    {'target':<18} {'max abs diff':>13} {'mean abs diff':>14} {'rms':>10} {'at':>9}")
+        for target, diff in result["differences"].items():
+            at = result["time"][diff["argmax"]] if diff["argmax"] >= 0 else np.nan
+            print(f"    {target:<18} {diff['max']:>13.3e} {diff['mean']:>14.3e} {diff['rms']:>10.3e} {at:>9.3f}")
+
+def save_report(report, output_directory):
+    """
+    One csv file per results file: time, then saved and new trajectory of each target.
+    """
+    import pandas as pd
+
+    os.makedirs(output_directory, exist_ok=True)
+    for path, result in report.items():
+        columns = {"time": result["time"]}
+        for target, new in result["new"].items():
+            if target in result["saved"]:
+                columns[f"{target}_saved"] = result["saved"][target]
+            columns[f"{target}_new"] = new
+        file = os.path.join(output_directory, os.path.splitext(os.path.basename(path))[0] + "_replay.csv")
+        pd.DataFrame(columns).to_csv(file, index=False)
+        print(f"Replayed trajectories saved at {file}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay of the surrogate models on the features of MEDEAS results files.")
+    parser.add_argument("paths", nargs="+", help="MEDEAS results netCDF files.")
+    parser.add_argument("--targets", nargs="*", default=["curtailment", "load_shedding"], choices=list(TARGET_MODELS))
+    parser.add_argument("--sklearn", action="store_true", help="Evaluate the original sklearn pipelines instead of the NumPy evaluator.")
+    parser.add_argument("--tabulated", action="store_true", help="Tabulated mode (see tabulated.py).")
+    parser.add_argument("--float32", action="store_true", help="Float32 inference, if the models pass the accuracy gate.")
+    parser.add_argument("--clip", action="store_true", help="Clip the features to their bounds before the evaluation.")
+    parser.add_argument("--output-dir", default=None, help="Directory of the csv files of the replayed trajectories.")
+    args = parser.parse_args()
+
+    report = replay_files(args.paths, args.targets, clip=args.clip, flat=not args.sklearn, tabulated=args.tabulated, float32=args.float32)
+    print_report(report)
+    if args.output_dir is not None:
+        save_report(report, args.output_dir)
@@ -0,0 +1,401 @@
+"""
+Standalone runtime implementation within MEDEAS.
+
+This file runs the surrogate model components (features.py, targets.py & investments.py) on their own, without the MEDEAS
+root implementation. It provides the pysd primitives they expect in their namespace (component, Integ, DelayFixed, time,
+time_step, initial_time, final_time, if_then_else, sum, xr, np, _subscript_dict) and a scripted stand-in of the upstream
+MEDEAS variables they read (installed_capacity_res_elec, total_fe_elec_demand_twh, cp_res_elec...), linearly interpolated
+between anchor years. As in MEDEAS (see modifications.txt), the RES and storage capacities include the capacities added
+by the feedback mechanism, and the RES capacity factors are reduced by the delayed curtailment, so that the whole
+surrogate/PID/investments loop is closed. The three files are executed in one namespace, in the same order as in MEDEAS,
+and the model is stepped with pysd's Euler scheme: all stateful objects are updated together at the end of a time step.
+
+The prices file read by investments.py (interp_prices_1995USD_W.csv, in pymedeas2_models/) is not part of this repository:
+unless its path is given, it is stood in by the PyPSA-EUR ratios of pypsa/capa and invest/interp_ratios_USD1995_MW.csv in $/W.
+
+Usage: python -m surr_model.standalone [--final-time 2050] [--time-step 0.03125] [--output run.csv]
+The components can be profiled as within MEDEAS: SURR_MODEL_PROFILE=profile.txt python -m surr_model.standalone
+"""
+
+import argparse
+import importlib
+import os
+import re
+import sys
+import tempfile
+import time as _time
+import types
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from .feature_engine import FOSSIL_COLUMNS, RES_COLUMNS
+
+surr_model_directory = os.path.dirname(os.path.abspath(__file__))
+# Files of the surrogate model components, executed in this order into the same namespace.
+MODEL_FILES = ("features.py", "targets.py", "investments.py")
+# Package of the surr_model directory within MEDEAS, as imported by the model files.
+MEDEAS_PACKAGE = "models.europe.modules_pymedeas_eu.surr_model"
+
+# Subscript ranges used by the model files and the scripted upstream variables.
+SUBSCRIPTS = {
+    "RES_elec": list(RES_COLUMNS),
+    "final_sources": list(FOSSIL_COLUMNS),
+    "Capacities": ["Solar", "ROR", "Wind (Onshore)", "Wind (Offshore)", "AC Lines", "DC Lines", "Distrib Grid", "PHS", "Hydro", "Battery"],
+}
+
+# Scripted upstream MEDEAS variables: name -> (subscript range or None, {year: value(s)}), linearly interpolated between the years
+# and constant outside. Rough EU trajectories, with features within their bounds over 1995-2050.
+DEFAULT_SCENARIO = {
+    # hydro, geot_elec, solid_bioE_elec, oceanic, wind_onshore, wind_offshore, solar_PV, CSP
+    "installed_capacity_res_elec": ("RES_elec", { # TW
+        1995: [0.120, 0.001, 0.005, 0.0002, 0.003, 0.0, 0.0, 0.0],
+        2020: [0.130, 0.001, 0.020, 0.0003, 0.170, 0.025, 0.140, 0.002],
+        2050: [0.140, 0.003, 0.030, 0.002, 0.350, 0.150, 0.400, 0.010]}),
+    "cpini_res_elec": ("RES_elec", { # Dmnl
+        1995: [0.35, 0.75, 0.60, 0.25, 0.22, 0.35, 0.12, 0.30]}),
+    "res_elec_capacity_under_construction_tw": ("RES_elec", { # TW/year
+        1995: [0.001, 0.0, 0.0005, 0.0, 0.001, 0.0, 0.0, 0.0],
+        2020: [0.001, 0.0, 0.001, 0.0, 0.015, 0.005, 0.020, 0.0005],
+        2050: [0.001, 0.0001, 0.0005, 0.0001, 0.010, 0.006, 0.015, 0.0005]}),
+    "invest_cost_res_elec": ("RES_elec", { # T$/TW
+        1995: [2.5, 4.0, 3.0, 6.0, 1.6, 4.0, 4.5, 6.0],
+        2020: [2.5, 4.0, 3.0, 5.0, 1.4, 3.5, 0.9, 4.0],
+        2050: [2.5, 3.5, 3.0, 3.5, 1.2, 2.5, 0.5, 2.5]}),
+    # liquids, gases, solids
+    "fe_elec_generation_from_fossil_fuels": ("final_sources", { # TWh
+        1995: [80, 250, 700],
+        2020: [20, 450, 400],
+        2050: [10, 250, 50]}),
+    "fe_nuclear_elec_generation_twh": (None, {1995: 850, 2020: 760, 2050: 400}), # TWh
+    "cp_nuclear": (None, {1995: 0.85}), # Dmnl
+    "total_fe_elec_demand_twh": (None, {1995: 2800, 2020: 3000, 2050: 3600}), # TWh
+    "total_capacity_elec_storage_tw": (None, {1995: 0.035, 2020: 0.050, 2050: 0.150}), # TW
+}
+DEFAULT_RETURN_COLUMNS = ("cap_ratio", "share_flex", "share_sto", "share_wind", "share_pv", "rNTC", "curtailment", "load_shedding",
+                          "RF_load_shedding", "new_investments_grid_ls", "new_investments_grid_curt", "cumulated_storage_feedback",
+                          "cumulated_add_rNTC_feedback", "TOT_investments")
+
+
+class Time:
+    """
+    Model clock, called as pysd's time(). The times are initial_time + n*time_step, so that the first one is exactly initial_time.
+    """
+
+    def __init__(self, initial_time=1995, final_time=2050, time_step=1/32):
+        self.initial_time = float(initial_time)
+        self.final_time = float(final_time)
+        self.time_step = float(time_step)
+        self.n_steps = int(round((self.final_time - self.initial_time) / self.time_step))
+        self.step = 0
+
+    def __call__(self):
+        return self.initial_time + self.step * self.time_step
+
+    def reset(self):
+        self.step = 0
+
+
+class Component:
+    """
+    Stand-in of pysd's component object: add() records the metadata of the decorated function.
+    """
+
+    def __init__(self):
+        self.namespace = {} # name -> py name
+        self.dependencies = {} # py name -> depends_on
+
+    def add(self, name, units=None, limits=(np.nan, np.nan), subscripts=None, comp_type=None, comp_subtype=None,
+            depends_on={}, other_deps={}):
+        def decorator(function):
+            function.name = name
+            function.units = units
+            function.limits = limits
+            function.subscripts = subscripts
+            function.type = comp_type
+            function.subtype = comp_subtype
+            self.namespace[name] = function.__name__
+            self.dependencies[function.__name__] = dict(depends_on, **{dep: 1 for dep in other_deps})
+            return function
+        return decorator
+
+
+class Integ:
+    """
+    Stand-in of pysd's Integ: state initialized with initial_value(), integrated with ddt() (Euler).
+    """
+
+    def __init__(self, ddt, initial_value, py_name):
+        self.ddt = ddt
+        self.init_func = initial_value
+        self.py_name = py_name
+        self.state = None
+
+    def __call__(self):
+        return self.state
+
+    def initialize(self):
+        self.state = self.init_func()
+
+    def next_state(self, time_step):
+        return self.state + self.ddt() * time_step
+
+    def update(self, state):
+        self.state = state
+
+
+class DelayFixed:
+    """
+    Stand-in of pysd's DelayFixed: input delayed by delay_time, as a pipeline of round(delay_time/time_step) values.
+    """
+
+    def __init__(self, delay_input, delay_time, initial_value, tstep, py_name):
+        self.input_func = delay_input
+        self.delay_time_func = delay_time
+        self.init_func = initial_value
+        self.tstep = tstep
+        self.py_name = py_name
+        self.pipe = None
+        self.pointer = 0
+
+    def __call__(self):
+        return self.pipe[self.pointer]
+
+    def initialize(self):
+        order = max(int(round(self.delay_time_func() / self.tstep())), 1)
+        self.pipe = [self.init_func()] * order
+        self.pointer = 0
+
+    def next_state(self, time_step):
+        return self.input_func()
+
+    def update(self, state):
+        self.pipe[self.pointer] = state
+        self.pointer = (self.pointer + 1) % len(self.pipe)
+
+
+def if_then_else(condition, val_if_true, val_if_false):
+    """
+    pysd's if_then_else() for scalar conditions: only the selected branch is evaluated.
+    """
+    return val_if_true() if condition else val_if_false()
+
+def sum(x, dim=None):
+    """
+    pysd's sum() over the given dimensions of a DataArray, float if the result is a scalar.
+    """
+    value = x.sum(dim=dim)
+    return float(value) if value.ndim == 0 else value
+
+
+class UpstreamScenario:
+    """
+    Scripted upstream MEDEAS variables (see DEFAULT_SCENARIO), trajectories can be replaced or added by name.
+    With feedback=True, the capacities added by the feedback mechanism and the curtailment are fed back as in MEDEAS:
+        installed_capacity_res_elec = scripted + cumulated_capacity_res_elec(),
+        total_capacity_elec_storage_tw = scripted + cumulated_storage_feedback(),
+        cp_res_elec = cpini_res_elec / (1 + curtailment_delayed()).
+    """
+
+    def __init__(self, trajectories=None, feedback=True):
+        self.trajectories = dict(DEFAULT_SCENARIO, **(trajectories or {}))
+        self.feedback = feedback
+        self.years = {}
+        self.values = {}
+        for name, (_, anchors) in self.trajectories.items():
+            years = sorted(anchors)
+            self.years[name] = np.array(years, dtype=np.float64)
+            self.values[name] = np.array([anchors[year] for year in years], dtype=np.float64)
+
+    def value(self, name, time):
+        """
+        Scripted value of an upstream variable at time, float or DataArray over its subscript range.
+        """
+        subscript = self.trajectories[name][0]
+        years, values = self.years[name], self.values[name]
+        if subscript is None:
+            return float(np.interp(time, years, values))
+        return xr.DataArray([np.interp(time, years, column) for column in values.T], {subscript: SUBSCRIPTS[subscript]}, [subscript])
+
+    def trajectory(self, name, times):
+        """
+        Scripted values of an upstream variable at an array of times, shape (T,) or (T, n) with the subscripts last.
+        """
+        years, values = self.years[name], self.values[name]
+        if values.ndim == 1:
+            return np.interp(times, years, values)
+        return np.column_stack([np.interp(times, years, column) for column in values.T])
+
+    def components(self, namespace, clock):
+        """
+        Upstream components of the model namespace. The feedback components are looked up in namespace at call time.
+        """
+        def installed_capacity_res_elec():
+            value = self.value("installed_capacity_res_elec", clock())
+            return value + namespace["cumulated_capacity_res_elec"]() if self.feedback else value
+
+        def cp_res_elec():
+            value = self.value("cpini_res_elec", clock())
+            return value / (1 + namespace["curtailment_delayed"]()) if self.feedback else value
+
+        def total_capacity_elec_storage_tw():
+            value = self.value("total_capacity_elec_storage_tw", clock())
+            return value + namespace["cumulated_storage_feedback"]() if self.feedback else value
+
+        def table_hist_capacity_phs(x):
+            return self.value("total_capacity_elec_storage_tw", x)
+
+        components = {name: (lambda name=name: self.value(name, clock())) for name in self.trajectories}
+        components.update(installed_capacity_res_elec=installed_capacity_res_elec, cp_res_elec=cp_res_elec,
+                          total_capacity_elec_storage_tw=total_capacity_elec_storage_tw, table_hist_capacity_phs=table_hist_capacity_phs)
+        return components
+
+
+def standin_prices():
+    """
+    Stand-in of interp_prices_1995USD_W.csv: the PyPSA-EUR ratios of interp_ratios_USD1995_MW.csv in $/W, indexed by Year.
+    """
+    prices = pd.read_csv(os.path.join(surr_model_directory, "pypsa", "capa and invest", "interp_ratios_USD1995_MW.csv"), index_col="Year")
+    return prices/1e6 # $/MW->$/W
+
+def alias_package():
+    """
+    Make the model files imports (from models.europe.modules_pymedeas_eu.surr_model.X import ...) resolve to this package,
+    with the same module objects (shared caches, profiler, registry).
+    """
+    package = __package__ or os.path.basename(surr_model_directory)
+    parts = MEDEAS_PACKAGE.split(".")
+    for i in range(1, len(parts)):
+        name = ".".join(parts[:i])
+        if name not in sys.modules:
+            module = types.ModuleType(name)
+            module.__path__ = []
+            sys.modules[name] = module
+    sys.modules[MEDEAS_PACKAGE] = importlib.import_module(package)
+    pattern = re.compile(rf"^from {re.escape(MEDEAS_PACKAGE)}\.(\w+) import", re.MULTILINE)
+    for file_name in MODEL_FILES:
+        with open(os.path.join(surr_model_directory, file_name)) as f:
+            for module_name in pattern.findall(f.read()):
+                sys.modules[f"{MEDEAS_PACKAGE}.{module_name}"] = importlib.import_module(f"{package}.{module_name}")
+
+
+class StandaloneModel:
+    """
+    The surrogate model components of features.py, targets.py & investments.py, executed in one namespace with the pysd primitives
+    and the upstream stand-in. The data files are read through a temporary MEDEAS-like directory layout:
+        <root>/interp_prices_1995USD_W.csv, <root>/models/europe/modules_pymedeas_eu/surr_model/pypsa -> surr_model/pypsa
+    """
+
+    def __init__(self, scenario=None, initial_time=1995, final_time=2050, time_step=1/32, prices_path=None):
+        self.scenario = UpstreamScenario() if scenario is None else scenario
+        self.time = Time(initial_time, final_time, time_step)
+        self.component = Component()
+        self._root = tempfile.TemporaryDirectory(prefix="surr_model_")
+        model_directory = self._build_layout(self._root.name, prices_path)
+
+        alias_package()
+        clock = self.time
+        self.namespace = {
+            "__name__": "surr_model_standalone",
+            "__file__": os.path.join(model_directory, "pymedeas_eu.py"),
+            "component": self.component, "Integ": Integ, "DelayFixed": DelayFixed, "if_then_else": if_then_else, "sum": sum,
+            "xr": xr, "np": np, "_subscript_dict": SUBSCRIPTS,
+            "time": clock, "time_step": lambda: clock.time_step,
+            "initial_time": lambda: clock.initial_time, "final_time": lambda: clock.final_time,
+        }
+        self.namespace.update(self.scenario.components(self.namespace, clock))
+        for file_name in MODEL_FILES:
+            path = os.path.join(surr_model_directory, file_name)
+            with open(path) as f:
+                exec(compile(f.read(), path, "exec"), self.namespace)
+        self.stateful = [value for value in self.namespace.values() if isinstance(value, (Integ, DelayFixed))]
+
+    @staticmethod
+    def _build_layout(root, prices_path):
+        model_directory = os.path.join(root, "models", "europe")
+        surr_directory = os.path.join(model_directory, "modules_pymedeas_eu", "surr_model")
+        os.makedirs(surr_directory)
+        pypsa_directory = os.path.join(surr_model_directory, "pypsa")
+        try:
+            os.symlink(pypsa_directory, os.path.join(surr_directory, "pypsa"), target_is_directory=True)
+        except OSError: # e.g. no symlink privilege on Windows
+            import shutil
+            shutil.copytree(pypsa_directory, os.path.join(surr_directory, "pypsa"), ignore=shutil.ignore_patterns("*.py", "__pycache__"))
+
+        if prices_path is None:
+            standin_prices().to_csv(os.path.join(root, "interp_prices_1995USD_W.csv"))
+        else:
+            import shutil
+            shutil.copy(prices_path, os.path.join(root, "interp_prices_1995USD_W.csv"))
+        return model_directory
+
+    def __getitem__(self, name):
+        return self.namespace[name]
+
+    def initialize(self):
+        """
+        As pysd, only the clock and the stateful objects are reset: the caches of the components reset themselves at the initial time.
+        """
+        self.time.reset()
+        for stateful in self.stateful:
+            stateful.initialize()
+
+    def step(self):
+        """
+        One Euler time step: the next states are all computed at the current time, then applied.
+        """
+        states = [stateful.next_state(self.time.time_step) for stateful in self.stateful]
+        self.time.step += 1
+        for stateful, state in zip(self.stateful, states):
+            stateful.update(state)
+
+    def run(self, return_columns=DEFAULT_RETURN_COLUMNS, saveper=1):
+        """
+        Run the model over [initial_time, final_time], returns a DataFrame of the return columns every saveper years.
+        Subscripted components are returned as one column per subscript, e.g. "installed_capacity_res_elec[hydro]".
+        """
+        self.initialize()
+        save_every = max(int(round(saveper / self.time.time_step)), 1)
+        times, rows = [], []
+        for step in range(self.time.n_steps + 1):
+            if step % save_every == 0:
+                row = {}
+                for name in return_columns:
+                    value = self.namespace[name]()
+                    if isinstance(value, xr.DataArray):
+                        dim = value.dims[0]
+                        row.update({f"{name}[{label}]": float(value.loc[label]) for label in value.coords[dim].values})
+                    else:
+                        row[name] = float(value)
+                times.append(self.time())
+                rows.append(row)
+            if step < self.time.n_steps:
+                self.step()
+        return pd.DataFrame(rows, index=pd.Index(times, name="time"))
+
+    def close(self):
+        self._root.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the surrogate model components with the scripted upstream stand-in.")
+    parser.add_argument("--initial-time", type=float, default=1995)
+    parser.add_argument("--final-time", type=float, default=2050)
+    parser.add_argument("--time-step", type=float, default=1/32)
+    parser.add_argument("--saveper", type=float, default=1, help="Period [year] of the returned values.")
+    parser.add_argument("--prices", default=None, help="Path of interp_prices_1995USD_W.csv, stood in by the PyPSA-EUR ratios otherwise.")
+    parser.add_argument("--no-feedback", action="store_true", help="Upstream variables not fed back by the feedback mechanism.")
+    parser.add_argument("--output", default=None, help="Path of the csv file of the results.")
+    args = parser.parse_args()
+
+    model = StandaloneModel(UpstreamScenario(feedback=not args.no_feedback), args.initial_time, args.final_time, args.time_step, args.prices)
+    start = _time.perf_counter()
+    results = model.run(saveper=args.saveper)
+    elapsed = _time.perf_counter() - start
+    model.close()
+    with pd.option_context("display.max_columns", None, "display.width", 200, "display.precision", 4):
+        print(results.iloc[::5])
+    print(f"\n{model.time.n_steps} time steps in {elapsed:.2f} s ({1e6*elapsed/model.time.n_steps:.0f} us per step).")
+    if args.output is not None:
+        results.to_csv(args.output)
+        print(f"Results saved at {args.output}.")
@@ -0,0 +1,53 @@
+"""
+Time step cache implementation within MEDEAS.
+
+This file defines a cache whose entries live for one time step of the simulation. It is used by the surrogate model
+components (features.py, targets.py & investments.py) to evaluate each upstream MEDEAS component, typically a subscripted
+array such as installed_capacity_res_elec(), only once per time step, however many times it is read.
+The cache is cleared automatically as soon as the model time changes, and at the initial time of each run, so that a new
+run starting at the last cached time of the previous one does not read its values.
+"""
+
+
+class StepCache:
+    """
+    Values of functions (without arguments) memoized for the current time step, given by clock().
+    If initial_clock() (initial time of the run) is given, the cache is cleared at the first call at the initial time.
+    Usage: cache(installed_capacity_res_elec) instead of installed_capacity_res_elec().
+    """
+
+    def __init__(self, clock, initial_clock=None):
+        self.clock = clock
+        self.initial_clock = initial_clock
+        self.time = None
+        self.values = {}
+        self.started = False
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, function):
+        time = self.clock()
+        if self.initial_clock is not None:
+            if time != self.initial_clock():
+                self.started = False
+            elif not self.started: # New run.
+                self.reset()
+                self.started = True
+        if time != self.time:
+            self.values.clear()
+            self.time = time
+        try:
+            value = self.values[function]
+            self.hits += 1
+        except KeyError:
+            value = self.values[function] = function()
+            self.misses += 1
+        return value
+
+    def reset(self):
+        """
+        Clear the cache (e.g. at the initialization of a new run starting at the same time).
+        """
+        self.values.clear()
+        self.time = None
+        self.started = False
@@ -0,0 +1,181 @@
+"""
+Tabulated surrogate model implementation within MEDEAS.
+
+This file defines the tabulated mode of the surrogate models. Since the 6 features are clipped to a fixed box
+(see evaluator.FEATURE_BOUNDS), the response of a model can be precomputed once on a grid over this box.
+A prediction is then a multilinear interpolation between the 2^6 = 64 corners of the grid cell containing the features,
+whose cost does not depend on the size of the model.
+The grid is rectilinear and non-uniform: starting from a coarse uniform grid, the intervals of the axes where the
+interpolation error is largest are split until the error is below TABLE_MAX_ERROR or the table reaches MAX_TABLE_POINTS.
+The tables are built offline (python -m surr_model.tabulated), never during a simulation run; a table whose error against its
+live model exceeds TABLE_MAX_ERROR is refused and the live model is kept (see artifacts.ModelRegistry.tabulated).
+"""
+
+import itertools
+import numpy as np
+
+from .evaluator import FEATURE_BOUNDS
+from .inference import training_features
+
+# Number of grid points per feature of the initial (uniform) grid.
+INITIAL_N_POINTS = (5, 5, 5, 5, 5, 5)
+# Maximum number of values of a table (float64: 16 MB).
+MAX_TABLE_POINTS = 2_000_000
+# Accuracy gate of the tabulated mode: maximum absolute error [%] of a table against its live model.
+TABLE_MAX_ERROR = 0.01
+
+
+class SurrogateTable:
+    """
+    Response of a surrogate model tabulated on a rectilinear grid, evaluated by multilinear interpolation.
+    Features outside the grid are clipped to it, as they are in features.py.
+    """
+
+    def __init__(self, axes, values, max_error=None, mean_error=None):
+        self.axes = [np.ascontiguousarray(axis, dtype=np.float64) for axis in axes]
+        self.values = np.asarray(values, dtype=np.float64)
+        if self.values.shape != tuple(len(axis) for axis in self.axes):
+            raise ValueError(f"Table of shape {self.values.shape} does not match the grid axes.")
+        self.max_error = max_error
+        self.mean_error = mean_error
+
+        self._flat_values = self.values.reshape(-1)
+        self._lower = np.array([axis[0] for axis in self.axes])
+        self._upper = np.array([axis[-1] for axis in self.axes])
+        strides = np.array(self.values.strides) // self.values.itemsize
+        # Corners of a grid cell: one bit per feature (0: lower point, 1: upper point).
+        self._corners = np.array(list(itertools.product((0, 1), repeat=len(self.axes))), dtype=bool)
+        self._corner_offsets = self._corners @ strides
+        self._strides = strides
+        # On uniform axes, the cell is found by a division instead of a search.
+        self._step = (self._upper - self._lower) / (np.array(self.values.shape) - 1)
+        self._uniform = all(np.allclose(np.diff(axis), step) for axis, step in zip(self.axes, self._step))
+        self._last_cell = np.array(self.values.shape) - 2
+
+    @staticmethod
+    def grid_axes(n_points=INITIAL_N_POINTS, bounds=FEATURE_BOUNDS):
+        return [np.linspace(lower, upper, n) for (lower, upper), n in zip(bounds, n_points)]
+
+    @classmethod
+    def build(cls, predict, axes=None, batch_size=65536):
+        """
+        Tabulate predict() (raw features -> target) on the grid defined by axes (uniform grid over the box by default).
+        """
+        axes = cls.grid_axes() if axes is None else axes
+        shape = tuple(len(axis) for axis in axes)
+        values = np.empty(int(np.prod(shape)))
+        for start in range(0, values.size, batch_size):
+            indices = np.unravel_index(np.arange(start, min(start + batch_size, values.size)), shape)
+            X = np.column_stack([axis[index] for axis, index in zip(axes, indices)])
+            values[start:start + X.shape[0]] = predict(X)
+        return cls(axes, values.reshape(shape))
+
+    @classmethod
+    def build_adaptive(cls, predict, max_error=TABLE_MAX_ERROR, max_points=MAX_TABLE_POINTS, X=None, axes=None):
+        """
+        Tabulate predict() on a grid refined where the interpolation is least accurate, starting from axes (uniform by default).
+        At each iteration, the error of the linear interpolation along each axis alone is computed at the points of X
+        (validation_features(seed=0) by default, not the points of error_report()). Its squares are summed per interval of
+        the axis, divided by the number of values a split of the interval adds, and the intervals scoring at least half the
+        top score are split in two. Stops when the max abs error of the table over X is below max_error, or before the
+        table exceeds max_points values.
+        """
+        X = validation_features(seed=0) if X is None else X
+        y = predict(X)
+        axes = cls.grid_axes() if axes is None else axes
+        while True:
+            table = cls.build(predict, axes)
+            if np.max(np.abs(table.predict(X) - y)) <= max_error:
+                return table
+            scores = []
+            for i, axis in enumerate(axes):
+                cell = np.clip(np.searchsorted(axis, X[:, i], side="right") - 1, 0, len(axis) - 2)
+                lower, upper = X.copy(), X.copy()
+                lower[:, i], upper[:, i] = axis[cell], axis[cell + 1]
+                t = (X[:, i] - axis[cell]) / (axis[cell + 1] - axis[cell])
+                errors = (1 - t)*predict(lower) + t*predict(upper) - y
+                scores.append(np.bincount(cell, weights=errors**2, minlength=len(axis) - 1) * len(axis) / table.values.size)
+            top = max(score.max() for score in scores)
+            refined = []
+            for axis, score in zip(axes, scores):
+                split = np.flatnonzero(score >= 0.5 * top)
+                refined.append(np.sort(np.concatenate([axis, (axis[split] + axis[split + 1]) / 2])))
+            if np.prod([len(axis) for axis in refined], dtype=np.float64) > max_points:
+                return table
+            axes = refined
+
+    def to_arrays(self):
+        """
+        Flat representation of the table: scalar parameters and named arrays (see artifacts.py).
+        """
+        arrays = {f"axis_{i}": axis for i, axis in enumerate(self.axes)}
+        arrays["values"] = self.values
+        return {"n_features": len(self.axes), "max_error": self.max_error, "mean_error": self.mean_error}, arrays
+
+    @classmethod
+    def from_arrays(cls, params, arrays):
+        return cls([arrays[f"axis_{i}"] for i in range(params["n_features"])], arrays["values"],
+                   params.get("max_error"), params.get("mean_error"))
+
+    def predict(self, X):
+        """
+        Interpolated target for a batch of features X (n_samples, n_features). A single row (n_features,) is also accepted.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        X = np.clip(X, self._lower, self._upper)
+
+        # Lower point of the cell and relative position t in [0, 1] within the cell, per feature.
+        if self._uniform:
+            position = (X - self._lower) / self._step
+            index = np.minimum(position.astype(np.intp), self._last_cell)
+            t = position - index
+        else:
+            index = np.empty(X.shape, dtype=np.intp)
+            t = np.empty(X.shape)
+            for i, axis in enumerate(self.axes):
+                index[:, i] = np.clip(np.searchsorted(axis, X[:, i], side="right") - 1, 0, len(axis) - 2)
+                t[:, i] = (X[:, i] - axis[index[:, i]]) / (axis[index[:, i] + 1] - axis[index[:, i]])
+
+        corners = index @ self._strides
+        corners = corners[:, None] + self._corner_offsets[None, :] # (n_samples, 64)
+        weights = np.where(self._corners[None, :, :], t[:, None, :], 1 - t[:, None, :]).prod(axis=2)
+        return (self._flat_values[corners] * weights).sum(axis=1)
+
+    def predict_one(self, x):
+        return float(self.predict(x)[0])
+
+
+def validation_features(n_random=20000, seed=42):
+    """
+    Features used to assess the table error: the training dataset (mlp/dataset.csv) and random points within the box.
+    """
+    rng = np.random.default_rng(seed)
+    lower, upper = np.array(FEATURE_BOUNDS, dtype=np.float64).T
+    return np.vstack([training_features(), lower + (upper - lower) * rng.random((n_random, len(FEATURE_BOUNDS)))])
+
+def error_report(table, predict, X=None):
+    """
+    Maximum and mean absolute errors of the table against the live model predict() over X (validation_features() by default).
+    The errors are also stored in the table.
+    """
+    X = validation_features() if X is None else X
+    errors = np.abs(table.predict(X) - predict(X))
+    table.max_error = float(errors.max())
+    table.mean_error = float(errors.mean())
+    return {"max_error": table.max_error, "mean_error": table.mean_error, "n_points": int(X.shape[0])}
+
+
+if __name__ == "__main__":
+    # Build step: tabulate the models of targets.py, save the tables (see artifacts.py) and report their errors.
+    from .artifacts import default_registry
+
+    registry = default_registry()
+    for name in registry.specs:
+        if not registry.available(name):
+            print(f"{name}: {registry.specs[name][1]} not found, skipped.")
+            continue
+        table = registry.build_table(name)
+        gate = "accepted" if table.max_error <= TABLE_MAX_ERROR else f"refused (> {TABLE_MAX_ERROR} %), the live model is kept"
+        print(f"{name}: grid {table.values.shape}, max abs error = {table.max_error:.4f} %, mean abs error = {table.mean_error:.4f} %: {gate}")
@@ -7,27 +7,94 @@ October 2024
 This file defines the targets computed by the surrogate model and associated features, such as delayed_features, used in the PID control.
 """
 
-import joblib
+import atexit
 import os
-import pandas as pd
-
-file_directory = os.path.dirname(os.path.abspath(__file__)) # contains ..\models\europe, don't know why it stops at europe.
-# Import the MLP models:
-curt_model = joblib.load(file_directory+r'\modules_pymedeas_eu\surr_model\mlp\mlp_curtailment.pkl')
-loadshed_model = joblib.load(file_directory+r'\modules_pymedeas_eu\surr_model\mlp\mlp_loadshedding_oversamp.pkl')
-
-# Import the RF models:
-RF_curt_model = joblib.load(file_directory+r'\modules_pymedeas_eu\surr_model\mlp\RF_curtailment.pkl')
-RF_loadshed_model = joblib.load(file_directory+r'\modules_pymedeas_eu\surr_model\mlp\RF_loadshedding.pkl')
+from models.europe.modules_pymedeas_eu.surr_model.artifacts import default_registry
+from models.europe.modules_pymedeas_eu.surr_model.evaluator import SurrogateEvaluator, PredictionCache, ChangeTolerance
+from models.europe.modules_pymedeas_eu.surr_model.jacobian import jacobian
+from models.europe.modules_pymedeas_eu.surr_model.profiler import component_profiler
+
+# The MLP & RF models and their scaling factors are loaded lazily, the first time a component uses them (see artifacts.py).
+# They are converted once from the pickles of surr_model/mlp into flat arrays, memory-mapped at loading.
+surrogate_models = default_registry()
+
+# Opt-in profiling of the components of this file, enabled by the environment variable SURR_MODEL_PROFILE (see profiler.py).
+surr_component = component_profiler.wrap_component(component, clock=lambda: time())
+
+# Fused NumPy forward pass of the MLP models, scalers folded into the first and last layers (see inference.py).
+# Set to False to go back to the sklearn pipeline: scaler_X.transform -> predict -> scaler_y.inverse_transform.
+use_fused_mlp = True
+# RF models flattened into contiguous node arrays, all trees traversed at once (see inference.py).
+# Set to False to go back to RandomForestRegressor.predict.
+use_flat_forest = True
+# Tabulated mode: the MLP & RF models are replaced by a multilinear interpolation of their response on a grid over the features box (see tabulated.py).
+# The tables are built offline (python -m surr_model.tabulated), a table missing or failing the accuracy gate is refused and the live model kept.
+use_tabulated = False
+# Float32 inference of the MLP & RF models, only enabled if it passes the accuracy gate against float64 over mlp/dataset.csv (see artifacts.py).
+# It applies to the NumPy evaluators only: the sklearn models (use_fused_mlp or use_flat_forest set to False) stay in float64.
+use_float32 = False
+
+# Opt-in summaries of the prediction cache & re-evaluation policy below, printed at the end of the run when the environment
+# variable SURR_MODEL_REPORTS is set (e.g. SURR_MODEL_REPORTS=1 python run.py).
+print_reports = bool(os.environ.get("SURR_MODEL_REPORTS"))
+
+# Cache of the surrogate outputs keyed on the features quantized to this resolution (see evaluator.py), None to disable it.
+# Consecutive time steps with features in the same quantization cell reuse the outputs (statistics in the opt-in summaries).
+prediction_cache_resolution = None
+prediction_cache_size = 4096
+if prediction_cache_resolution is not None:
+    surrogate_cache = PredictionCache(prediction_cache_resolution, prediction_cache_size)
+    if print_reports:
+        atexit.register(lambda: print(surrogate_cache.report()))
+else:
+    surrogate_cache = None
+
+# Event-driven re-evaluation (see evaluator.ChangeTolerance): the models are only re-evaluated when a feature moved by more than
+# reevaluation_atol + reevaluation_rtol*|feature| since the last evaluation, or after reevaluation_max_steps skipped time steps.
+# None for both tolerances to evaluate the models at every time step (evaluated/skipped counts in the opt-in summaries).
+reevaluation_atol = None
+reevaluation_rtol = None
+reevaluation_max_steps = 32
+if reevaluation_atol is not None or reevaluation_rtol is not None:
+    surrogate_policy = ChangeTolerance(reevaluation_atol or 0, reevaluation_rtol or 0, reevaluation_max_steps)
+    if print_reports:
+        atexit.register(lambda: print(surrogate_policy.report()))
+else:
+    surrogate_policy = None
+
+# All surrogate models are evaluated together, once per time step, on the same feature vector.
+# Only the models whose artifact or pickle exists are registered (e.g. rf_curtailment.pkl is not shipped).
+surrogate_evaluator = SurrogateEvaluator(surrogate_cache, surrogate_policy)
+
+def register_surrogate_models():
+    for target, model, flat in (("curtailment", "mlp_curtailment", use_fused_mlp), ("load_shedding", "mlp_loadshedding", use_fused_mlp),
+                                ("RF_curtailment", "rf_curtailment", use_flat_forest), ("RF_load_shedding", "rf_loadshedding", use_flat_forest)):
+        if surrogate_models.available(model):
+            surrogate_evaluator.register(target, surrogate_models.predictor(model, flat=flat, tabulated=use_tabulated, float32=use_float32))
+
+register_surrogate_models()
+
+
+def surrogate_features():
+    """
+    The 6 features of the surrogate models, in the order of training (see evaluator.FEATURE_NAMES).
+    """
+    return [cap_ratio(), share_flex(), share_sto(), share_wind(), share_pv(), rNTC()]
 
-# Importation of scaling factors: 
-scaler_X_curt = joblib.load(r'C:\Users\noedi\OneDrive - Universite de Liege\Ordi - Bureau\Ordi - ULG\TFE\master-thesis_DIFFELS\pymedeas2_models\models\europe\modules_pymedeas_eu\surr_model\mlp\mlp_scaler_X_curt.pkl')
-scaler_y_curt = joblib.load(r'C:\Users\noedi\OneDrive - Universite de Liege\Ordi - Bureau\Ordi - ULG\TFE\master-thesis_DIFFELS\pymedeas2_models\models\europe\modules_pymedeas_eu\surr_model\mlp\mlp_scaler_y_curt.pkl')
+def surrogate_output(name):
+    """
+    Output (Dmnl) of a surrogate model for the current time step.
+    The features are gathered and the models evaluated only at the first call of a time step (and of a run, at the initial time).
+    """
+    return surrogate_evaluator.output(name, float(time()), surrogate_features, float(initial_time()))
 
-scaler_X_ls = joblib.load(r'C:\Users\noedi\OneDrive - Universite de Liege\Ordi - Bureau\Ordi - ULG\TFE\master-thesis_DIFFELS\pymedeas2_models\models\europe\modules_pymedeas_eu\surr_model\mlp\mlp_scaler_X_ls.pkl')
-scaler_y_ls = joblib.load(r'C:\Users\noedi\OneDrive - Universite de Liege\Ordi - Bureau\Ordi - ULG\TFE\master-thesis_DIFFELS\pymedeas2_models\models\europe\modules_pymedeas_eu\surr_model\mlp\mlp_scaler_y_ls.pkl')
+def surrogate_sensitivities(targets=("curtailment", "load_shedding")):
+    """
+    Gradients d(target)/d(feature) of the MLP targets at the features of the current time step, in Dmnl per feature unit (see jacobian.py).
+    """
+    return {target: grad for target, (_, grad) in jacobian(surrogate_features(), targets, registry=surrogate_models).items()}
 
-@component.add(
+@surr_component.add(
     name="Curtailment",
     units="Dmnl",
     comp_type="Constant",
@@ -45,24 +112,9 @@ def curtailment():
     The curtailment target represents, for a given time step, the ratio between total energy curtailed from VRES and the maximum VRES generation from all units.
     """
 
-    features = [[cap_ratio(), share_flex(), share_sto(), share_wind(), share_pv(), rNTC()]]
+    return surrogate_output("curtailment")
 
-    # features_df = pd.DataFrame(
-    # features,
-    # columns=['CapacityRatio', 'ShareFlex', 'ShareStorage', 'ShareWind', 'SharePV', 'rNTC'])
-
-    features_scaled = scaler_X_curt.transform(features)
-    output_scaled = curt_model.predict(features_scaled)[0]
-    output = scaler_y_curt.inverse_transform(output_scaled.reshape(-1, 1)).flatten()/100 # %->Dmnl [-]
-    # print(output)
-
-    if output < 0:
-        #print(f"\nNegative curtailment({output}), set at 0.")
-        return 0
-    else:
-        return float(output)
-
-@component.add(
+@surr_component.add(
     name="Curtailment delayed",
     units="Dmnl",
     comp_type="Stateful",
@@ -90,7 +142,7 @@ _delayfixed_curtailment = DelayFixed(
     "_delayfixed_curtailment",
 )
 
-@component.add(
+@surr_component.add(
     name="Energy Curtailed",
     units="TWh",
     comp_type="Auxiliary",
@@ -105,8 +157,8 @@ def energy_curtailed_twh():
     The energy curtailed is the curtailment expressed in TWh instead of being dimensionless.
     """
     
-    cap_installed_pv = float(installed_capacity_res_elec().loc['solar_PV']*cp_res_elec().loc['solar_PV']) # TW
-    cap_installed_wind = float(installed_capacity_res_elec().loc['wind_onshore']*cp_res_elec().loc['wind_onshore']) + float(installed_capacity_res_elec().loc['wind_offshore']*cp_res_elec().loc['wind_offshore']) # TW
+    cap_installed_pv = float(upstream_cache(installed_capacity_res_elec).loc['solar_PV']*upstream_cache(cp_res_elec).loc['solar_PV']) # TW
+    cap_installed_wind = float(upstream_cache(installed_capacity_res_elec).loc['wind_onshore']*upstream_cache(cp_res_elec).loc['wind_onshore']) + float(upstream_cache(installed_capacity_res_elec).loc['wind_offshore']*upstream_cache(cp_res_elec).loc['wind_offshore']) # TW
 
     # cap_installed_geoth = installed_capacity_res_elec().loc['geot_elec'] * cp_res_elec().loc['geot_elec']# TW
     # cap_installed_biomass = installed_capacity_res_elec().loc['solid_bioE_elec'] * cp_res_elec().loc['solid_bioE_elec']# TW
@@ -120,7 +172,7 @@ def energy_curtailed_twh():
     return curtailment() * 8760 * cap_installed_vres
 
     
-@component.add(
+@surr_component.add(
     name="Load Shedding",
     units="Dmnl",
     comp_type="Normal",  
@@ -138,19 +190,10 @@ def load_shedding():
     The load shedding target represents, for a given time step, the ratio between the load that can not be fulfilled (Typically when production is smaller than demand.) and the total demand.
     """
 
-    features = [[cap_ratio(), share_flex(), share_sto(), share_wind(), share_pv(), rNTC()]]
-    features_scaled = scaler_X_ls.transform(features)
-    output_scaled = loadshed_model.predict(features_scaled)[0]
-    output = scaler_y_ls.inverse_transform(output_scaled.reshape(-1, 1)).flatten()/100 # %->Dmnl [-]
-
-    if output < 0:
-        #print("\nNegative load shedding, set at 0.")
-        return 0
-    else:
-        return float(output)
+    return surrogate_output("load_shedding")
 
 
-@component.add(
+@surr_component.add(
     name="Load Shedding delayed",
     units="Dmnl",
     comp_type="Stateful",
@@ -178,7 +221,7 @@ _delayfixed_load_shedding = DelayFixed(
     "_delayfixed_load_shedding",
 )
    
-@component.add(
+@surr_component.add(
     name="Load Shed (not fulfilled)",
     units="TWh",
     comp_type="Auxiliary",
@@ -196,7 +239,7 @@ def load_shed_twh():
 
 
 
-@component.add(
+@surr_component.add(
     name="RF - Curtailment",
     units="Dmnl",
     comp_type="Constant",
@@ -211,18 +254,9 @@ def load_shed_twh():
 )
 def RF_curtailment():
 
-    features = [[cap_ratio(), share_flex(), share_sto(), share_wind(), share_pv(), rNTC()]]
-    features_scaled = scaler_X_curt.transform(features)
-    output_scaled = RF_curt_model.predict(features_scaled)[0]
-    output = scaler_y_curt.inverse_transform(output_scaled.reshape(-1, 1)).flatten()/100 # %->Dmnl [-]
-
-    if output < 0:
-        #print(f"\nNegative curtailment({output}), set at 0.")
-        return 0
-    else:
-        return float(output)
+    return surrogate_output("RF_curtailment")
     
-@component.add(
+@surr_component.add(
     name="RF - Load Shedding",
     units="Dmnl",
     comp_type="Normal",  
@@ -236,13 +270,28 @@ def RF_curtailment():
         },
 )
 def RF_load_shedding():
-    features = [[cap_ratio(), share_flex(), share_sto(), share_wind(), share_pv(), rNTC()]]
-    features_scaled = scaler_X_ls.transform(features)
-    output_scaled = RF_loadshed_model.predict(features_scaled)[0]
-    output = scaler_y_ls.inverse_transform(output_scaled.reshape(-1, 1)).flatten()/100 # %->Dmnl [-]
-
-    if output < 0:
-        #print("\nNegative load shedding, set at 0.")
-        return 0
-    else:
-        return float(output)
\ No newline at end of file
+
+    return surrogate_output("RF_load_shedding")
+
+
+@surr_component.add(
+    name="Extrapolation score",
+    units="Dmnl",
+    comp_type="Auxiliary",
+    comp_subtype="Normal",
+    depends_on={
+        "cap_ratio": 1,
+        "share_flex": 1,
+        "share_sto":1,
+        "share_wind": 1,
+        "share_pv": 1,
+        "rNTC": 1,
+        },
+)
+def extrapolation_score():
+    """
+    Distance of the features to the nearest sample of the training dataset (mlp/dataset.csv), relative to the typical distance
+    between training samples (see ood_index.py). Around 1 or below within the training data, larger when the surrogate models extrapolate.
+    """
+
+    return surrogate_models.training_index().score_one(surrogate_features())
@@ -0,0 +1,78 @@
+"""
+Yearly data tables implementation within MEDEAS.
+
+This file defines the tables of yearly data read at each time step by the surrogate model components (PyPSA-EUR rNTC,
+investment shares, prices...). Instead of a pandas lookup per time step (df.loc[round(time())]), the csv files are loaded
+once into contiguous NumPy arrays whose rows are addressed by the integer offset of the year from the first year of the
+table (1995), and whose columns are addressed through a dict of named column indices.
+"""
+
+import numpy as np
+import pandas as pd
+
+FIRST_YEAR = 1995
+
+
+class YearTable:
+    """
+    Yearly data: values[year - first_year, index[column]].
+    As with df.loc[round(time())], the row of a time step is the one of the rounded year.
+    """
+
+    def __init__(self, columns, values, first_year=FIRST_YEAR):
+        self.columns = tuple(columns)
+        self.values = np.ascontiguousarray(values, dtype=np.float64)
+        self.first_year = int(first_year)
+        self.index = {name: i for i, name in enumerate(self.columns)} # Named column indices.
+        if self.values.shape != (self.values.shape[0], len(self.columns)):
+            raise ValueError(f"Table of shape {self.values.shape} does not match its {len(self.columns)} columns.")
+
+    @classmethod
+    def from_csv(cls, path, index_col="Year"):
+        """
+        Load a csv file with one row per year (consecutive years, no gap).
+        """
+        df = pd.read_csv(path, index_col=index_col)
+        years = df.index.to_numpy()
+        if not np.array_equal(years, np.arange(years[0], years[0] + len(years))):
+            raise ValueError(f"{path}: the years should be consecutive.")
+        return cls(df.columns, df.to_numpy(dtype=np.float64), years[0])
+
+    def offset(self, time):
+        offset = round(time) - self.first_year
+        if not 0 <= offset < self.values.shape[0]:
+            raise KeyError(f"Year {round(time)} out of the table ({self.first_year}-{self.first_year + self.values.shape[0] - 1}).")
+        return offset
+
+    def row(self, time):
+        """
+        Row of the year round(time), array ordered as columns (read-only view).
+        """
+        return self.values[self.offset(time)]
+
+    def get(self, time, column):
+        return float(self.values[self.offset(time), self.index[column]])
+
+    def indices(self, columns):
+        """
+        Array of the indices of the given columns, e.g. row(time)[table.indices(["AC Lines", "DC Lines"])].
+        """
+        return np.array([self.index[column] for column in columns], dtype=np.intp)
+
+
+if __name__ == "__main__":
+    # Check: same values as the pandas lookups df.loc[round(time())] over the simulation time steps.
+    import os
+
+    pypsa_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pypsa")
+    paths = [os.path.join(pypsa_directory, "rNTC", "interp_rNTC.csv"),
+             os.path.join(pypsa_directory, "rNTC", "ratio_rNTC_TW.csv"),
+             os.path.join(pypsa_directory, "capa and invest", "interp_tech_shares_ls.csv"),
+             os.path.join(pypsa_directory, "capa and invest", "interp_tech_shares_curt.csv")]
+    times = np.arange(1995, 2050, 1/32)
+    for path in paths:
+        df = pd.read_csv(path, index_col="Year")
+        table = YearTable.from_csv(path)
+        max_error = max(np.max(np.abs(table.row(t) - df.loc[round(t)].to_numpy())) for t in times)
+        print(f"{os.path.basename(path)}: {table.values.shape}, years {table.first_year}-{table.first_year + table.values.shape[0] - 1}, "
+              f"max abs difference = {max_error:.1e}")
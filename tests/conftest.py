@@ -0,0 +1,8 @@
+"""
+Tests of the surr_model package, run from the repository root: python -m pytest
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
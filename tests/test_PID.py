@@ -0,0 +1,53 @@
+"""
+Bank of PID controllers of the feedback mechanism (see PID.py).
+"""
+
+import numpy as np
+import pytest
+
+from surr_model.PID import MEASUREMENT_DELAY, PIDBank, delayed_measurement
+
+
+def test_first_step_after_reset_is_proportional_only():
+    bank = PIDBank(("load_shedding", "curtailment"), Kp=(2, 1), Ki=(10, 10), Kd=(5, 5))
+    np.testing.assert_allclose(bank.step(1995.0, (0.1, 0.2)), (0.2, 0.2))
+    np.testing.assert_allclose(bank.integral, 0)
+
+def test_steps_integrate_and_differentiate_the_error():
+    bank = PIDBank(1, Kp=1, Ki=2, Kd=3)
+    bank.step(1995.0, 0.1)
+    u = bank.step(1995.25, 0.3)
+    assert u == pytest.approx(0.3 + 2*0.3*0.25 + 3*(0.3 - 0.1)/0.25)
+    # Repeated call at the same time: same output and state.
+    assert bank.step(1995.25, 0.5) == u
+    assert bank.integral[0] == pytest.approx(2*0.3*0.25)
+
+def test_reset_starts_a_new_run():
+    bank = PIDBank(("load_shedding", "curtailment"), Kp=1, Ki=1, Kd=1)
+    bank.step(1995.0, (0.1, 0.1))
+    bank.step(1996.0, (0.2, 0.2))
+    bank.reset("curtailment")
+    u = bank.step(1997.0, (0.3, 0.3))
+    # load_shedding goes on from its state, curtailment restarts with a first step.
+    assert u[0] == pytest.approx(0.3 + (0.2 + 0.3) + (0.3 - 0.2))
+    assert u[1] == pytest.approx(0.3)
+    assert bank.integral[1] == 0
+
+def test_output_is_not_negative():
+    bank = PIDBank(1, Kp=1, Kd=10, setpoint=0)
+    bank.step(1995.0, 0.5)
+    assert bank.step(1995.25, 0.0) == 0
+
+def test_filtered_derivative_of_a_ramp():
+    # Error growing by 0.1 per year: the filtered derivative tends to Kd*0.1 whatever the step, the raw one (Tf=0) equals it.
+    for time_step in (1/32, 1/4, 1):
+        bank = PIDBank(("raw", "filtered"), Kd=1, Tf=(0, 1))
+        times = 1995 + time_step*np.arange(int(20/time_step) + 1)
+        for time in times:
+            u = bank.step(time, 0.1*(time - 1995))
+        np.testing.assert_allclose(u, (0.1, 0.1), rtol=1e-6)
+
+def test_delayed_measurement():
+    assert delayed_measurement(0.3, 0.1, MEASUREMENT_DELAY) == pytest.approx(0.1)
+    assert delayed_measurement(0.3, 0.1, 1) == pytest.approx(MEASUREMENT_DELAY*0.1 + (1 - MEASUREMENT_DELAY)*0.3)
+    assert delayed_measurement(0.3, 0.1, 1, initial=True) == pytest.approx(0.1)
@@ -0,0 +1,56 @@
+"""
+Registry of the surrogate models (see artifacts.py): flat artifacts, accuracy gates and predictors.
+"""
+
+import numpy as np
+import pytest
+
+from surr_model.artifacts import ModelRegistry, SURROGATE_MODELS
+from surr_model.inference import mlp_directory, sklearn_predict
+
+pytestmark = pytest.mark.filterwarnings("ignore::UserWarning") # Models pickled with another sklearn version, features without names.
+
+
+@pytest.fixture
+def registry(tmp_path):
+    """
+    Registry of the models of targets.py, with its flat artifacts converted from the pickles into a temporary directory.
+    """
+    registry = ModelRegistry(mlp_directory, str(tmp_path))
+    for name, spec in SURROGATE_MODELS.items():
+        registry.add(name, *spec)
+    return registry
+
+def features(n=256, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform((0.4, 0.25, 0, 0, 0, 0), (1.3, 0.9, 3, 0.55, 0.35, 0.75), (n, 6))
+
+
+def test_flat_artifact_matches_sklearn(registry, tmp_path):
+    X = features()
+    evaluator = registry.get("mlp_curtailment")
+    assert (tmp_path / "mlp_curtailment" / "meta.json").exists()
+    np.testing.assert_allclose(evaluator.predict(X), sklearn_predict(*registry.sklearn("mlp_curtailment"), X), rtol=0, atol=1e-10)
+    assert registry.get("mlp_curtailment") is evaluator # Loaded once.
+
+@pytest.mark.parametrize("name", ["mlp_curtailment", "mlp_loadshedding"])
+def test_float32_gate(registry, name):
+    reduced = registry.reduced_precision(name)
+    assert reduced.dtype == np.float32
+    assert registry.gate_errors[name] <= 1e-3
+    np.testing.assert_allclose(reduced.predict(features()), registry.get(name).predict(features()), rtol=0, atol=1e-3)
+
+def test_float32_refused_above_max_error(registry):
+    assert registry.reduced_precision("mlp_curtailment", max_error=0) is registry.get("mlp_curtailment")
+
+def test_sklearn_predictor_stays_float64(registry):
+    X = features()
+    predict = registry.predictor("mlp_curtailment", flat=False, float32=True)
+    np.testing.assert_array_equal(predict(X), sklearn_predict(*registry.sklearn("mlp_curtailment"), X))
+    assert registry.gate_errors == {} # The float32 copy was never built.
+
+def test_build_all_skips_missing_models(registry, tmp_path):
+    assert not registry.available("rf_curtailment") # rf_curtailment.pkl is not shipped.
+    registry.build_all()
+    for name in SURROGATE_MODELS:
+        assert (tmp_path / name / "meta.json").exists() == registry.available(name)
@@ -0,0 +1,72 @@
+"""
+Per time step evaluation of the surrogate models (see evaluator.py).
+"""
+
+import numpy as np
+import pytest
+
+from surr_model.evaluator import SurrogateEvaluator
+
+
+class CountingModel:
+    """
+    Stand-in of a surrogate model: sum of the features [%], counting its calls.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, X):
+        self.calls += 1
+        return np.asarray(X).sum(axis=1)
+
+class Features:
+    def __init__(self, values):
+        self.values = values
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.values
+
+
+def test_models_evaluated_once_per_time_step():
+    curtailment, load_shedding = CountingModel(), CountingModel()
+    evaluator = SurrogateEvaluator()
+    evaluator.register("curtailment", curtailment)
+    evaluator.register("load_shedding", load_shedding)
+    features = Features([1, 1, 1, 1, 1, 1])
+    for time in (1995, 1995.25):
+        assert evaluator.output("curtailment", time, features, 1995) == pytest.approx(0.06)
+        assert evaluator.output("load_shedding", time, features, 1995) == pytest.approx(0.06)
+        assert evaluator.output("curtailment", time, features, 1995) == pytest.approx(0.06)
+    assert features.calls == 2
+    assert curtailment.calls == load_shedding.calls == 2
+
+def test_reset_at_initial_time():
+    evaluator = SurrogateEvaluator()
+    evaluator.register("curtailment", CountingModel())
+    first = Features([1, 1, 1, 1, 1, 1])
+    for time in (1995, 1995.25, 1995.5):
+        evaluator.output("curtailment", time, first, 1995)
+    # New run, e.g. ending at the initial time of the next one, or starting at the last time of the previous one.
+    second = Features([2, 2, 2, 2, 2, 2])
+    assert evaluator.output("curtailment", 1995.5, second, 1995.5) == pytest.approx(0.12)
+    assert evaluator.output("curtailment", 1995.5, second, 1995.5) == pytest.approx(0.12)
+    assert second.calls == 1
+
+def test_model_failing_to_load_is_not_activated():
+    def missing(X):
+        raise FileNotFoundError("rf_curtailment.pkl")
+
+    evaluator = SurrogateEvaluator()
+    evaluator.register("curtailment", CountingModel())
+    evaluator.register("RF_curtailment", missing)
+    features = Features([1, 1, 1, 1, 1, 1])
+    evaluator.output("curtailment", 1995, features, 1995)
+    with pytest.raises(FileNotFoundError):
+        evaluator.output("RF_curtailment", 1995, features, 1995)
+    assert evaluator.output("curtailment", 1995.25, features, 1995) == pytest.approx(0.06)
+    assert evaluator.active == ["curtailment"]
+    with pytest.raises(KeyError):
+        evaluator.output("unknown", 1995.25, features, 1995)
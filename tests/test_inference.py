@@ -0,0 +1,47 @@
+"""
+NumPy evaluators of the surrogate models (see inference.py) against the shipped sklearn models, over the training dataset.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from surr_model.inference import FusedMLP, FlatForest, sklearn_predict, mlp_directory
+
+pytestmark = pytest.mark.filterwarnings("ignore::UserWarning") # Models pickled with another sklearn version, features without names.
+
+MLP_MODELS = [("mlp_curtailment.pkl", "curt"), ("mlp_loadshedding_oversamp.pkl", "ls"), ("mlp_loadshedding.pkl", "ls")]
+RF_MODELS = [("rf_curtailment.pkl", "curt"), ("rf_loadshedding.pkl", "ls")]
+
+
+def load_pickles(model_file, suffix):
+    joblib = pytest.importorskip("joblib")
+    if not os.path.exists(os.path.join(mlp_directory, model_file)):
+        pytest.skip(f"{model_file} is not shipped")
+    return tuple(joblib.load(os.path.join(mlp_directory, file))
+                 for file in (model_file, f"mlp_scaler_X_{suffix}.pkl", f"mlp_scaler_y_{suffix}.pkl"))
+
+@pytest.fixture(scope="module")
+def dataset_features():
+    df = pd.read_csv(os.path.join(mlp_directory, "dataset.csv"))
+    df = df[df["GAMS_error"] != 2]
+    return df[["CapacityRatio", "ShareFlex", "ShareStorage", "ShareWind", "SharePV", "rNTC"]].values
+
+
+@pytest.mark.parametrize("model_file, suffix", MLP_MODELS)
+def test_fused_mlp_matches_sklearn(model_file, suffix, dataset_features):
+    model, scaler_X, scaler_y = load_pickles(model_file, suffix)
+    fused = FusedMLP.from_sklearn(model, scaler_X, scaler_y)
+    expected = sklearn_predict(model, scaler_X, scaler_y, dataset_features)
+    np.testing.assert_allclose(fused.predict(dataset_features), expected, rtol=0, atol=1e-10)
+    assert fused.predict_one(dataset_features[0]) == pytest.approx(expected[0], abs=1e-10)
+
+@pytest.mark.parametrize("model_file, suffix", RF_MODELS)
+def test_flat_forest_matches_sklearn(model_file, suffix, dataset_features):
+    model, scaler_X, scaler_y = load_pickles(model_file, suffix)
+    forest = FlatForest.from_sklearn(model, scaler_X, scaler_y)
+    assert forest.n_trees == len(model.estimators_)
+    expected = sklearn_predict(model, scaler_X, scaler_y, dataset_features)
+    np.testing.assert_allclose(forest.predict(dataset_features), expected, rtol=0, atol=1e-10)
+    assert forest.predict_one(dataset_features[0]) == pytest.approx(expected[0], abs=1e-10)
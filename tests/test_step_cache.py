@@ -0,0 +1,57 @@
+"""
+Time step cache of the upstream MEDEAS components (see step_cache.py).
+"""
+
+from surr_model.step_cache import StepCache
+
+
+class Clock:
+    def __init__(self, time, initial_time):
+        self.time = time
+        self.initial_time = initial_time
+
+
+class Upstream:
+    """
+    Stand-in of an upstream component, returning the number of its calls.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.calls
+
+
+def test_values_live_for_one_time_step():
+    clock = Clock(1995, 1995)
+    cache = StepCache(lambda: clock.time, lambda: clock.initial_time)
+    upstream = Upstream()
+    assert cache(upstream) == cache(upstream) == 1
+    clock.time = 1995.25
+    assert cache(upstream) == cache(upstream) == 2
+    assert (cache.hits, cache.misses) == (2, 2)
+
+def test_cleared_at_initial_time_of_a_new_run():
+    clock = Clock(1995, 1995)
+    cache = StepCache(lambda: clock.time, lambda: clock.initial_time)
+    upstream = Upstream()
+    for time in (1995, 1995.25, 1995.5):
+        clock.time = time
+        cache(upstream)
+    # Next run starting at the last cached time of the previous one.
+    clock.initial_time = 1995.5
+    assert cache(upstream) == 4
+    assert cache(upstream) == 4
+    # Later steps of the same run: cached per time step.
+    clock.time = 1995.75
+    assert cache(upstream) == 5
+
+def test_without_initial_clock():
+    clock = Clock(1995, 1995)
+    cache = StepCache(lambda: clock.time)
+    upstream = Upstream()
+    cache(upstream)
+    cache.reset()
+    assert cache(upstream) == 2
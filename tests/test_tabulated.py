@@ -0,0 +1,63 @@
+"""
+Tabulated mode of the surrogate models (see tabulated.py) and its accuracy gate (see artifacts.ModelRegistry.tabulated).
+"""
+
+import numpy as np
+import pytest
+
+from surr_model.artifacts import ModelRegistry, SURROGATE_MODELS
+from surr_model.evaluator import FEATURE_BOUNDS
+from surr_model.inference import mlp_directory
+from surr_model.tabulated import SurrogateTable
+
+pytestmark = pytest.mark.filterwarnings("ignore::UserWarning") # Models pickled with another sklearn version, features without names.
+
+
+def features(n=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    lower, upper = np.array(FEATURE_BOUNDS, dtype=np.float64).T
+    return lower + (upper - lower) * rng.random((n, len(FEATURE_BOUNDS)))
+
+def multilinear(X):
+    return 1 + 2*X[:, 0] - X[:, 2] + 3*X[:, 1]*X[:, 5] + X[:, 3]*X[:, 4]*X[:, 0]
+
+
+def test_multilinear_response_is_exact_on_non_uniform_axes():
+    axes = SurrogateTable.grid_axes((3, 4, 3, 2, 2, 5))
+    axes[2] = np.array([0, 0.2, 3])
+    table = SurrogateTable.build(multilinear, axes)
+    X = features()
+    np.testing.assert_allclose(table.predict(X), multilinear(X), rtol=0, atol=1e-12)
+    # Features outside the box are clipped to it.
+    assert table.predict_one(np.array([2, 0.5, 1, 0.2, 0.1, 0.3])) == pytest.approx(multilinear(np.array([[1.3, 0.5, 1, 0.2, 0.1, 0.3]]))[0])
+
+def test_adaptive_grid_refines_where_the_error_is():
+    predict = lambda X: 100 * X[:, 0]**2
+    table = SurrogateTable.build_adaptive(predict, max_error=0.05)
+    X = features()
+    assert np.max(np.abs(table.predict(X) - predict(X))) <= 0.05
+    assert len(table.axes[0]) > 5 and all(len(axis) == 5 for axis in table.axes[1:])
+
+
+def registry(directory):
+    registry = ModelRegistry(mlp_directory, str(directory))
+    for name, spec in SURROGATE_MODELS.items():
+        registry.add(name, *spec)
+    return registry
+
+def test_tabulated_gate(tmp_path):
+    # No table: never built during a run, the live model is kept.
+    models = registry(tmp_path)
+    assert models.tabulated("mlp_loadshedding") is models.get("mlp_loadshedding")
+    assert models.table("mlp_loadshedding") is None
+
+    table = models.build_table("mlp_loadshedding", max_points=20000)
+    assert table.values.size <= 20000 and table.max_error > 0
+    # Table less accurate than the gate: refused.
+    models = registry(tmp_path)
+    assert models.tabulated("mlp_loadshedding", max_error=table.max_error / 2) is models.get("mlp_loadshedding")
+    models = registry(tmp_path)
+    tabulated = models.tabulated("mlp_loadshedding", max_error=table.max_error)
+    assert tabulated is models.table("mlp_loadshedding")
+    X = features()
+    np.testing.assert_allclose(tabulated.predict(X), models.get("mlp_loadshedding").predict(X), rtol=0, atol=table.max_error)